@@ -0,0 +1,159 @@
+# bench_app_list.py
+"""
+Đo thời gian dựng lại và bộ nhớ của danh sách phần mềm (AppListModel + AppItemDelegate)
+với danh sách từ 50 đến 10.000 phần mềm, và thời gian lọc theo từ khóa (AppListFilter).
+
+Chạy: python benchmarks/bench_app_list.py [--sizes 50,500,2000,10000] [--repeat 3]
+Trả về mã lỗi 1 nếu chi phí trên mỗi phần mềm tăng quá MAX_GROWTH lần khi danh sách lớn lên,
+nếu số QWidget của danh sách thay đổi theo số phần mềm, hoặc nếu một lần lọc vượt quá một khung hình.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# tekdt_ais tạo thư mục dữ liệu cạnh sys.argv[0], nên chuyển sang thư mục tạm trước khi import
+_data_dir = tempfile.mkdtemp(prefix="tekdt_ais_bench_")
+sys.argv[0] = str(Path(_data_dir) / "bench_app_list.py")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt6.QtWidgets import QApplication, QListView, QWidget
+
+import tekdt_ais
+
+MAX_GROWTH = 3.0 # Chi phí mỗi phần mềm ở cỡ lớn nhất không được vượt quá 3 lần cỡ tham chiếu
+FRAME_BUDGET_MS = 1000 / 60
+# Chuỗi gõ phím mô phỏng người dùng: gõ dần, gõ không dấu, xóa
+SEARCH_KEYSTROKES = ["tr", "tri", "trinh", "trinh d", "trinh duyet", "trinh duyet 1", "", "ung", "ung dung 0999", "van phong", ""]
+CATEGORIES = ["Trình duyệt", "Văn phòng", "Đa phương tiện", "Tiện ích", "Bảo mật", "Lập trình"]
+
+def make_catalog(size):
+    return {
+        f"App{i:05d}": {
+            "display_name": f"Ứng dụng {i:05d}",
+            "version": f"{i % 7}.{i % 13}.{i % 101}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "description": f"Phần mềm thử nghiệm số {i}",
+            "download_url": f"https://example.com/files/app{i:05d}.exe",
+        }
+        for i in range(size)
+    }
+
+def build_rows(catalog):
+    """Dựng các hàng giống populate_lists: tiêu đề danh mục rồi các phần mềm sắp theo tên."""
+    rows = []
+    for category in sorted({info["category"] for info in catalog.values()}):
+        rows.append(tekdt_ais.AppRow(category=category))
+        for key, info in sorted(catalog.items(), key=lambda item: item[1]["display_name"]):
+            if info["category"] != category:
+                continue
+            row = tekdt_ais.AppRow(key, info, category)
+            row.icon_path = tekdt_ais.resolve_icon_path(key, info)
+            row.version_text = f"Phiên bản: {info['version']}"
+            row.button = "download"
+            rows.append(row)
+    return rows
+
+def rebuild(view, catalog, app):
+    rows = build_rows(catalog)
+    view.model().set_rows(rows)
+    view.doItemsLayout()
+    view.viewport().grab() # Vẽ các hàng đang hiện trên màn hình
+    app.processEvents()
+
+def measure_filter(filter_view, catalog, app):
+    """
+    Thời gian lọc lâu nhất (giây) trên chuỗi gõ phím, gồm cả khung hình đầu tiên view vẽ lại.
+    Dùng view cấu hình như trong ứng dụng (layout theo lô) vì đó là thứ người dùng thực sự chờ.
+    """
+    list_filter = tekdt_ais.AppListFilter(filter_view.model())
+    filter_view.model().set_rows(build_rows(catalog))
+    list_filter.index.build(catalog)
+    app.processEvents()
+    slowest = 0.0
+    for query in SEARCH_KEYSTROKES:
+        start = time.perf_counter()
+        list_filter.apply(query)
+        app.processEvents()
+        slowest = max(slowest, time.perf_counter() - start)
+    return slowest
+
+def measure(view, filter_view, app, size, repeat):
+    catalog = make_catalog(size)
+    rebuild(view, catalog, app) # Chạy nóng: nạp icon mặc định vào QPixmapCache
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rebuild(view, catalog, app)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    rebuild(view, catalog, app)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "size": size,
+        "seconds": min(timings),
+        "bytes": current,
+        "widgets": len(view.findChildren(QWidget)),
+        "filter_seconds": measure_filter(filter_view, catalog, app),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="50,500,2000,10000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    app = QApplication(sys.argv)
+    view = QListView()
+    view.setModel(tekdt_ais.AppListModel(view))
+    view.setItemDelegate(tekdt_ais.AppItemDelegate(view))
+    # Layout một lượt để đo toàn bộ chi phí dựng lại (ứng dụng dùng Batched nên còn nhẹ hơn)
+    view.setLayoutMode(QListView.LayoutMode.SinglePass)
+    view.resize(600, 800)
+    view.show()
+    filter_view = tekdt_ais.TekDT_AIS.create_app_list_view()
+    filter_view.resize(600, 800)
+    filter_view.show()
+
+    results = [measure(view, filter_view, app, size, args.repeat) for size in sizes]
+
+    print(f"{'Số phần mềm':>12} {'Dựng lại (ms)':>14} {'µs/phần mềm':>12} {'Bộ nhớ (KB)':>12} {'B/phần mềm':>11} {'QWidget':>8} {'Lọc (ms)':>9}")
+    for result in results:
+        print(f"{result['size']:>12} {result['seconds'] * 1000:>14.1f} {result['seconds'] * 1e6 / result['size']:>12.1f} "
+              f"{result['bytes'] / 1024:>12.1f} {result['bytes'] / result['size']:>11.0f} {result['widgets']:>8} "
+              f"{result['filter_seconds'] * 1000:>9.1f}")
+
+    # Cỡ tham chiếu: cỡ nhỏ nhất từ 500 trở lên để chi phí cố định không làm sai lệch tỉ lệ
+    reference = next((result for result in results if result["size"] >= 500), results[0])
+    largest = results[-1]
+    failures = []
+    if len({result["widgets"] for result in results}) != 1:
+        failures.append("số QWidget thay đổi theo số phần mềm")
+    for metric, label in (("seconds", "thời gian"), ("bytes", "bộ nhớ")):
+        growth = (largest[metric] / largest["size"]) / max(reference[metric] / reference["size"], 1e-12)
+        if growth > MAX_GROWTH:
+            failures.append(f"{label} mỗi phần mềm tăng {growth:.1f} lần từ {reference['size']} lên {largest['size']}")
+
+    if largest["filter_seconds"] * 1000 > FRAME_BUDGET_MS:
+        failures.append(f"lọc {largest['size']} phần mềm mất {largest['filter_seconds'] * 1000:.1f} ms, quá một khung hình")
+
+    if failures:
+        print("KHÔNG ĐẠT: " + "; ".join(failures))
+        return 1
+    print("ĐẠT: chi phí mỗi phần mềm giữ ổn định, số QWidget không đổi, lọc trong một khung hình.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
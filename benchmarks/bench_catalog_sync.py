@@ -0,0 +1,101 @@
+# bench_catalog_sync.py
+"""
+Đo lượng dữ liệu và thời gian đồng bộ danh sách phần mềm (CatalogCache) giữa tải toàn bộ và
+tải delta theo revision, với máy chủ thử nghiệm trong benchmarks/catalog_server.py.
+
+Chạy: python benchmarks/bench_catalog_sync.py [--size 10000]
+Trả về mã lỗi 1 nếu danh sách/index sau khi áp dụng delta khác với khi tải toàn bộ,
+hoặc nếu delta một mục không nhỏ hơn MAX_DELTA_RATIO lần bản đầy đủ.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# tekdt_ais tạo thư mục dữ liệu cạnh sys.argv[0], nên chuyển sang thư mục tạm trước khi import
+_data_dir = Path(tempfile.mkdtemp(prefix="tekdt_ais_bench_"))
+sys.argv[0] = str(_data_dir / "bench_catalog_sync.py")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import tekdt_ais
+from bench_app_list import make_catalog
+from catalog_server import CatalogServer
+
+MAX_DELTA_RATIO = 0.01 # Delta một mục phải nhỏ hơn 1% bản đầy đủ
+
+def sync(cache, server, session):
+    sent_before = server.bytes_sent
+    start = time.perf_counter()
+    _catalog, changed = cache.fetch(session, force=True)
+    return {"ms": (time.perf_counter() - start) * 1000, "bytes": server.bytes_sent - sent_before, "changed": changed}
+
+def same_as_server(cache, server):
+    """Danh sách và index của client có khớp với bản đầy đủ của máy chủ không (bỏ qua thứ tự các mục trùng tên)."""
+    expected_items = server.catalog["app_items"]
+    fresh = tekdt_ais.CatalogIndex.compile(expected_items)
+    groups = lambda index, arch: [(category, sorted(keys)) for category, keys in index.grouped(arch)]
+    return (cache.catalog["app_items"] == expected_items and cache.revision() == server.revision
+            and cache.index.versions == fresh.versions
+            and all(groups(cache.index, arch) == groups(fresh, arch) for arch in fresh.ARCHES))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    args = parser.parse_args()
+
+    server = CatalogServer({"app_items": make_catalog(args.size)}).start()
+    session = tekdt_ais.get_http_session()
+    cache = tekdt_ais.CatalogCache(server.url, _data_dir / "catalog_cache.json",
+                                   index_file=_data_dir / "catalog_index.pickle")
+    results = []
+    failures = []
+    try:
+        results.append(("Tải lần đầu (toàn bộ)", sync(cache, server, session)))
+        results.append(("Không đổi (304)", sync(cache, server, session)))
+
+        key = next(iter(server.catalog["app_items"]))
+        info = dict(server.catalog["app_items"][key], version="99.0.0")
+        server.update_entry(key, info)
+        results.append(("Sửa 1 mục (delta)", sync(cache, server, session)))
+        if not same_as_server(cache, server):
+            failures.append("delta sửa mục cho kết quả khác bản đầy đủ")
+
+        server.update_entry("ZZNew", {"display_name": "Aaa mới", "category": "Mới", "version": "1.0"})
+        server.remove_entry(list(server.catalog["app_items"])[1])
+        results.append(("Thêm 1 + xóa 1 (delta)", sync(cache, server, session)))
+        if not same_as_server(cache, server):
+            failures.append("delta thêm/xóa mục cho kết quả khác bản đầy đủ")
+
+        server.update_entry(key, dict(info, version="100.0.0"))
+        server.compact() # Máy chủ bỏ bản ghi xóa sau revision của client: client phải tải lại toàn bộ
+        results.append(("Delta hết hạn (toàn bộ)", sync(cache, server, session)))
+        if not same_as_server(cache, server):
+            failures.append("tải lại toàn bộ cho kết quả khác máy chủ")
+
+        server.serve_deltas = False # Giống máy chủ tĩnh: bỏ qua ?since
+        server.update_entry(key, dict(info, version="101.0.0"))
+        results.append(("Máy chủ tĩnh (toàn bộ)", sync(cache, server, session)))
+        if not same_as_server(cache, server):
+            failures.append("máy chủ tĩnh cho kết quả khác")
+    finally:
+        server.stop()
+
+    print(f"{'Trường hợp':<26} {'Dữ liệu (KB)':>13} {'Thời gian (ms)':>15} {'Đổi':>5}")
+    for label, result in results:
+        print(f"{label:<26} {result['bytes'] / 1024:>13.1f} {result['ms']:>15.1f} {str(result['changed']):>5}")
+
+    full_bytes = results[0][1]["bytes"]
+    delta_bytes = results[2][1]["bytes"]
+    if delta_bytes >= full_bytes * MAX_DELTA_RATIO:
+        failures.append(f"delta một mục {delta_bytes} byte, không nhỏ hơn {MAX_DELTA_RATIO:.0%} của {full_bytes} byte")
+
+    if failures:
+        print("KHÔNG ĐẠT: " + "; ".join(failures))
+        return 1
+    print("ĐẠT: delta khớp với bản đầy đủ và chỉ tải các mục thay đổi.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# bench_lan_cache.py
+"""
+Đo lượng dữ liệu tải từ internet khi nhiều máy cùng cần một file cài đặt, có và không có bộ đệm LAN
+(LanPeerCache), với nhiều bản bộ đệm chạy trên localhost, mỗi bản một kho riêng.
+
+Máy đầu tiên tải từ máy chủ gốc (giả lập internet, giới hạn băng thông), các máy còn lại cùng lúc tìm
+nhau qua multicast rồi tải theo nhiều đoạn Range từ các máy đã có file, như aria2 khi có nhiều URL.
+
+Chạy: python benchmarks/bench_lan_cache.py [--machines 6] [--size-mb 32] [--internet-mbps 20]
+Trả về mã lỗi 1 nếu máy chủ gốc gửi nhiều hơn một bản của file, nếu có máy không tìm thấy các máy khác,
+hoặc nếu file trong kho của một máy không khớp size/SHA-256.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# tekdt_ais tạo thư mục dữ liệu cạnh sys.argv[0], nên chuyển sang thư mục tạm trước khi import
+_data_dir = Path(tempfile.mkdtemp(prefix="tekdt_ais_bench_"))
+sys.argv[0] = str(_data_dir / "bench_lan_cache.py")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tekdt_ais
+
+DISCOVERY_TIMEOUT = 3 * tekdt_ais.LAN_CACHE_ANNOUNCE_INTERVAL
+SEGMENTS = 4
+CHUNK = 256 * 1024
+
+class OriginServer:
+    """Máy chủ gốc của file cài đặt, gửi với băng thông giới hạn và đếm số byte đã gửi."""
+    def __init__(self, payload, bytes_per_second):
+        self.payload = payload
+        self.bytes_per_second = bytes_per_second
+        self.bytes_sent = 0
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/setup.exe"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(server.payload)))
+                self.end_headers()
+                for offset in range(0, len(server.payload), CHUNK):
+                    chunk = server.payload[offset:offset + CHUNK]
+                    self.wfile.write(chunk)
+                    server.bytes_sent += len(chunk)
+                    time.sleep(len(chunk) / server.bytes_per_second)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def fetch_segments(session, urls, dest, size):
+    """Tải file theo SEGMENTS đoạn Range, mỗi đoạn từ một URL xoay vòng (giống aria2 với nhiều mirror)."""
+    with open(dest, 'wb') as f:
+        f.truncate(size)
+    bounds = [(size * i // SEGMENTS, size * (i + 1) // SEGMENTS - 1) for i in range(SEGMENTS)]
+
+    def fetch(index):
+        start, end = bounds[index]
+        response = session.get(urls[index % len(urls)], headers={'Range': f'bytes={start}-{end}'}, timeout=(1, 10))
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise ValueError(f"đoạn {start}-{end} sai: HTTP {response.status_code}, {len(response.content)} byte")
+        with open(dest, 'r+b') as f:
+            f.seek(start)
+            f.write(response.content)
+
+    with ThreadPoolExecutor(max_workers=SEGMENTS) as executor:
+        list(executor.map(fetch, range(SEGMENTS)))
+
+def wait_for_peers(caches, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(len(cache.peers()) >= len(caches) - 1 for cache in caches):
+            return True
+        time.sleep(0.05)
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--machines", type=int, default=6)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--internet-mbps", type=float, default=20, help="băng thông máy chủ gốc (MB/s)")
+    parser.add_argument("--interface", default="127.0.0.1", help="card mạng dùng cho multicast")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    app_info = {"display_name": "Installer thử nghiệm", "download_url": "", "output_filename": "setup.exe",
+                "size": len(payload), "sha256": hashlib.sha256(payload).hexdigest()}
+    origin = OriginServer(payload, args.internet_mbps * 1024 * 1024).start()
+    app_info["download_url"] = origin.url
+
+    caches = [tekdt_ais.LanPeerCache(tekdt_ais.ArtifactStore(_data_dir / f"machine{i}" / ".store"),
+                                     interface=args.interface)
+              for i in range(args.machines)]
+    failures = []
+    timings = {}
+    try:
+        for cache in caches:
+            cache.start()
+        if not wait_for_peers(caches, DISCOVERY_TIMEOUT):
+            failures.append(f"không phải máy nào cũng tìm thấy {args.machines - 1} máy khác sau {DISCOVERY_TIMEOUT} giây")
+
+        def install(index):
+            """Một máy cần file: hỏi bộ đệm LAN trước, không máy nào có thì tải từ máy chủ gốc."""
+            cache = caches[index]
+            dest = _data_dir / f"machine{index}" / "setup.exe"
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
+            urls = cache.locate({"Setup": app_info}).get("Setup")
+            if urls:
+                fetch_segments(cache.session, urls, dest, len(payload))
+            else:
+                with cache.session.get(origin.url, stream=True, timeout=(1, 60)) as response, open(dest, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK):
+                        f.write(chunk)
+            cache.store.ingest(dest, app_info["sha256"], app_info["size"])
+            return time.perf_counter() - start, "LAN" if urls else "internet"
+
+        results = [install(0)]
+        with ThreadPoolExecutor(max_workers=args.machines) as executor:
+            results += list(executor.map(install, range(1, args.machines)))
+        timings = dict(enumerate(results))
+    except Exception as e:
+        failures.append(f"lỗi: {e}")
+    finally:
+        served_by_peers = sum(cache.bytes_served for cache in caches)
+        for cache in caches:
+            cache.shutdown()
+        origin.stop()
+
+    print(f"{'Máy':>4} {'Nguồn':>9} {'Thời gian (s)':>14}")
+    for index, (seconds, source) in timings.items():
+        print(f"{index:>4} {source:>9} {seconds:>14.2f}")
+    size_mb = len(payload) / 1024 / 1024
+    print(f"Tải từ internet: {origin.bytes_sent / 1024 / 1024:.1f} MB "
+          f"(không có bộ đệm LAN: {size_mb * args.machines:.1f} MB), máy trong LAN gửi: {served_by_peers / 1024 / 1024:.1f} MB")
+
+    for index, cache in enumerate(caches):
+        if not cache.store.has(app_info["sha256"], app_info["size"]):
+            failures.append(f"kho của máy {index} không có file")
+    if origin.bytes_sent > len(payload):
+        failures.append(f"máy chủ gốc gửi {origin.bytes_sent} byte, nhiều hơn một bản ({len(payload)} byte)")
+
+    if failures:
+        print("KHÔNG ĐẠT: " + "; ".join(failures))
+        return 1
+    print(f"ĐẠT: {args.machines} máy chỉ tải từ internet một lần, các máy còn lại lấy file từ LAN và khớp SHA-256.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# bench_parallel_install.py
+"""
+Đo tổng thời gian cài đặt một lô phần mềm của InstallWorker khi chạy lần lượt và khi chạy
+song song theo install_mutex, với các installer giả (script ngủ một lúc rồi thoát).
+
+Chạy: python benchmarks/bench_parallel_install.py [--installers 12] [--duration 0.5] [--parallel 4]
+Chỉ chạy trên hệ POSIX (installer giả là script có shebang).
+Trả về mã lỗi 1 nếu hai installer cùng install_mutex chạy chồng lên nhau, nếu có tác vụ thất bại,
+hoặc nếu chạy song song không nhanh hơn MIN_SPEEDUP lần so với chạy lần lượt.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# tekdt_ais tạo thư mục dữ liệu cạnh sys.argv[0], nên chuyển sang thư mục tạm trước khi import
+_data_dir = Path(tempfile.mkdtemp(prefix="tekdt_ais_bench_"))
+sys.argv[0] = str(_data_dir / "bench_parallel_install.py")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt6.QtCore import QCoreApplication
+
+import tekdt_ais
+
+MIN_SPEEDUP = 1.5
+STUB_INSTALLER = """#!{python}
+import sys, time
+with open({log!r}, "a") as log:
+    log.write(f"{{sys.argv[1]}} start {{time.time()}}\\n")
+time.sleep(float(sys.argv[2]))
+with open({log!r}, "a") as log:
+    log.write(f"{{sys.argv[1]}} end {{time.time()}}\\n")
+"""
+
+def make_tasks(count, duration, log_file):
+    """
+    Một phần ba installer không khai báo install_mutex (nhóm mặc định, cài lần lượt),
+    phần còn lại chia vào hai nhóm riêng hoặc khai báo null (cài song song với mọi thứ).
+    """
+    tasks = {}
+    for i in range(count):
+        key = f"Stub{i:03d}"
+        app_dir = tekdt_ais.APPS_DIR / key
+        app_dir.mkdir(parents=True, exist_ok=True)
+        installer = app_dir / "setup.py"
+        installer.write_text(STUB_INSTALLER.format(python=sys.executable, log=str(log_file)), encoding="utf-8")
+        installer.chmod(0o755)
+        info = {
+            "display_name": f"Installer giả {i}",
+            "version": "1.0",
+            "type": "installer",
+            "download_url": f"https://example.com/{key}/setup.py",
+            "install_params": f"{key} {duration}",
+        }
+        if i % 3 == 1:
+            info["install_mutex"] = f"per-user-{i % 2}"
+        elif i % 3 == 2:
+            info["install_mutex"] = None
+        tasks[key] = {"action": "install", "info": info}
+    return tasks
+
+def run_batch(app, tasks, parallel, log_file):
+    log_file.write_text("", encoding="utf-8")
+    results = {}
+    worker = tekdt_ais.InstallWorker(tasks, parallel)
+    worker.signals.progress.connect(lambda key, status, _message: results.__setitem__(key, status))
+    start = time.perf_counter()
+    worker.start()
+    while not worker.isFinished():
+        app.processEvents()
+        time.sleep(0.01)
+    app.processEvents()
+    return time.perf_counter() - start, results
+
+def overlapping_mutexes(tasks, log_file):
+    """Các install_mutex có hai installer chạy chồng lên nhau theo log của installer giả."""
+    spans = {}
+    for line in log_file.read_text(encoding="utf-8").splitlines():
+        key, event, stamp = line.split()
+        spans.setdefault(key, {})[event] = float(stamp)
+    overlaps = set()
+    for key, span in spans.items():
+        mutex = tekdt_ais.InstallWorker.install_mutex(tasks[key])
+        for other, other_span in spans.items():
+            if (other != key and mutex is not None and tekdt_ais.InstallWorker.install_mutex(tasks[other]) == mutex
+                    and span["start"] < other_span["end"] and other_span["start"] < span["end"]):
+                overlaps.add(mutex)
+    return overlaps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--installers", type=int, default=12)
+    parser.add_argument("--duration", type=float, default=0.5)
+    parser.add_argument("--parallel", type=int, default=tekdt_ais.DEFAULT_MAX_PARALLEL_INSTALLS)
+    args = parser.parse_args()
+    if os.name != "posix":
+        print("Benchmark này cần hệ POSIX để chạy installer giả.")
+        return 1
+
+    app = QCoreApplication(sys.argv)
+    log_file = _data_dir / "installs.log"
+    tasks = make_tasks(args.installers, args.duration, log_file)
+
+    failures = []
+    timings = {}
+    for label, parallel in (("Lần lượt", 1), (f"Song song ({args.parallel})", args.parallel)):
+        seconds, results = run_batch(app, tasks, parallel, log_file)
+        timings[label] = seconds
+        failed = sorted(key for key in tasks if results.get(key) != "success")
+        if failed:
+            failures.append(f"{label}: tác vụ không thành công {failed}")
+        overlaps = overlapping_mutexes(tasks, log_file)
+        if overlaps:
+            failures.append(f"{label}: installer cùng nhóm chạy chồng nhau {sorted(overlaps)}")
+
+    print(f"{'Chế độ':<16} {'Tổng (s)':>9}")
+    for label, seconds in timings.items():
+        print(f"{label:<16} {seconds:>9.2f}")
+
+    serial, parallel = timings.values()
+    if serial / parallel < MIN_SPEEDUP:
+        failures.append(f"song song chỉ nhanh hơn {serial / parallel:.2f} lần")
+
+    if failures:
+        print("KHÔNG ĐẠT: " + "; ".join(failures))
+        return 1
+    print(f"ĐẠT: nhanh hơn {serial / parallel:.2f} lần, installer cùng install_mutex vẫn chạy lần lượt.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
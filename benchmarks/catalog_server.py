@@ -0,0 +1,137 @@
+# catalog_server.py
+"""
+Máy chủ thử nghiệm cho đồng bộ danh sách phần mềm theo delta (CatalogCache).
+
+Danh sách có revision toàn cục, mỗi mục có rev là revision lần sửa cuối, và "removed" ghi
+revision lúc xóa của các mục đã bị xóa:
+    GET /app_list.json             -> toàn bộ danh sách
+    GET /app_list.json?since=N     -> {"revision", "since": N, "app_items": {mục có rev > N}, "removed": [...]}
+ETag là revision hiện tại, nên hỏi lại khi không có gì đổi chỉ nhận 304. Nếu N cũ hơn mốc xóa
+sớm nhất còn giữ (oldest_delta_revision) thì trả toàn bộ danh sách.
+
+Chạy: python benchmarks/catalog_server.py app_list.json [--port 8765]
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def stamp_revisions(catalog, revision=1):
+    """Thêm revision toàn cục và rev cho từng mục vào một danh sách chưa có revision."""
+    stamped = {key: value for key, value in catalog.items() if key != 'app_items'}
+    stamped['revision'] = catalog.get('revision', revision)
+    stamped['app_items'] = {key: {**info, 'rev': info.get('rev', stamped['revision'])}
+                            for key, info in catalog.get('app_items', {}).items()}
+    stamped.setdefault('removed', {})
+    return stamped
+
+class CatalogServer:
+    def __init__(self, catalog, host='127.0.0.1', port=0, serve_deltas=True):
+        self.catalog = stamp_revisions(catalog)
+        self.serve_deltas = serve_deltas # False: giống máy chủ tĩnh, bỏ qua ?since
+        self.oldest_delta_revision = 0
+        self.bytes_sent = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/app_list.json"
+
+    @property
+    def revision(self):
+        return self.catalog['revision']
+
+    def update_entry(self, key, info):
+        with self._lock:
+            self.catalog['revision'] += 1
+            self.catalog['app_items'][key] = {**info, 'rev': self.catalog['revision']}
+            self.catalog['removed'].pop(key, None)
+
+    def remove_entry(self, key):
+        with self._lock:
+            self.catalog['revision'] += 1
+            self.catalog['app_items'].pop(key, None)
+            self.catalog['removed'][key] = self.catalog['revision']
+
+    def compact(self):
+        """Bỏ các bản ghi xóa; client có revision cũ hơn sẽ phải tải lại toàn bộ."""
+        with self._lock:
+            self.catalog['removed'].clear()
+            self.oldest_delta_revision = self.catalog['revision']
+
+    def response_for(self, since):
+        with self._lock:
+            revision = self.catalog['revision']
+            if since is None or not self.serve_deltas or since < self.oldest_delta_revision or since > revision:
+                return self.catalog
+            return {
+                'revision': revision,
+                'since': since,
+                'app_items': {key: info for key, info in self.catalog['app_items'].items() if info['rev'] > since},
+                'removed': [key for key, removed_at in self.catalog['removed'].items() if removed_at > since],
+            }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True # Header và nội dung gửi riêng; tránh chờ ACK trễ ~200 ms
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                try:
+                    since = int(query['since'][0]) if 'since' in query else None
+                except ValueError:
+                    since = None
+                etag = f'"rev-{server.revision}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    server.requests.append((self.path, 304, 0))
+                    return
+                body = json.dumps(server.response_for(since), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+                server.bytes_sent += len(body)
+                server.requests.append((self.path, 200, len(body)))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("catalog", help="file danh sách phần mềm (app_list.json)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    with open(args.catalog, 'r', encoding='utf-8') as f:
+        server = CatalogServer(json.load(f), args.host, args.port)
+    print(f"Đang phục vụ {args.catalog} (revision {server.revision}) tại {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,6 @@ import subprocess
 import webbrowser
 import shutil
 import zipfile
-import io
 from pathlib import Path
 import platform
 import re
@@ -16,15 +15,36 @@ import signal
 import threading
 import queue
 import time
-from packaging.version import parse as parse_version
+import socket
+import secrets
+import itertools
+import heapq
+import hashlib
+import difflib
+import asyncio
+import collections
+import bisect
+import unicodedata
+import mmap
+import sqlite3
+import pickle
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ipaddress
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from packaging.version import parse as parse_version, InvalidVersion
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QListWidget, QListWidgetItem, QLabel, QPushButton, QLineEdit,
+                             QListView, QAbstractItemView, QStyledItemDelegate, QStyle, QLabel, QPushButton, QLineEdit,
                              QFrame, QScrollArea, QGraphicsOpacityEffect, QToolTip,
                              QMessageBox, QSizePolicy, QTextEdit)
-from PyQt6.QtGui import QIcon, QPixmap, QColor, QPalette, QFont, QMovie
-from PyQt6.QtCore import (Qt, QSize, QThread, pyqtSignal, QObject, QPropertyAnimation,
-                          QEasingCurve, QTimer, QRect, QCoreApplication)
+from PyQt6.QtGui import QIcon, QPixmap, QPixmapCache, QPainter, QColor, QPalette, QFont, QMovie
+from PyQt6.QtCore import (Qt, QSize, QThread, pyqtSignal, QObject, QAbstractListModel, QModelIndex,
+                          QEvent, QTimer, QRect, QCoreApplication)
 
 # --- CÁC HẰNG SỐ VÀ CẤU HÌNH ---
 APP_NAME = "TekDT AIS"
@@ -45,16 +65,54 @@ def resource_path(relative_path):
 
     return str(Path(base_path) / relative_path)
 
-CONFIG_FILE = APP_DATA_DIR / "app_config.json"
+CONFIG_FILE = APP_DATA_DIR / "app_config.json" # Định dạng cũ, chỉ còn dùng để nhập vào CONFIG_DB_FILE
+CONFIG_DB_FILE = APP_DATA_DIR / "app_config.db"
+CATALOG_CACHE_FILE = APP_DATA_DIR / "catalog_cache.json"
+CATALOG_INDEX_FILE = APP_DATA_DIR / "catalog_index.pickle" # Bản biên dịch của catalog_cache.json, nạp nhanh khi khởi động
+CATALOG_CACHE_TTL = 300 # Giây: trong khoảng này không hỏi lại máy chủ
 APPS_DIR = APP_DATA_DIR / "Apps"
+ARIA2_SESSION_FILE = APPS_DIR / ".aria2-session" # Các tác vụ tải dở dang của daemon aria2, nạp lại ở lần chạy sau
+ARIA2_SESSION_SAVE_INTERVAL = 10 # Giây: aria2 ghi session định kỳ để không mất tiến độ khi bị tắt đột ngột
+STORE_DIR = APPS_DIR / ".store" # Kho file cài đặt theo SHA-256, Apps/<key>/<file> là hard link tới đây
+ICON_CACHE_DIR = APPS_DIR / ".icons" # Icon dùng chung, đặt tên theo URL
 TOOLS_DIR = APP_DATA_DIR / "Tools"
 IMAGES_DIR_DATA = APP_DATA_DIR / "Images"
 ARIA2_DIR = TOOLS_DIR / "aria2"
 SEVENZ_DIR = TOOLS_DIR / "7z"
 ARIA2_EXEC = ARIA2_DIR / "aria2c.exe"
-SEVENZ_EXEC = SEVENZ_DIR / "7za.exe"
+SEVENZ_EXEC = SEVENZ_DIR / "7za.exe" # 7-Zip console đầy đủ (bản standalone trong gói 7z*-extra.7z)
+SEVENZR_EXEC = SEVENZ_DIR / "7zr.exe" # 7-Zip Reduced: chỉ đọc được .7z, dùng để giải nén gói extra
+# Phần mềm có file tải về mang các đuôi này được giải nén trước khi dùng ("extract" trong danh sách ghi đè).
+# Chỉ gồm các định dạng 7za standalone đọc được (không có .rar, .zst).
+ARCHIVE_EXTENSIONS = ('.7z', '.zip', '.cab', '.tar', '.gz', '.tgz', '.xz', '.bz2', '.tbz2', '.lzma')
+EXTRACT_MARKER_FILE = ".extracted" # Trong thư mục giải nén: SHA-256 của file nén đã giải nén ra
+BUNDLE_MANIFEST_FILE = "manifest.json" # Trong gói của /export_bundle: danh sách phần mềm kèm kích thước, SHA-256
+BUNDLE_FORMAT = 1
+BUNDLE_STAGING_PREFIX = ".bundle-" # Thư mục tạm trong Apps/ khi đóng gói/nhập gói
+TOOL_RELEASE_CACHE_FILE = TOOLS_DIR / "releases_cache.json"
+# Giới hạn mặc định của bộ lập lịch tải (có thể ghi đè trong bảng settings của app_config.db)
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 4
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 16
+DEFAULT_CONNECTIONS_PER_DOWNLOAD = 8
+DEFAULT_MAX_PARALLEL_INSTALLS = 4 # Số installer chạy cùng lúc (khác install_mutex)
+DEFAULT_INSTALL_MUTEX = "windows-installer" # Nhóm của installer không khai báo install_mutex: cài lần lượt
+# Cờ tạo tiến trình chỉ có trên Windows; nơi khác là 0 để chạy được installer giả khi thử nghiệm
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+DETACHED_PROCESS = getattr(subprocess, 'DETACHED_PROCESS', 0)
 ARIA2_API_URL = "https://api.github.com/repos/aria2/aria2/releases/latest"
 SEVENZIP_API_URL = "https://api.github.com/repos/ip7z/7zip/releases/latest"
+CONNECTIVITY_PROBE_URL = "https://www.google.com"
+CONNECTIVITY_PROBE_TIMEOUT = 3 # Giây; thăm dò không retry nên lâu nhất chỉ chờ chừng này
+HTTP_USER_AGENT = 'TekDT-AIS-App' # GitHub API cần User-Agent
+HTTP_TIMEOUT = (5, 15) # (kết nối, đọc) mặc định cho mọi request không tự đặt timeout
+TOOL_CHECK_TTL = 6 * 3600 # Giây: trong khoảng này không hỏi lại GitHub về phiên bản công cụ
+SEARCH_DEBOUNCE_MS = 150 # Chờ người dùng ngừng gõ rồi mới lọc danh sách
+MIRROR_PROBE_TIMEOUT = (3, 5) # (kết nối, đọc) khi đo mirror; mirror chậm hơn coi như không dùng được
+MIRROR_PROBE_TTL = 600 # Giây: kết quả đo một mirror được dùng lại cho các phần mềm khác trong khoảng này
+LAN_CACHE_GROUP = "239.255.42.99" # Nhóm multicast để các máy chạy TekDT AIS trong LAN tìm thấy nhau
+LAN_CACHE_PORT = 47999
+LAN_CACHE_ANNOUNCE_INTERVAL = 5 # Giây giữa hai lần thông báo; máy im lặng quá 3 lần coi như đã tắt
+LAN_CACHE_PROBE_TIMEOUT = (1, 2) # (kết nối, đọc) khi hỏi máy trong LAN có file hay không
 
 # Create storage directories if they don't exist
 def initialize_directories_and_tools():
@@ -83,6 +141,1044 @@ def initialize_directories_and_tools():
 # Chạy hàm khởi tạo ngay lập tức
 initialize_directories_and_tools()
 
+class ConnectivityState:
+    """
+    Trạng thái online/offline dùng chung, được nhớ trong một TTL ngắn.
+    Được cập nhật thụ động từ kết quả của các request thật, nên chỉ phải gửi
+    request thăm dò khi chưa biết trạng thái.
+    """
+    TTL = 30
+
+    def __init__(self):
+        self._online = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+        self._probe_session = None
+
+    def record(self, online):
+        with self._lock:
+            self._online = online
+            self._updated_at = time.monotonic()
+
+    def known_state(self):
+        """True/False nếu trạng thái còn mới, None nếu chưa biết hoặc đã cũ."""
+        with self._lock:
+            if self._online is None or time.monotonic() - self._updated_at > self.TTL:
+                return None
+            return self._online
+
+    def is_online(self, timeout=CONNECTIVITY_PROBE_TIMEOUT):
+        state = self.known_state()
+        if state is not None:
+            return state
+        with self._lock:
+            if self._probe_session is None:
+                # Session riêng không retry: Retry/backoff của session dùng chung làm lần thăm dò
+                # khi offline kéo dài gấp mấy lần timeout
+                self._probe_session = requests.Session()
+                self._probe_session.mount('https://', HTTPAdapter(max_retries=0))
+                self._probe_session.headers.update({'User-Agent': HTTP_USER_AGENT})
+            session = self._probe_session
+        try:
+            session.head(CONNECTIVITY_PROBE_URL, timeout=timeout)
+        except requests.RequestException:
+            self.record(False)
+            return False
+        self.record(True)
+        return True
+
+CONNECTIVITY = ConnectivityState()
+
+def _is_local_host(host):
+    if not host or host == 'localhost':
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private or address.is_link_local
+
+class _SharedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter có timeout mặc định và cập nhật CONNECTIVITY theo kết quả request ra internet."""
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = HTTP_TIMEOUT
+        track = not _is_local_host(urlparse(request.url).hostname)
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if track:
+                CONNECTIVITY.record(False)
+            raise
+        if track:
+            CONNECTIVITY.record(True)
+        return response
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    requests.Session dùng chung cho cả tiến trình: pool kết nối theo host, keep-alive,
+    timeout mặc định và retry/backoff, tránh lặp lại bắt tay TLS giữa các thành phần.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(total=3, connect=1, read=2, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET', 'HEAD']),
+                          respect_retry_after_header=True)
+            adapter = _SharedHTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'User-Agent': HTTP_USER_AGENT})
+            _http_session = session
+        return _http_session
+
+def get_download_path(app_key, app_info):
+    """Đường dẫn file cài đặt của một phần mềm trong Apps/<key>/."""
+    return APPS_DIR / app_key / app_info.get('output_filename', Path(app_info.get('download_url', '')).name)
+
+def is_download_complete(app_key, app_info, verify=True):
+    """
+    File cài đặt phải tồn tại VÀ file .aria2 không được tồn tại,
+    và khớp size/sha256 nếu danh sách phần mềm có khai báo.
+    verify=False: không băm file (dùng trên luồng giao diện), xem ArtifactStore.is_valid.
+    """
+    if not app_info.get('download_url'):
+        return False
+    download_path = get_download_path(app_key, app_info)
+    aria2_control_file = download_path.with_suffix(download_path.suffix + '.aria2')
+    return (download_path.exists() and not aria2_control_file.exists()
+            and ARTIFACT_STORE.is_valid(download_path, app_info.get('sha256'), app_info.get('size'), verify))
+
+def download_mirrors(app_info):
+    """Các URL tải của một phần mềm: download_url rồi tới các mirror trong download_urls, không trùng lặp."""
+    urls = [app_info.get('download_url'), *(app_info.get('download_urls') or [])]
+    return list(dict.fromkeys(url for url in urls if url))
+
+class MirrorProber:
+    """
+    Đo song song các mirror của file tải về bằng HEAD: bỏ mirror lỗi hoặc không phản hồi, bỏ mirror có
+    Content-Length khác size trong danh sách phần mềm (không khai báo thì khác số đông),
+    rồi xếp số còn lại theo độ trễ. Mỗi URL chỉ được đo lại sau MIRROR_PROBE_TTL giây.
+    """
+    MAX_WORKERS = 16
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        # Session riêng không retry: mirror chết phải bị loại ngay thay vì chờ backoff
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': HTTP_USER_AGENT})
+        self._results = {} # url -> (thời điểm đo, độ trễ giây hoặc None nếu lỗi, Content-Length hoặc None)
+        self._lock = threading.Lock()
+
+    def _probe(self, url):
+        start = time.monotonic()
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=MIRROR_PROBE_TIMEOUT)
+            if response.status_code in (405, 501):
+                # Máy chủ không hỗ trợ HEAD: chỉ đọc header của GET rồi đóng
+                response = self.session.get(url, allow_redirects=True, stream=True, timeout=MIRROR_PROBE_TIMEOUT)
+                response.close()
+        except requests.RequestException:
+            return None, None
+        if response.status_code >= 400:
+            return None, None
+        length = response.headers.get('Content-Length', '')
+        return time.monotonic() - start, int(length) if length.isdigit() else None
+
+    def _probe_stale(self, urls):
+        now = time.monotonic()
+        with self._lock:
+            stale = [url for url in urls if url not in self._results or now - self._results[url][0] > MIRROR_PROBE_TTL]
+        if not stale:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(stale))) as executor:
+            results = list(executor.map(self._probe, stale))
+        with self._lock:
+            for url, (latency, length) in zip(stale, results):
+                self._results[url] = (now, latency, length)
+
+    def rank(self, app_infos):
+        """
+        {app_key: thông tin phần mềm} -> {app_key: [URL mirror tốt, nhanh nhất trước]}.
+        Mọi mirror của cả lô được đo cùng lúc; phần mềm chỉ có một URL thì không cần đo.
+        Nếu không mirror nào đạt thì giữ nguyên danh sách để aria2 tự thử và báo lỗi.
+        """
+        mirrors = {key: download_mirrors(info) for key, info in app_infos.items()}
+        self._probe_stale(list(dict.fromkeys(url for urls in mirrors.values() if len(urls) > 1 for url in urls)))
+
+        ranked = {}
+        for key, urls in mirrors.items():
+            if len(urls) <= 1:
+                ranked[key] = urls
+                continue
+            with self._lock:
+                alive = [(self._results[url][1], self._results[url][2], url) for url in urls if self._results[url][1] is not None]
+            expected_size = app_infos[key].get('size')
+            if expected_size is not None:
+                reference = int(expected_size)
+            else:
+                lengths = collections.Counter(length for _latency, length, _url in alive if length is not None)
+                reference = lengths.most_common(1)[0][0] if lengths else None
+            healthy = [url for _latency, length, url in sorted(alive)
+                       if reference is None or length is None or length == reference]
+            dropped = [url for url in urls if url not in healthy]
+            if healthy and dropped:
+                print(f"Bỏ mirror không dùng được của {key}: {', '.join(dropped)}")
+            ranked[key] = healthy or urls
+        return ranked
+
+def is_archive_package(app_info):
+    """Phần mềm được đóng gói dạng file nén, cần giải nén trước khi dùng hoặc cài đặt."""
+    return bool(app_info.get('extract', get_download_path('', app_info).name.lower().endswith(ARCHIVE_EXTENSIONS)))
+
+def get_extract_path(app_key, app_info):
+    """Thư mục chứa nội dung đã giải nén của một phần mềm trong Apps/<key>/ (mặc định là tên file nén bỏ đuôi)."""
+    download_path = get_download_path(app_key, app_info)
+    return download_path.with_name(app_info.get('extract_dir') or download_path.name.split('.')[0] or 'extracted')
+
+class ArtifactVerificationError(Exception):
+    """File tải về không khớp kích thước hoặc SHA-256 khai báo trong danh sách phần mềm."""
+
+class ArtifactStore:
+    """
+    Kho file cài đặt theo nội dung (content-addressed) trong Apps/.store.
+    Mỗi nội dung chỉ được lưu một lần theo SHA-256; Apps/<key>/<file> là hard link
+    tới bản trong kho, nên các mục dùng chung một file (ví dụ bản 32/64-bit) không bị lưu trùng.
+    """
+    HASH_CHUNK = 8 * 1024 * 1024
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._digests = {} # (đường dẫn, kích thước, mtime) -> sha256
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256):
+        sha256 = sha256.lower()
+        return self.root / sha256[:2] / sha256
+
+    def has(self, sha256, size=None):
+        try:
+            st = self.object_path(sha256).stat()
+        except OSError:
+            return False
+        return size is None or st.st_size == int(size)
+
+    @classmethod
+    def hash_file(cls, path):
+        """Tính SHA-256 bằng mmap, không đọc cả file vào bộ nhớ."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return digest.hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    for offset in range(0, size, cls.HASH_CHUNK):
+                        digest.update(view[offset:offset + cls.HASH_CHUNK])
+        return digest.hexdigest()
+
+    def file_digest(self, path):
+        """SHA-256 của file, được nhớ lại theo (đường dẫn, kích thước, mtime)."""
+        st = Path(path).stat()
+        cache_key = (str(path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(cache_key)
+        if digest is None:
+            digest = self.hash_file(path)
+            self._digests[cache_key] = digest
+        return digest
+
+    def _is_linked(self, path, sha256):
+        try:
+            return os.path.samefile(path, self.object_path(sha256))
+        except OSError:
+            return False
+
+    def is_valid(self, path, sha256=None, size=None, verify=True):
+        """
+        Kiểm tra file đã tải có khớp size/sha256 của danh sách phần mềm hay không.
+        verify=False chỉ dùng kết quả băm đã nhớ (không có thì chỉ xét size), không đọc nội dung file:
+        file lớn chưa băm được InstallWorker kiểm tra đầy đủ trước khi cài.
+        """
+        try:
+            st = Path(path).stat()
+        except OSError:
+            return False
+        if size is not None and st.st_size != int(size):
+            return False
+        if not sha256 or self._is_linked(path, sha256):
+            return True
+        if not verify:
+            digest = self._digests.get((str(path), st.st_size, st.st_mtime_ns))
+            return digest is None or digest == sha256.lower()
+        # File cũ chưa nằm trong kho: kiểm tra một lần rồi đưa vào kho
+        if self.file_digest(path) != sha256.lower():
+            return False
+        self.ingest(path, sha256, size, trusted=True)
+        return True
+
+    def ingest(self, path, sha256=None, size=None, trusted=False):
+        """
+        Đưa file vừa tải vào kho và thay nó bằng hard link tới bản trong kho.
+        trusted=True khi aria2 đã kiểm tra checksum lúc tải, khỏi phải băm lại.
+        Ném ArtifactVerificationError nếu file không khớp size/sha256.
+        """
+        path = Path(path)
+        if sha256 and self._is_linked(path, sha256):
+            return sha256.lower()
+        actual_size = path.stat().st_size
+        if size is not None and actual_size != int(size):
+            raise ArtifactVerificationError(f"Kích thước {actual_size} byte, cần {size} byte.")
+        digest = sha256.lower() if (sha256 and trusted) else self.file_digest(path)
+        if sha256 and digest != sha256.lower():
+            raise ArtifactVerificationError(f"SHA-256 không khớp ({digest}).")
+
+        obj = self.object_path(digest)
+        with self._lock:
+            if obj.exists():
+                if not self._is_linked(path, digest):
+                    # Nội dung đã có sẵn trong kho: bỏ bản trùng, dùng link tới kho
+                    self.link_into(digest, path)
+            else:
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(path, obj)
+                except OSError:
+                    shutil.copy2(path, obj)
+        return digest
+
+    def link_into(self, sha256, dest):
+        """Tạo dest trỏ tới nội dung sha256 trong kho (hard link, sao chép nếu không link được)."""
+        obj = self.object_path(sha256)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + '.tmp')
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(obj, tmp)
+        except OSError:
+            shutil.copy2(obj, tmp)
+        os.replace(tmp, dest)
+
+ARTIFACT_STORE = ArtifactStore(STORE_DIR)
+
+class LanPeerCache:
+    """
+    Bộ đệm file cài đặt dùng chung trong mạng LAN.
+    Mỗi máy bật chế độ này phục vụ kho Apps/.store qua một máy chủ HTTP nhỏ (HEAD/GET /artifacts/<sha256>,
+    có Range để aria2 tải nhiều đoạn cùng lúc) và thông báo cổng HTTP của mình qua UDP multicast.
+    Trước khi tải từ internet, InstallWorker hỏi các máy khác xem ai đã có nội dung cùng SHA-256.
+    Chỉ phần mềm có sha256 trong danh sách mới được lấy từ máy khác, vì aria2 kiểm tra checksum khi tải xong.
+    """
+    SERVICE = "tekdt-ais-cache"
+    MAX_WORKERS = 16
+    PEER_TTL = 3 * LAN_CACHE_ANNOUNCE_INTERVAL
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def running_instance(cls):
+        """Bộ đệm LAN của tiến trình nếu đã được bật, None nếu không."""
+        with cls._instance_lock:
+            if cls._instance is not None and cls._instance.is_running():
+                return cls._instance
+            return None
+
+    @classmethod
+    def shutdown_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.shutdown()
+                cls._instance = None
+
+    def __init__(self, store=None, group=LAN_CACHE_GROUP, port=LAN_CACHE_PORT, interface='0.0.0.0'):
+        self.store = store or ARTIFACT_STORE
+        self.group = group
+        self.port = port
+        self.interface = interface # Card mạng dùng cho multicast (127.0.0.1 để thử nhiều bản trên một máy)
+        self.peer_id = secrets.token_hex(8)
+        self.bytes_served = 0
+        # Session riêng không retry và không qua proxy: máy trong LAN không trả lời thì bỏ qua ngay
+        self.session = requests.Session()
+        self.session.trust_env = False
+        self.session.headers.update({'User-Agent': HTTP_USER_AGENT})
+        self._peers = {} # peer_id -> (host, cổng HTTP, thời điểm nhận thông báo cuối)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._httpd = None
+        self._sock = None
+        self._threads = []
+
+    def is_running(self):
+        return self._httpd is not None
+
+    @property
+    def http_port(self):
+        return self._httpd.server_address[1] if self._httpd else None
+
+    def start(self):
+        """Mở máy chủ HTTP (cổng ngẫu nhiên) và socket multicast. Ném OSError nếu không mở được."""
+        if self.is_running():
+            return
+        httpd = ThreadingHTTPServer(('', 0), self._make_handler())
+        httpd.daemon_threads = True
+        try:
+            sock = self._open_socket()
+        except OSError:
+            httpd.server_close()
+            raise
+        self._httpd, self._sock = httpd, sock
+        self._stop_event.clear()
+        self._threads = [threading.Thread(target=httpd.serve_forever, name="LanCacheHTTP", daemon=True),
+                         threading.Thread(target=self._discovery_loop, name="LanCacheDiscovery", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        # Hỏi ngay các máy đang chạy thay vì chờ lượt thông báo kế tiếp của chúng
+        self._send('query')
+        print(f"Bộ đệm LAN đang phục vụ {self.store.root} tại cổng {self.http_port}")
+
+    def shutdown(self):
+        if not self.is_running():
+            return
+        self._send('bye')
+        self._stop_event.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._sock.close()
+        self._httpd = self._sock = None
+        self._threads = []
+        with self._lock:
+            self._peers.clear()
+
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            # Nhiều bản chạy trên cùng một máy dùng chung cổng multicast
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('', self.port))
+            interface = socket.inet_aton(self.interface)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(self.group) + interface)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, interface)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1) # Không ra khỏi mạng LAN
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            sock.settimeout(0.5)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _send(self, kind):
+        message = {'service': self.SERVICE, 'id': self.peer_id, 'type': kind, 'port': self.http_port}
+        try:
+            self._sock.sendto(json.dumps(message).encode('utf-8'), (self.group, self.port))
+        except OSError as e:
+            print(f"Không gửi được thông báo bộ đệm LAN: {e}")
+
+    def _discovery_loop(self):
+        next_announce = 0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_announce:
+                self._send('announce')
+                next_announce = now + LAN_CACHE_ANNOUNCE_INTERVAL
+            try:
+                data, (host, _port) = self._sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._handle_message(data, host)
+
+    def _handle_message(self, data, host):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get('service') != self.SERVICE or message.get('id') == self.peer_id:
+            return
+        peer_id = str(message.get('id'))
+        if message.get('type') == 'bye':
+            with self._lock:
+                self._peers.pop(peer_id, None)
+            return
+        port = message.get('port')
+        if isinstance(port, int) and 0 < port < 65536:
+            with self._lock:
+                self._peers[peer_id] = (host, port, time.monotonic())
+        if message.get('type') == 'query':
+            # Trả lời qua multicast: các bản chạy chung một máy dùng chung cổng nên unicast chỉ tới được một bản
+            self._send('announce')
+
+    def peers(self):
+        """[(host, cổng HTTP)] của các máy còn thông báo trong PEER_TTL giây gần nhất."""
+        now = time.monotonic()
+        with self._lock:
+            return [(host, port) for host, port, seen in self._peers.values() if now - seen <= self.PEER_TTL]
+
+    def _probe(self, url):
+        """Content-Length của file trên một máy trong LAN, None nếu máy đó không có hoặc không trả lời."""
+        try:
+            response = self.session.head(url, timeout=LAN_CACHE_PROBE_TIMEOUT)
+        except requests.RequestException:
+            return None
+        length = response.headers.get('Content-Length', '')
+        return int(length) if response.status_code == 200 and length.isdigit() else None
+
+    def locate(self, app_infos):
+        """
+        {app_key: thông tin phần mềm} -> {app_key: [URL tới các máy trong LAN có file]}.
+        Mọi máy được hỏi song song bằng HEAD; máy trả Content-Length khác size khai báo thì bị bỏ.
+        Phần mềm không có sha256 hoặc không máy nào có thì không nằm trong kết quả.
+        """
+        wanted = {key: info for key, info in app_infos.items() if info.get('sha256')}
+        peers = self.peers()
+        if not wanted or not peers:
+            return {}
+        probes = [(key, f"http://{host}:{port}/artifacts/{info['sha256'].lower()}")
+                  for key, info in wanted.items() for host, port in peers]
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(probes))) as executor:
+            lengths = list(executor.map(lambda probe: self._probe(probe[1]), probes))
+        found = {}
+        for (key, url), length in zip(probes, lengths):
+            size = wanted[key].get('size')
+            if length is not None and (size is None or length == int(size)):
+                found.setdefault(key, []).append(url)
+        return found
+
+    @staticmethod
+    def _byte_range(header, size):
+        """
+        (đầu, cuối) của header Range một đoạn; None nếu không có hoặc không hiểu (gửi cả file).
+        Ném ValueError nếu đoạn nằm ngoài file.
+        """
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), (min(int(last), size - 1) if last else size - 1)
+        if start > end:
+            raise ValueError(header)
+        return start, end
+
+    def _make_handler(self):
+        cache = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body):
+                # Chỉ phục vụ nội dung trong kho theo SHA-256, không lộ đường dẫn nào khác
+                match = re.fullmatch(r'/artifacts/([0-9a-f]{64})', self.path)
+                try:
+                    f = open(cache.store.object_path(match.group(1)), 'rb') if match else None
+                except OSError:
+                    f = None
+                if f is None:
+                    self.send_error(404)
+                    return
+                with f:
+                    size = os.fstat(f.fileno()).st_size
+                    try:
+                        byte_range = cache._byte_range(self.headers.get('Range'), size)
+                    except ValueError:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    start, end = byte_range or (0, size - 1)
+                    self.send_response(206 if byte_range else 200)
+                    self.send_header('Content-Type', 'application/octet-stream')
+                    self.send_header('Content-Length', str(end - start + 1))
+                    self.send_header('Accept-Ranges', 'bytes')
+                    if byte_range:
+                        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                    self.end_headers()
+                    if not send_body or end < start:
+                        return
+                    try:
+                        sent = self.connection.sendfile(f, start, end - start + 1)
+                    except OSError:
+                        return # aria2 đóng kết nối khi đã đủ đoạn cần tải
+                    with cache._lock:
+                        cache.bytes_served += sent
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+class ConfigStore:
+    """
+    Kho cấu hình app_config.db (SQLite, chế độ WAL) thay cho việc ghi lại toàn bộ app_config.json.
+    Mỗi thay đổi chỉ upsert đúng dòng của thiết lập/phần mềm đó trong một giao dịch BEGIN IMMEDIATE,
+    nên chi phí ghi không phụ thuộc vào số phần mềm và nhiều tiến trình (GUI, /auto_install) ghi
+    cùng lúc không làm mất cập nhật của nhau. app_config.json (nếu có) được nhập vào kho rồi đổi
+    tên thành app_config.json.migrated; đặt lại một file app_config.json thì lần chạy sau sẽ nhập tiếp.
+    """
+    BUSY_TIMEOUT = 10 # Giây chờ khi tiến trình khác đang giữ khóa ghi
+
+    def __init__(self, db_file, legacy_json_file=None):
+        self.db_file = Path(db_file)
+        self.legacy_json_file = Path(legacy_json_file) if legacy_json_file else None
+        self._local = threading.local() # Mỗi thread một kết nối SQLite
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: tự quản lý giao dịch bằng BEGIN IMMEDIATE/COMMIT
+            conn = sqlite3.connect(self.db_file, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS app_items (app_key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        # Nhật ký hàng đợi tải/cài: tác vụ còn ở đây khi chương trình thoát sẽ được tải tiếp ở lần chạy sau
+        conn.execute("CREATE TABLE IF NOT EXISTS download_queue (app_key TEXT PRIMARY KEY, action TEXT NOT NULL, "
+                     "info TEXT NOT NULL, queued_at REAL NOT NULL)")
+        self._import_legacy_json(conn)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Giao dịch ghi: giữ khóa ghi của cơ sở dữ liệu từ đầu để các tiến trình ghi lần lượt."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _import_legacy_json(self, conn):
+        """Gộp app_config.json vào kho (thiết lập ghi đè, thông tin phần mềm được trộn theo từng trường)."""
+        if self.legacy_json_file is None or not self.legacy_json_file.exists():
+            return
+        with self.transaction():
+            try:
+                with open(self.legacy_json_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                return # Tiến trình khác vừa nhập xong
+            try:
+                config = json.loads(content) if content.strip() else {}
+            except json.JSONDecodeError as e:
+                print(f"Bỏ qua {self.legacy_json_file.name} không hợp lệ: {e}")
+                config = {}
+            for name, value in (config.get('settings') or {}).items():
+                self._put_setting(conn, name, value)
+            for app_key, fields in (config.get('app_items') or {}).items():
+                if isinstance(fields, dict):
+                    self._merge_app_item(conn, app_key, fields)
+            os.replace(self.legacy_json_file, self.legacy_json_file.with_name(self.legacy_json_file.name + '.migrated'))
+        print(f"Đã chuyển {self.legacy_json_file.name} sang {self.db_file.name}.")
+
+    @staticmethod
+    def _put_setting(conn, name, value):
+        conn.execute("INSERT INTO settings (name, value) VALUES (?, ?) "
+                     "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                     (name, json.dumps(value, ensure_ascii=False)))
+
+    @staticmethod
+    def _merge_app_item(conn, app_key, fields):
+        row = conn.execute("SELECT data FROM app_items WHERE app_key = ?", (app_key,)).fetchone()
+        data = json.loads(row[0]) if row else {}
+        data.update(fields)
+        conn.execute("INSERT INTO app_items (app_key, data) VALUES (?, ?) "
+                     "ON CONFLICT(app_key) DO UPDATE SET data = excluded.data",
+                     (app_key, json.dumps(data, ensure_ascii=False)))
+        return data
+
+    def load(self):
+        """Toàn bộ cấu hình theo đúng dạng app_config.json cũ: {'settings': {...}, 'app_items': {...}}."""
+        conn = self._connection()
+        settings = {name: json.loads(value) for name, value in conn.execute("SELECT name, value FROM settings")}
+        app_items = {app_key: json.loads(data) for app_key, data in conn.execute("SELECT app_key, data FROM app_items")}
+        return {'settings': settings, 'app_items': app_items}
+
+    def set_setting(self, name, value):
+        with self.transaction() as conn:
+            self._put_setting(conn, name, value)
+
+    def update_app_items(self, changes, dequeue=()):
+        """
+        Trộn {app_key: {trường: giá trị}} vào thông tin đã lưu của từng phần mềm trong một giao dịch,
+        cùng giao dịch đó bỏ các app trong dequeue khỏi nhật ký hàng đợi.
+        Trả về {app_key: thông tin đầy đủ sau khi trộn}.
+        """
+        with self.transaction() as conn:
+            merged = {app_key: self._merge_app_item(conn, app_key, fields) for app_key, fields in changes.items()}
+            conn.executemany("DELETE FROM download_queue WHERE app_key = ?", [(app_key,) for app_key in dequeue])
+            return merged
+
+    def update_app_item(self, app_key, **fields):
+        return self.update_app_items({app_key: fields})[app_key]
+
+    def journal_tasks(self, tasks):
+        """Ghi {app_key: {'action', 'info'}} vào nhật ký hàng đợi (ghi đè tác vụ cũ của cùng app)."""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany("INSERT INTO download_queue (app_key, action, info, queued_at) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT(app_key) DO UPDATE SET action = excluded.action, info = excluded.info",
+                             [(app_key, task['action'], json.dumps(task['info'], ensure_ascii=False), now)
+                              for app_key, task in tasks.items()])
+
+    def dequeue_tasks(self, app_keys):
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM download_queue WHERE app_key = ?", [(app_key,) for app_key in app_keys])
+
+    def pending_tasks(self):
+        """Các tác vụ còn trong nhật ký hàng đợi theo thứ tự được xếp: {app_key: {'action', 'info'}}."""
+        rows = self._connection().execute("SELECT app_key, action, info FROM download_queue ORDER BY queued_at, rowid")
+        return {app_key: {'action': action, 'info': json.loads(info)} for app_key, action, info in rows}
+
+CONFIG_STORE = ConfigStore(CONFIG_DB_FILE, CONFIG_FILE)
+
+@functools.lru_cache(maxsize=4096)
+def cached_version(version_text):
+    """parse_version có nhớ; chuỗi không hợp lệ được coi như '0' thay vì làm hỏng cả danh sách."""
+    try:
+        return parse_version(str(version_text))
+    except InvalidVersion:
+        return parse_version('0')
+
+def catalog_digest(catalog):
+    """SHA-256 của nội dung danh sách (JSON chuẩn hóa), không phụ thuộc ETag hay cách máy chủ định dạng."""
+    canonical = json.dumps(catalog, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class CatalogIndex:
+    """
+    Danh sách phần mềm đã biên dịch một lần cho mỗi phiên bản danh sách: phiên bản đã phân tích,
+    các app hợp từng kiến trúc, nhóm theo danh mục và thứ tự sắp xếp sẵn. Dựng danh sách chỉ còn
+    là duyệt các nhóm này, không phải lọc, sắp xếp và parse_version lại cho từng hàng.
+    """
+    __slots__ = ('catalog_hash', 'versions', 'groups', 'compatible')
+    ARCHES = ('32bit', '64bit')
+
+    def __init__(self, catalog_hash=None, versions=None, groups=None):
+        self.catalog_hash = catalog_hash
+        self.versions = versions or {} # app_key -> Version của danh sách máy chủ
+        self.groups = groups or {} # kiến trúc -> [(danh mục, [app_key theo display_name])], danh mục đã sắp xếp
+        self.compatible = {arch: frozenset(key for _, keys in category_groups for key in keys)
+                           for arch, category_groups in self.groups.items()}
+
+    @classmethod
+    def compile(cls, app_items, catalog_hash=None):
+        versions = {key: cached_version(info.get('version', '0')) for key, info in app_items.items()}
+        ordered = sorted(app_items, key=lambda key: app_items[key].get('display_name', ''))
+        groups = {}
+        for arch in cls.ARCHES:
+            by_category = {}
+            for key in ordered:
+                info = app_items[key]
+                if info.get('compatible_os_arch', 'both') in (arch, 'both'):
+                    by_category.setdefault(info.get('category', 'Chưa phân loại'), []).append(key)
+            groups[arch] = [(category, by_category[category]) for category in sorted(by_category)]
+        return cls(catalog_hash, versions, groups)
+
+    def to_dict(self):
+        return {'catalog_hash': self.catalog_hash, 'versions': self.versions, 'groups': self.groups}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['catalog_hash'], data['versions'], data['groups'])
+
+    def grouped(self, arch):
+        return self.groups.get(arch, [])
+
+    def is_compatible(self, key, arch):
+        return key in self.compatible.get(arch, ())
+
+    def version(self, key):
+        return self.versions.get(key) or cached_version('0')
+
+    def updated(self, app_items, changed_keys, catalog_hash=None):
+        """
+        Index mới sau khi các app trong changed_keys được thêm, sửa hoặc xóa (app_items là danh sách mới).
+        Chỉ các app đó được phân tích phiên bản và chèn lại đúng chỗ, phần còn lại giữ nguyên thứ tự.
+        """
+        versions = dict(self.versions)
+        for key in changed_keys:
+            if key in app_items:
+                versions[key] = cached_version(app_items[key].get('version', '0'))
+            else:
+                versions.pop(key, None)
+        display_name = lambda key: app_items[key].get('display_name', '')
+        groups = {}
+        for arch in self.ARCHES:
+            by_category = {category: [key for key in keys if key not in changed_keys]
+                           for category, keys in self.groups.get(arch, [])}
+            for key in changed_keys:
+                info = app_items.get(key)
+                if info is not None and info.get('compatible_os_arch', 'both') in (arch, 'both'):
+                    bisect.insort(by_category.setdefault(info.get('category', 'Chưa phân loại'), []), key, key=display_name)
+            groups[arch] = [(category, by_category[category]) for category in sorted(by_category) if by_category[category]]
+        return CatalogIndex(catalog_hash, versions, groups)
+
+class CatalogCache:
+    """
+    Bộ nhớ đệm cho danh sách phần mềm từ máy chủ.
+    Lưu nội dung cùng ETag/Last-Modified xuống đĩa, hỏi lại máy chủ bằng
+    If-None-Match/If-Modified-Since và dùng lại bản đã phân tích khi nhận 304.
+    Trong thời gian TTL thì không gửi yêu cầu nào.
+    Kèm theo là CatalogIndex, biên dịch một lần cho mỗi nội dung danh sách (theo SHA-256) và lưu
+    cùng danh sách vào index_file, nên lần khởi động sau không phải phân tích JSON hay biên dịch lại.
+
+    Nếu danh sách có revision toàn cục (và rev cho từng mục), lần hỏi sau gửi ?since=<revision> để
+    máy chủ chỉ trả các mục đổi từ đó: {"revision", "since", "app_items": {mục đổi}, "removed": [key]}.
+    Máy chủ tĩnh bỏ qua tham số và trả cả danh sách; delta không nối tiếp bản đang có thì tải lại toàn bộ.
+    """
+    SNAPSHOT_FORMAT = 1
+
+    def __init__(self, url, cache_file, ttl=CATALOG_CACHE_TTL, index_file=None):
+        self.url = url
+        self.cache_file = Path(cache_file)
+        self.index_file = Path(index_file) if index_file else None
+        self.ttl = ttl
+        self.catalog = None
+        self.catalog_hash = None
+        self.index = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0 # time.time() của lần xác nhận gần nhất với máy chủ
+        self._lock = threading.Lock()
+        self._load()
+
+    def _cache_file_signature(self):
+        try:
+            st = self.cache_file.stat()
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _read_snapshot(self):
+        """Bản biên dịch đã lưu, với 'index' là CatalogIndex; None nếu không có hoặc không dùng được."""
+        if self.index_file is None:
+            return None
+        try:
+            with open(self.index_file, 'rb') as f:
+                snapshot = pickle.load(f)
+            if not isinstance(snapshot, dict) or snapshot.get('format') != self.SNAPSHOT_FORMAT or snapshot.get('url') != self.url:
+                return None
+            if not isinstance(snapshot['catalog'], dict) or not isinstance(snapshot['catalog_hash'], str):
+                return None
+            snapshot['index'] = CatalogIndex.from_dict(snapshot['index'])
+        except FileNotFoundError:
+            return None # Lần chạy đầu: chưa có bản biên dịch
+        except Exception as e:
+            # File hỏng hoặc do phiên bản khác ghi thì pickle có thể ném đủ loại lỗi: bỏ qua và biên dịch lại
+            print(f"Bỏ qua bản biên dịch danh sách phần mềm không đọc được: {e!r}")
+            return None
+        return snapshot
+
+    def _load(self):
+        snapshot = self._read_snapshot()
+        if snapshot is not None and snapshot.get('source') == self._cache_file_signature():
+            # catalog_cache.json không đổi kể từ lần lưu bản biên dịch: dùng luôn, khỏi phân tích JSON
+            self.catalog = snapshot['catalog']
+            self.catalog_hash = snapshot['catalog_hash']
+            self.index = snapshot['index']
+            self.etag = snapshot.get('etag')
+            self.last_modified = snapshot.get('last_modified')
+            self.fetched_at = float(snapshot.get('fetched_at', 0))
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get('url') != self.url or not isinstance(data.get('catalog'), dict):
+            return
+        self.catalog = data['catalog']
+        self.etag = data.get('etag')
+        self.last_modified = data.get('last_modified')
+        self.fetched_at = float(data.get('fetched_at', 0))
+        self.catalog_hash = data.get('sha256') or catalog_digest(self.catalog)
+        if snapshot is not None and snapshot.get('catalog_hash') == self.catalog_hash:
+            self.index = snapshot['index'] # Chỉ siêu dữ liệu đổi (ví dụ sau 304)
+        self._compile()
+        self._save_snapshot()
+
+    def _compile(self):
+        if self.index is None or self.index.catalog_hash != self.catalog_hash:
+            self.index = CatalogIndex.compile(self.catalog.get('app_items', {}), self.catalog_hash)
+
+    def _save(self):
+        data = {
+            'url': self.url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'fetched_at': self.fetched_at,
+            'sha256': self.catalog_hash,
+            'catalog': self.catalog,
+        }
+        tmp_file = self.cache_file.with_name(self.cache_file.name + '.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                # json.dumps dùng bộ mã hóa C; json.dump ghi từng mảnh bằng Python, chậm hơn nhiều với danh sách lớn
+                f.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Không thể lưu bộ nhớ đệm danh sách phần mềm: {e}")
+            return
+        self._save_snapshot()
+
+    def _save_snapshot(self):
+        if self.index_file is None or self.index is None:
+            return
+        snapshot = {
+            'format': self.SNAPSHOT_FORMAT,
+            'url': self.url,
+            'source': self._cache_file_signature(), # Bản biên dịch chỉ hợp lệ khi catalog_cache.json còn y nguyên
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'fetched_at': self.fetched_at,
+            'catalog_hash': self.catalog_hash,
+            'catalog': self.catalog,
+            'index': self.index.to_dict(),
+        }
+        tmp_file = self.index_file.with_name(self.index_file.name + '.tmp')
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.index_file)
+        except (OSError, pickle.PickleError) as e:
+            print(f"Không thể lưu bản biên dịch danh sách phần mềm: {e}")
+
+    def index_for(self, catalog):
+        """CatalogIndex của catalog nếu đó là bản hiện tại của bộ nhớ đệm, None nếu không."""
+        return self.index if catalog is self.catalog else None
+
+    def is_fresh(self):
+        return self.catalog is not None and (time.time() - self.fetched_at) < self.ttl
+
+    def revision(self):
+        """Revision toàn cục của danh sách đang có, None nếu danh sách không có revision."""
+        revision = (self.catalog or {}).get('revision')
+        return revision if isinstance(revision, int) else None
+
+    @staticmethod
+    def _parse(response):
+        try:
+            return response.json()
+        except ValueError as e:
+            raise requests.RequestException(f"Danh sách phần mềm không hợp lệ: {e}")
+
+    def _apply_full(self, catalog):
+        catalog_hash = catalog_digest(catalog)
+        if catalog_hash == self.catalog_hash:
+            return False
+        self.catalog = catalog
+        self.catalog_hash = catalog_hash
+        self._compile()
+        return True
+
+    def _apply_delta(self, delta, revision):
+        """Áp dụng delta lên danh sách đang có; None nếu delta không nối tiếp revision hiện tại."""
+        if delta.get('since') != revision or not isinstance(delta.get('revision'), int):
+            return None
+        changed_items = delta.get('app_items') or {}
+        removed = delta.get('removed') or []
+        if delta['revision'] == revision and not changed_items and not removed:
+            return False
+        app_items = dict(self.catalog.get('app_items', {}))
+        for key in removed:
+            app_items.pop(key, None)
+        app_items.update(changed_items)
+        self.catalog = {**self.catalog, 'revision': delta['revision'], 'app_items': app_items}
+        self.catalog_hash = catalog_digest(self.catalog)
+        if self.index is not None:
+            self.index = self.index.updated(app_items, set(changed_items) | set(removed), self.catalog_hash)
+        self._compile()
+        return bool(changed_items or removed)
+
+    def fetch(self, session, force=False, timeout=10):
+        """
+        Trả về (catalog, changed). changed=False khi dùng lại bản trong bộ nhớ đệm.
+        Ném requests.RequestException nếu không liên lạc được máy chủ.
+        """
+        with self._lock:
+            if not force and self.is_fresh():
+                return self.catalog, False
+
+            headers = {}
+            if self.catalog is not None:
+                if self.etag:
+                    headers['If-None-Match'] = self.etag
+                if self.last_modified:
+                    headers['If-Modified-Since'] = self.last_modified
+            revision = self.revision()
+            params = {'since': revision} if revision is not None else None
+
+            response = session.get(self.url, params=params, headers=headers, timeout=timeout)
+            if response.status_code == 304 and self.catalog is not None:
+                self.fetched_at = time.time()
+                self._save()
+                return self.catalog, False
+
+            response.raise_for_status()
+            payload = self._parse(response)
+            changed = None
+            if revision is not None and 'since' in payload:
+                changed = self._apply_delta(payload, revision)
+                if changed is None:
+                    print("Delta danh sách phần mềm không nối tiếp bản đang có, tải lại toàn bộ.")
+                    response = session.get(self.url, timeout=timeout)
+                    response.raise_for_status()
+                    payload = self._parse(response)
+            if changed is None:
+                changed = self._apply_full(payload)
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            self.fetched_at = time.time()
+            self._save()
+            return self.catalog, changed
+
 class CliProgressWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -100,37 +1196,91 @@ class CliProgressWindow(QWidget):
         self.log_output.verticalScrollBar().setValue(self.log_output.verticalScrollBar().maximum())
 
 
+class ReleaseMetadataCache:
+    """
+    Bộ nhớ đệm thông tin release trên GitHub (TTL + ETag) trong Tools/releases_cache.json.
+    Trong TTL không gọi API; hết TTL thì hỏi lại bằng If-None-Match,
+    câu trả lời 304 không bị tính vào giới hạn lượt gọi của GitHub.
+    """
+    def __init__(self, cache_file, ttl=TOOL_CHECK_TTL):
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+
+    def is_fresh(self, api_url):
+        entry = self._entries.get(api_url)
+        return bool(entry) and (time.time() - entry.get('fetched_at', 0)) < self.ttl
+
+    def get(self, session, api_url):
+        """Trả về thông tin release mới nhất, chỉ gọi API khi bộ nhớ đệm đã hết hạn."""
+        entry = self._entries.get(api_url)
+        if entry and self.is_fresh(api_url):
+            return entry['release']
+
+        headers = {'If-None-Match': entry['etag']} if entry and entry.get('etag') else {}
+        response = session.get(api_url, headers=headers)
+        if response.status_code == 304 and entry:
+            entry['fetched_at'] = time.time()
+        else:
+            response.raise_for_status()
+            entry = {'etag': response.headers.get('ETag'), 'fetched_at': time.time(), 'release': response.json()}
+        with self._lock:
+            self._entries[api_url] = entry
+            self._save()
+        return entry['release']
+
+    def _save(self):
+        tmp_file = self.cache_file.with_name(self.cache_file.name + '.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Không thể lưu bộ nhớ đệm thông tin công cụ: {e}")
+
 # --- NEW: Lớp quản lý và cập nhật công cụ ---
 class ToolManager(QObject):
     progress_update = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
 
+    DOWNLOAD_CHUNK = 1024 * 1024
+
     def __init__(self):
         super().__init__()
-        self.session = requests.Session()
-        # GitHub API cần User-Agent
-        self.session.headers.update({'User-Agent': 'TekDT-AIS-App'})
+        self.session = get_http_session()
+        self.release_cache = ReleaseMetadataCache(TOOL_RELEASE_CACHE_FILE)
 
     def run_checks(self):
         tools_present = ARIA2_EXEC.exists() and SEVENZ_EXEC.exists()
-        is_online = False
 
-        # 1. Kiểm tra kết nối mạng một cách an toàn
-        try:
-            self.progress_update.emit("Kiểm tra kết nối internet...")
-            self.session.get("https://www.google.com", timeout=5)
-            is_online = True
+        # 0. Đã kiểm tra gần đây và đủ công cụ: không cần gửi request nào
+        # (7za.exe có từ bản cũ mà chưa có 7zr.exe thì đó là 7zr đổi tên: cần tải lại bản đầy đủ)
+        if (tools_present and SEVENZR_EXEC.exists()
+                and all(self.release_cache.is_fresh(url) for url in (SEVENZIP_API_URL, ARIA2_API_URL))):
+            self.finished.emit(True, "Công cụ đã được kiểm tra gần đây.")
+            return
+
+        # 1. Kiểm tra kết nối mạng (dùng trạng thái đã biết nếu còn mới)
+        self.progress_update.emit("Kiểm tra kết nối internet...")
+        is_online = CONNECTIVITY.is_online()
+        if is_online:
             self.progress_update.emit("Đã kết nối internet. Kiểm tra cập nhật công cụ...")
-        except requests.ConnectionError:
+        else:
             self.progress_update.emit("Không có internet. Sử dụng công cụ có sẵn (nếu có).")
-            is_online = False
 
         # 2. Xử lý logic dựa trên trạng thái online và sự tồn tại của công cụ
         if is_online:
-            # Nếu online, luôn cố gắng cập nhật công cụ
+            # Nếu online, luôn cố gắng cập nhật công cụ (hai công cụ được kiểm tra song song)
             try:
-                self._check_7zip()
-                self._check_aria2()
+                with ThreadPoolExecutor(max_workers=2, thread_name_prefix='tool-check') as executor:
+                    futures = [executor.submit(self._check_7zip), executor.submit(self._check_aria2)]
+                for future in futures:
+                    future.result() # Ném lại lỗi (nếu có) của từng công cụ
                 self.finished.emit(True, "Kiểm tra công cụ hoàn tất.")
             except Exception as e:
                 # Nếu cập nhật thất bại nhưng công cụ đã có sẵn, vẫn có thể tiếp tục
@@ -146,47 +1296,67 @@ class ToolManager(QObject):
                 # Offline và thiếu công cụ -> Lỗi nghiêm trọng
                 self.finished.emit(False, "Thiếu công cụ và không có internet để tải. Vui lòng kết nối mạng và khởi động lại.")
 
+    def _download_to_file(self, url, dest_path):
+        """Tải file theo từng khối xuống đĩa để bộ nhớ không tăng theo kích thước file."""
+        with self.session.get(url, stream=True) as response:
+            response.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK):
+                    f.write(chunk)
+
     def _check_7zip(self):
         tool_dir = SEVENZ_DIR
         exec_file = SEVENZ_EXEC
         tool_name = "7-Zip"
         api_url = SEVENZIP_API_URL
         asset_name = '7zr.exe'
+        extra_pattern = re.compile(r'7z\d+-extra\.7z') # Chứa 7za.exe, bản console đọc/ghi được zip, cab, tar...
         tool_dir.mkdir(exist_ok=True, parents=True)
         version_file = tool_dir / ".version"
         local_version = version_file.read_text().strip() if version_file.exists() else "0"
-        response = self.session.get(api_url)
-        response.raise_for_status()
-        latest_release = response.json()
+        latest_release = self.release_cache.get(self.session, api_url)
         remote_version = latest_release['tag_name']
 
-        if remote_version != local_version or not exec_file.exists():
+        if remote_version != local_version or not exec_file.exists() or not SEVENZR_EXEC.exists():
             self.progress_update.emit(f"Đang tìm {tool_name} phiên bản {remote_version}...")
 
             download_url = ""
+            extra_url = ""
             for asset in latest_release['assets']:
                 if asset['name'] == asset_name:
                     download_url = asset['browser_download_url']
-                    break
+                elif extra_pattern.fullmatch(asset['name']):
+                    extra_url = asset['browser_download_url']
 
-            if not download_url:
-                raise Exception(f"Không tìm thấy file tải về '{asset_name}' cho {tool_name}")
+            if not download_url or not extra_url:
+                raise Exception(f"Không tìm thấy file tải về '{asset_name}' và gói extra cho {tool_name}")
 
             self.progress_update.emit(f"Đang tải {tool_name} ({asset_name})...")
 
-            # Tải file thực thi
-            file_response = self.session.get(download_url)
-            file_response.raise_for_status()
-            file_content = file_response.content
-
-            for item in tool_dir.iterdir():
-                if item.is_file(): item.unlink()
-                elif item.is_dir(): shutil.rmtree(item)
-            
-            # Lưu trực tiếp file thực thi (7zr.exe) với tên là 7za.exe
-            self.progress_update.emit(f"Đang cài đặt {tool_name}...")
-            with open(exec_file, 'wb') as f:
-                f.write(file_content)
+            # Tải vào file tạm rồi thay thế nguyên tử, file cũ vẫn dùng được nếu tải lỗi
+            tmp_file = SEVENZR_EXEC.with_name(SEVENZR_EXEC.name + '.tmp')
+            extra_archive = tool_dir / "extra.7z.tmp"
+            staging_dir = tool_dir / ".extra-staging"
+            try:
+                self._download_to_file(download_url, tmp_file)
+                os.replace(tmp_file, SEVENZR_EXEC)
+
+                # 7zr chỉ đọc được .7z: dùng nó giải nén gói extra để lấy 7za.exe đầy đủ
+                self.progress_update.emit(f"Đang tải {tool_name} ({Path(extra_url).name})...")
+                self._download_to_file(extra_url, extra_archive)
+                self.progress_update.emit(f"Đang cài đặt {tool_name}...")
+                if staging_dir.exists():
+                    shutil.rmtree(staging_dir)
+                result = subprocess.run([str(SEVENZR_EXEC), 'x', str(extra_archive), f'-o{staging_dir}', '-y', '-bso0', '-bsp0'],
+                                        capture_output=True, creationflags=CREATE_NO_WINDOW)
+                if result.returncode != 0 or not (staging_dir / exec_file.name).is_file():
+                    raise Exception(f"Không giải nén được {exec_file.name} từ gói extra của {tool_name} "
+                                    f"(mã lỗi: {result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+                os.replace(staging_dir / exec_file.name, exec_file)
+            finally:
+                tmp_file.unlink(missing_ok=True)
+                extra_archive.unlink(missing_ok=True)
+                shutil.rmtree(staging_dir, ignore_errors=True)
 
             version_file.write_text(remote_version)
             self.progress_update.emit(f"Đã cập nhật {tool_name} thành công!")
@@ -203,9 +1373,7 @@ class ToolManager(QObject):
         version_file = tool_dir / ".version"
         local_version = version_file.read_text().strip() if version_file.exists() else "0"
 
-        response = self.session.get(api_url)
-        response.raise_for_status()
-        latest_release = response.json()
+        latest_release = self.release_cache.get(self.session, api_url)
         remote_version = latest_release['tag_name']
 
         if remote_version != local_version or not exec_file.exists():
@@ -219,25 +1387,38 @@ class ToolManager(QObject):
             
             if not download_url:
                 raise Exception(f"Không tìm thấy file tải về phù hợp cho {tool_name}")
-                
-            # Tải file
-            file_response = self.session.get(download_url)
-            file_response.raise_for_status()
-            file_content = file_response.content
-            file_name = Path(download_url).name
 
-            # Giải nén
-            self.progress_update.emit(f"Đang giải nén {tool_name}...")
-            if tool_dir.exists():
-                shutil.rmtree(tool_dir)
-            
-            with zipfile.ZipFile(io.BytesIO(file_content)) as zf:
+            file_name = Path(download_url).name
+            zip_path = TOOLS_DIR / f"{file_name}.tmp"
+            staging_dir = TOOLS_DIR / ".aria2-staging"
+            old_dir = TOOLS_DIR / ".aria2-old"
+            try:
+                # Tải file zip xuống đĩa thay vì giữ trong bộ nhớ
+                self._download_to_file(download_url, zip_path)
+
+                # Giải nén vào thư mục tạm
+                self.progress_update.emit(f"Đang giải nén {tool_name}...")
+                for leftover in (staging_dir, old_dir):
+                    if leftover.exists():
+                        shutil.rmtree(leftover)
+                with zipfile.ZipFile(zip_path) as zf:
+                    zf.extractall(staging_dir)
                 # Tên thư mục bên trong file zip thường là tên file không có .zip
-                extracted_folder_name = file_name.removesuffix('.zip')
-                zf.extractall(TOOLS_DIR)
-                (TOOLS_DIR / extracted_folder_name).rename(tool_dir)
+                extracted_dir = staging_dir / file_name.removesuffix('.zip')
+                if not (extracted_dir / exec_file.name).exists():
+                    raise Exception(f"File tải về của {tool_name} không chứa {exec_file.name}")
+                (extracted_dir / ".version").write_text(remote_version)
+
+                # Hoán đổi thư mục: bản cũ chỉ bị xóa sau khi bản mới đã vào đúng chỗ
+                if tool_dir.exists():
+                    tool_dir.rename(old_dir)
+                extracted_dir.rename(tool_dir)
+            finally:
+                zip_path.unlink(missing_ok=True)
+                for leftover in (staging_dir, old_dir):
+                    if leftover.exists():
+                        shutil.rmtree(leftover, ignore_errors=True)
 
-            version_file.write_text(remote_version)
             self.progress_update.emit(f"Đã cập nhật {tool_name} thành công!")
         else:
             self.progress_update.emit(f"{tool_name} đã là phiên bản mới nhất.")
@@ -248,13 +1429,208 @@ class WorkerSignals(QObject):
     finished = pyqtSignal()
     progress = pyqtSignal(str, str, str)
     error = pyqtSignal(str)
-    progress_percentage = pyqtSignal(str, float)
     update_widget_status = pyqtSignal(str, str)
     tasks_batch_completed = pyqtSignal(dict) 
+    stage_depths = pyqtSignal(dict) # {'downloading', 'ready', 'installing', 'done'}
+
+class ProgressBus(QObject):
+    """
+    Gom tiến độ tải từ mọi luồng: mỗi app chỉ giữ giá trị mới nhất, và giao diện nhận
+    một lô {app_key: phần trăm} tối đa FRAME_RATE lần mỗi giây thay vì một tín hiệu cho mỗi dòng aria2.
+    Phải được tạo lần đầu trên luồng giao diện.
+    """
+    progress_batch = pyqtSignal(dict) # {app_key: phần trăm}
+    _wake = pyqtSignal()
+
+    FRAME_RATE = 20
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self._pending = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(1000 // self.FRAME_RATE)
+        self._timer.timeout.connect(self._flush)
+        # Gọi từ luồng khác sẽ được xếp hàng về luồng giao diện
+        self._wake.connect(self._schedule)
+
+    def post(self, app_key, percentage):
+        """Ghi nhận tiến độ mới nhất của app_key; an toàn khi gọi từ bất kỳ luồng nào."""
+        with self._lock:
+            self._pending[app_key] = percentage
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._wake.emit()
+
+    def discard(self, app_key):
+        """Bỏ giá trị đang chờ của app_key (ví dụ khi app đã xong, để không vẽ lại tiến độ cũ)."""
+        with self._lock:
+            self._pending.pop(app_key, None)
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._scheduled = False
+        if batch:
+            self.progress_batch.emit(batch)
+
+class ProcessOutputMux:
+    """
+    Một luồng duy nhất chạy vòng lặp asyncio để đọc output của mọi tiến trình con chạy dài
+    (aria2c, 7za), thay vì mỗi tiến trình cần hai luồng đọc và một vòng lặp kiểm tra định kỳ.
+    Tiến độ được phân tích ngay khi có output mới; stderr chỉ giữ STDERR_TAIL_LINES dòng cuối để gỡ lỗi.
+    (Dùng asyncio thay cho selectors vì trên Windows selectors không chờ được pipe.)
+    """
+    STDERR_TAIL_LINES = 50
+    ARIA2_PROGRESS = re.compile(rb'\[.*?\((\d+)%\)') # [#gid 1.0MiB/2.0MiB(50%) ...]
+    SEVENZIP_PROGRESS = re.compile(rb'^\s*(\d+)%') # " 45% 3 - file" của 7za -bsp1
+    # 7za vẽ lại dòng tiến độ bằng \b thay vì xuống dòng
+    SEGMENT_SEPARATOR = re.compile(rb'[\r\n\b]+')
+    READ_CHUNK = 4096
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        # Chỉ truy cập trong luồng vòng lặp
+        self._processes = {} # app_key -> asyncio.subprocess.Process
+        self._stopping = set() # app_key bị yêu cầu dừng khi tiến trình còn đang khởi chạy
+        self._loop = asyncio.ProactorEventLoop() if sys.platform == 'win32' else asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ProcessOutputMux", daemon=True)
+        self._thread.start()
+
+    def spawn(self, app_key, command, cwd, on_exit, progress_pattern=ARIA2_PROGRESS):
+        """
+        Chạy lệnh và theo dõi output trong luồng vòng lặp; phần trăm khớp progress_pattern
+        trên stdout được gửi vào ProgressBus dưới tên app_key.
+        on_exit(returncode, stderr_tail) luôn được gọi đúng một lần từ luồng đó khi tiến trình kết thúc;
+        returncode là None nếu không khởi chạy được hoặc không đọc được output (tiến trình bị dừng hẳn).
+        """
+        asyncio.run_coroutine_threadsafe(self._watch(app_key, command, cwd, on_exit, progress_pattern), self._loop)
+
+    def run(self, app_key, command, cwd=None, progress_pattern=ARIA2_PROGRESS):
+        """Như spawn nhưng chờ tiến trình kết thúc và trả về (returncode, stderr_tail). Không gọi từ luồng vòng lặp."""
+        done = threading.Event()
+        result = []
+        def on_exit(returncode, stderr_tail):
+            result.extend((returncode, stderr_tail))
+            done.set()
+        self.spawn(app_key, command, cwd, on_exit, progress_pattern)
+        done.wait()
+        return tuple(result)
+
+    def terminate(self, app_key):
+        """Yêu cầu dừng tiến trình của app_key; an toàn khi gọi từ bất kỳ luồng nào."""
+        self._loop.call_soon_threadsafe(self._terminate, app_key)
+
+    def _terminate(self, app_key):
+        process = self._processes.get(app_key)
+        if process is None:
+            self._stopping.add(app_key)
+        elif process.returncode is None:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass # Tiến trình có thể đã kết thúc rồi
 
-class AriaDownloader(QThread):
-    # Tín hiệu trả về app_key để biết tiến trình của app nào
-    progress_percentage = pyqtSignal(str, float)
+    async def _watch(self, app_key, command, cwd, on_exit, progress_pattern):
+        stderr_tail = collections.deque(maxlen=self.STDERR_TAIL_LINES)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, # Bắt cả stderr để gỡ lỗi
+                cwd=cwd,
+                creationflags=DETACHED_PROCESS | CREATE_NO_WINDOW
+            )
+        except Exception as e:
+            self._stopping.discard(app_key)
+            stderr_tail.append(str(e))
+            on_exit(None, stderr_tail)
+            return
+
+        self._processes[app_key] = process
+        if app_key in self._stopping:
+            self._stopping.discard(app_key)
+            self._terminate(app_key)
+        returncode = None
+        try:
+            await asyncio.gather(self._read_progress(app_key, process.stdout, progress_pattern),
+                                 self._read_tail(process.stderr, stderr_tail))
+            returncode = await process.wait()
+        except Exception as e:
+            # Không đọc được output thì không theo dõi tiếp được: dừng hẳn tiến trình và báo thất bại,
+            # nếu không run() sẽ chờ mãi và giữ chỗ (cùng install_mutex) của tác vụ
+            stderr_tail.append(f"Lỗi khi đọc output: {e!r}\n")
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+            await process.wait()
+        finally:
+            self._processes.pop(app_key, None)
+            on_exit(returncode, stderr_tail)
+
+    async def _read_progress(self, app_key, stream, pattern):
+        progress_bus = ProgressBus.instance()
+        last_percentage = None
+        pending = b''
+        while True:
+            chunk = await stream.read(self.READ_CHUNK)
+            # Đoạn cuối chưa có dấu ngắt có thể chưa đủ, để dành cho lần đọc sau (trừ khi đã hết output)
+            *segments, pending = self.SEGMENT_SEPARATOR.split(pending + chunk)
+            if not chunk:
+                segments.append(pending)
+            pending = pending[-self.READ_CHUNK:] # Output không có dấu ngắt: chỉ giữ phần cuối
+            for segment in segments:
+                match = pattern.search(segment)
+                if match and float(match.group(1)) != last_percentage:
+                    last_percentage = float(match.group(1))
+                    progress_bus.post(app_key, last_percentage)
+            if not chunk:
+                return
+
+    async def _read_tail(self, stream, tail):
+        # Đọc theo khối thay vì theo dòng: StreamReader báo lỗi với dòng dài hơn giới hạn 64 KiB của nó
+        pending = b''
+        while True:
+            chunk = await stream.read(self.READ_CHUNK)
+            *lines, pending = (pending + chunk).split(b'\n')
+            for line in lines:
+                tail.append(line.decode('utf-8', errors='ignore') + '\n')
+            if not chunk:
+                if pending:
+                    tail.append(pending.decode('utf-8', errors='ignore'))
+                return
+            pending = pending[-self.READ_CHUNK:] # Dòng quá dài: chỉ giữ phần cuối
+
+class AriaDownloader(QObject):
+    """Một tác vụ tải bằng tiến trình aria2c riêng; output được ProcessOutputMux đọc chung."""
     finished = pyqtSignal(str, bool) # app_key, success
 
     def __init__(self, app_key, command, cwd):
@@ -263,206 +1639,938 @@ class AriaDownloader(QThread):
         self.command = command
         self.cwd = cwd
         self._is_stopped = False
-        self.process = None
+
+    def start(self):
+        ProcessOutputMux.instance().spawn(self.app_key, self.command, self.cwd, self._on_exit)
 
     def stop(self):
         self._is_stopped = True
-        if self.process:
-            # Gửi tín hiệu terminate đến tiến trình aria2
+        ProcessOutputMux.instance().terminate(self.app_key)
+
+    def _on_exit(self, returncode, stderr_tail):
+        if self._is_stopped:
+            self.finished.emit(self.app_key, False)
+        elif returncode == 0:
+            ProgressBus.instance().post(self.app_key, 100.0)
+            self.finished.emit(self.app_key, True)
+        elif returncode is None:
+            print(f"Ngoại lệ trong AriaDownloader cho {self.app_key}: {''.join(stderr_tail)}")
+            self.finished.emit(self.app_key, False)
+        else:
+            print(f"Lỗi tải {self.app_key} (mã lỗi: {returncode}): {''.join(stderr_tail)}")
+            self.finished.emit(self.app_key, False)
+
+class Aria2RpcError(Exception):
+    """Lỗi khi khởi động hoặc giao tiếp với daemon aria2 RPC."""
+
+def _find_free_port():
+    """Xin hệ điều hành một cổng TCP còn trống trên localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class Aria2RpcDaemon:
+    """
+    Quản lý một tiến trình aria2c (--enable-rpc) duy nhất cho cả phiên làm việc
+    và giao tiếp với nó qua JSON-RPC trên localhost.
+    """
+    def __init__(self, exec_path=ARIA2_EXEC, session_file=ARIA2_SESSION_FILE):
+        self.exec_path = exec_path
+        self.session_file = Path(session_file)
+        self.restored = {} # đường dẫn file -> (gid, {uri}) của tác vụ dở dang nạp lại từ session_file
+        self.process = None
+        self.port = None
+        self.secret = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        # Không đi qua proxy hệ thống khi gọi tới localhost
+        self.session.trust_env = False
+
+    @property
+    def rpc_url(self):
+        return f"http://127.0.0.1:{self.port}/jsonrpc"
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, max_concurrent=DEFAULT_MAX_CONCURRENT_DOWNLOADS, timeout=10):
+        with self._lock:
+            if self.is_running():
+                return
+            if not Path(self.exec_path).exists():
+                raise Aria2RpcError(f"Không tìm thấy {self.exec_path}")
+
+            self.port = _find_free_port()
+            self.secret = secrets.token_hex(16)
+            command = [
+                str(self.exec_path), "--enable-rpc", "--rpc-listen-all=false",
+                f"--rpc-listen-port={self.port}", f"--rpc-secret={self.secret}",
+                f"--max-concurrent-downloads={max_concurrent}",
+                # aria2 tự thoát nếu chương trình chính bị tắt đột ngột
+                f"--stop-with-process={os.getpid()}",
+                "--show-console-readout=false", "--summary-interval=0",
+                # Tác vụ dở dang được ghi vào session và nạp lại ở trạng thái tạm dừng khi khởi động,
+                # chờ AriaDownloadManager nhận lại (claim_restored) rồi tải tiếp từ file .aria2
+                "--continue=true", "--pause=true",
+                f"--save-session={self.session_file}",
+                f"--save-session-interval={ARIA2_SESSION_SAVE_INTERVAL}",
+            ]
+            if self.session_file.is_file():
+                command.append(f"--input-file={self.session_file}")
             try:
-                self.process.terminate()
-            except ProcessLookupError:
-                pass # Tiến trình có thể đã kết thúc rồi
+                self.process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    creationflags=CREATE_NO_WINDOW
+                )
+            except OSError as e:
+                self.process = None
+                raise Aria2RpcError(f"Không thể khởi động aria2 RPC: {e}")
+
+            # Đợi đến khi cổng RPC sẵn sàng nhận lệnh
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    self.call('getVersion')
+                    break
+                except (requests.RequestException, Aria2RpcError):
+                    if self.process.poll() is not None or time.monotonic() > deadline:
+                        self._kill()
+                        raise Aria2RpcError("aria2 RPC không phản hồi.")
+                    time.sleep(0.1)
+            self.restored = self._load_restored()
+
+    @staticmethod
+    def _path_key(path):
+        return os.path.normcase(os.path.abspath(path))
 
-    def _enqueue_output(self, pipe, q):
+    def _load_restored(self):
+        """Các tác vụ aria2 vừa nạp lại từ session_file (đang tạm dừng), theo đường dẫn file đích."""
+        try:
+            waiting = self.call('tellWaiting', 0, 1000, ['gid', 'files'])
+        except (requests.RequestException, Aria2RpcError) as e:
+            print(f"Không đọc được các tác vụ tải dở dang từ session aria2: {e}")
+            return {}
+        restored = {}
+        for status in waiting or []:
+            files = status.get('files') or [{}]
+            if files[0].get('path'):
+                uris = {entry.get('uri') for entry in files[0].get('uris') or []}
+                restored[self._path_key(files[0]['path'])] = (status['gid'], uris)
+        return restored
+
+    def claim_restored(self, path, uris):
         """
-        Hàm này chạy trong một luồng riêng, chỉ đọc output từ pipe
-        và đưa vào queue.
+        gid của tác vụ dở dang nạp từ session cho file path, None nếu không có.
+        Tác vụ cũ tải từ URL khác (danh sách phần mềm đã đổi) bị bỏ thay vì tải tiếp.
         """
+        with self._lock:
+            gid, restored_uris = self.restored.pop(self._path_key(path), (None, set()))
+        if gid is not None and not restored_uris & set(uris):
+            self.remove(gid)
+            return None
+        return gid
+
+    def call(self, method, *params):
+        """Gọi một phương thức aria2.* (hoặc system.*) và trả về kết quả."""
+        full_method = method if method.startswith('system.') else f"aria2.{method}"
+        rpc_params = list(params)
+        if not full_method.startswith('system.'):
+            rpc_params.insert(0, f"token:{self.secret}")
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": full_method, "params": rpc_params}
+        response = self.session.post(self.rpc_url, json=payload, timeout=5)
+        data = response.json()
+        if 'error' in data:
+            raise Aria2RpcError(data['error'].get('message', str(data['error'])))
+        return data.get('result')
+
+    def multicall(self, calls):
+        """Gửi nhiều lệnh trong một lần gọi HTTP. calls: [(method, *params), ...]"""
+        batch = [
+            {"methodName": f"aria2.{method}", "params": [f"token:{self.secret}", *params]}
+            for method, *params in calls
+        ]
+        results = self.call('system.multicall', batch)
+        # Mỗi kết quả thành công được bọc trong một list một phần tử
+        return [r[0] if isinstance(r, list) else r for r in results]
+
+    def add_uri(self, uris, options):
+        return self.call('addUri', list(uris), options)
+
+    def tell_status(self, gid, keys=None):
+        return self.call('tellStatus', gid, keys) if keys else self.call('tellStatus', gid)
+
+    def remove(self, gid):
         try:
-            # Dùng iter để đọc từng dòng cho đến khi pipe được đóng
-            for line in iter(pipe.readline, b''):
-                q.put(line)
-        finally:
-            pipe.close()
+            self.call('forceRemove', gid)
+        except (requests.RequestException, Aria2RpcError):
+            pass # Tác vụ có thể đã kết thúc
 
-    def run(self):
+    def shutdown(self):
+        if not self.is_running():
+            return
         try:
-            self.process = subprocess.Popen(
-                self.command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE, # Bắt cả stderr để gỡ lỗi
-                cwd=self.cwd,
-                # Quan trọng: không dùng text=True, chúng ta sẽ tự decode
-                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NO_WINDOW
-            )
+            # Tác vụ nạp từ session mà không ai nhận lại trong phiên này thì bỏ, để session không phình mãi
+            with self._lock:
+                unclaimed, self.restored = self.restored, {}
+            for gid, _uris in unclaimed.values():
+                self.remove(gid)
+            # Ghi các tác vụ đang tải dở vào session để lần chạy sau tải tiếp
+            self.call('saveSession')
+            self.call('forceShutdown')
+            self.process.wait(timeout=5)
+        except (requests.RequestException, Aria2RpcError, subprocess.TimeoutExpired):
+            self._kill()
+        self.process = None
 
-            # Tạo một queue để giao tiếp giữa luồng đọc và luồng chính
-            q = queue.Queue()
+    def _kill(self):
+        if self.process:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+        self.process = None
 
-            # Tạo và bắt đầu luồng đọc output (stdout)
-            reader_thread = threading.Thread(target=self._enqueue_output, args=(self.process.stdout, q))
-            reader_thread.daemon = True # Luồng sẽ tự thoát khi chương trình chính thoát
-            reader_thread.start()
-            
-            # Tạo luồng đọc lỗi (stderr) để gỡ lỗi tốt hơn
-            error_q = queue.Queue()
-            error_reader_thread = threading.Thread(target=self._enqueue_output, args=(self.process.stderr, error_q))
-            error_reader_thread.daemon = True
-            error_reader_thread.start()
+class DownloadScheduler:
+    """
+    Hàng đợi ưu tiên toàn cục cho các tác vụ tải: giới hạn số tác vụ chạy đồng thời
+    và tổng số kết nối mở tới mỗi host. Khi một tác vụ xong, suất của nó được
+    chuyển cho tác vụ kế tiếp có host còn ngân sách kết nối.
+
+    Tác vụ có nhiều mirror bị tính kết nối cho mọi host trong đó: với split và
+    max-connection-per-server bằng nhau, aria2 có thể dồn hết kết nối vào bất kỳ mirror nào.
+    """
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+                 max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                 connections_per_download=DEFAULT_CONNECTIONS_PER_DOWNLOAD):
+        self._lock = threading.Lock()
+        self._pending = [] # heap: (priority, seq, job_id, hosts)
+        self._seq = itertools.count()
+        self._running = {} # job_id -> (hosts, connections)
+        self._host_usage = {} # host -> số kết nối đang dùng
+        self.configure(max_concurrent, max_connections_per_host, connections_per_download)
+
+    def configure(self, max_concurrent=None, max_connections_per_host=None, connections_per_download=None):
+        with self._lock:
+            if max_concurrent is not None:
+                self.max_concurrent = max(1, int(max_concurrent))
+            if max_connections_per_host is not None:
+                self.max_connections_per_host = max(1, int(max_connections_per_host))
+            if connections_per_download is not None:
+                self.connections_per_download = max(1, int(connections_per_download))
+
+    def submit(self, job_id, urls, priority=0):
+        """urls là một URL hoặc danh sách mirror của cùng một file."""
+        if isinstance(urls, str):
+            urls = [urls]
+        hosts = tuple(dict.fromkeys(urlparse(url).hostname or '' for url in urls)) or ('',)
+        with self._lock:
+            heapq.heappush(self._pending, (priority, next(self._seq), job_id, hosts))
+
+    def cancel(self, job_id):
+        """Bỏ tác vụ khỏi hàng đợi. Trả về True nếu tác vụ chưa được khởi chạy."""
+        with self._lock:
+            remaining = [entry for entry in self._pending if entry[2] != job_id]
+            if len(remaining) == len(self._pending):
+                return False
+            self._pending = remaining
+            heapq.heapify(self._pending)
+            return True
+
+    def admit(self):
+        """Lấy ra các tác vụ được phép chạy ngay. Trả về [(job_id, số kết nối), ...]."""
+        admitted = []
+        with self._lock:
+            deferred = []
+            while self._pending and len(self._running) < self.max_concurrent:
+                entry = heapq.heappop(self._pending)
+                _, _, job_id, hosts = entry
+                budget = min(self.max_connections_per_host - self._host_usage.get(host, 0) for host in hosts)
+                if budget <= 0:
+                    # Một host của tác vụ đã hết ngân sách, nhường suất cho tác vụ kế tiếp
+                    deferred.append(entry)
+                    continue
+                connections = min(self.connections_per_download, budget)
+                self._running[job_id] = (hosts, connections)
+                for host in hosts:
+                    self._host_usage[host] = self._host_usage.get(host, 0) + connections
+                admitted.append((job_id, connections))
+            for entry in deferred:
+                heapq.heappush(self._pending, entry)
+        return admitted
+
+    def release(self, job_id):
+        with self._lock:
+            hosts, connections = self._running.pop(job_id, ((), 0))
+            for host in hosts:
+                self._host_usage[host] -= connections
+                if self._host_usage[host] <= 0:
+                    del self._host_usage[host]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+class AriaDownloadManager(QObject):
+    """
+    Điều phối mọi tác vụ tải của phiên qua một daemon aria2 RPC duy nhất.
+    Tiến trình được lấy theo lô (tellActive + tellStopped) từ một luồng poll duy nhất,
+    thay vì mỗi phần mềm một tiến trình aria2c và hai luồng đọc output.
+    Tác vụ chỉ được gửi tới aria2 khi DownloadScheduler cấp suất và số kết nối.
+    Tiến độ được gửi thẳng vào ProgressBus.
+    """
+    finished = pyqtSignal(str, bool) # app_key, success
 
-            percentage_pattern = re.compile(r'\[.*?\((\d+)%\)')
-            
-            # Vòng lặp chính: xử lý dữ liệu từ queue và kiểm tra trạng thái tiến trình
-            # Vòng lặp này không bị block bởi I/O
-            while self.process.poll() is None:
-                if self._is_stopped:
-                    break
+    POLL_INTERVAL = 0.5
+    STATUS_KEYS = ['gid', 'status', 'totalLength', 'completedLength', 'errorCode', 'errorMessage']
 
-                try:
-                    # Lấy một dòng từ queue, không block.
-                    # Nếu queue rỗng, nó sẽ ném ra lỗi queue.Empty
-                    line_bytes = q.get_nowait()
-                    line_str = line_bytes.decode('utf-8', errors='ignore')
-                    
-                    match = percentage_pattern.search(line_str)
-                    if match:
-                        self.progress_percentage.emit(self.app_key, float(match.group(1)))
+    _instance = None
+    _instance_lock = threading.Lock()
 
-                except queue.Empty:
-                    # Queue rỗng, không sao cả, đợi một chút rồi thử lại
-                    time.sleep(0.1)
-            
-            # Đợi các luồng đọc kết thúc
-            reader_thread.join(timeout=1)
-            error_reader_thread.join(timeout=1)
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
 
-            # Sau khi tiến trình kết thúc, thu thập lỗi nếu có
-            error_output = "".join(line.decode('utf-8', errors='ignore') for line in list(error_q.queue))
+    @classmethod
+    def shutdown_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.shutdown()
+                cls._instance = None
 
-            if self._is_stopped:
-                self.finished.emit(self.app_key, False)
+    def __init__(self):
+        super().__init__()
+        self.daemon = Aria2RpcDaemon()
+        self.scheduler = DownloadScheduler()
+        self._jobs = {} # app_key -> (uris, options) đang chờ scheduler cấp suất
+        self._gids = {} # gid -> app_key
+        self._dispatching = set() # Đã được cấp suất, đang gửi lệnh tới aria2 (chưa có gid)
+        self._cancelled = set() # Bị huỷ khi đang ở _dispatching: gửi xong thì gỡ ngay
+        self._last_progress = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._poll_thread = None
+
+    def configure(self, max_concurrent=None, max_connections_per_host=None, connections_per_download=None):
+        """Cập nhật giới hạn của bộ lập lịch; áp dụng ngay cho các tác vụ đang chờ."""
+        self.scheduler.configure(max_concurrent, max_connections_per_host, connections_per_download)
+        if self.daemon.is_running():
+            try:
+                self.daemon.call('changeGlobalOption', {"max-concurrent-downloads": str(self.scheduler.max_concurrent)})
+            except (requests.RequestException, Aria2RpcError):
+                pass
+        self._dispatch()
+
+    def add_download(self, app_key, uris, options, priority=0):
+        """
+        Xếp một tác vụ tải vào hàng đợi (priority nhỏ hơn được tải trước).
+        Ném Aria2RpcError nếu daemon không khởi động được.
+        """
+        self.daemon.start(self.scheduler.max_concurrent)
+        with self._lock:
+            self._jobs[app_key] = (list(uris), dict(options))
+        self.scheduler.submit(app_key, uris, priority)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Gửi tới aria2 mọi tác vụ vừa được scheduler cấp suất."""
+        while True:
+            admitted = self.scheduler.admit()
+            if not admitted:
+                return
+            for app_key, connections in admitted:
+                with self._lock:
+                    uris, options = self._jobs.pop(app_key, (None, None))
+                    cancelled = app_key in self._cancelled
+                    self._cancelled.discard(app_key)
+                    if uris is not None and not cancelled:
+                        self._dispatching.add(app_key)
+                if uris is None or cancelled:
+                    self.scheduler.release(app_key)
+                    if cancelled:
+                        self.finished.emit(app_key, False)
+                    continue
+                options = dict(options)
+                options["max-connection-per-server"] = str(connections)
+                options["split"] = str(connections)
+                try:
+                    gid = None
+                    if "out" in options:
+                        gid = self.daemon.claim_restored(Path(options.get("dir", ".")) / options["out"], uris)
+                    if gid is not None:
+                        # Tải tiếp tác vụ dở dang của lần chạy trước với số kết nối mới
+                        self.daemon.multicall([
+                            ('changeOption', gid, {"max-connection-per-server": options["max-connection-per-server"],
+                                                   "split": options["split"]}),
+                            ('unpause', gid),
+                        ])
+                    else:
+                        gid = self.daemon.add_uri(uris, options)
+                        # Daemon chạy với --pause=true nên tác vụ mới cũng bắt đầu ở trạng thái tạm dừng
+                        self.daemon.call('unpause', gid)
+                except (requests.RequestException, Aria2RpcError) as e:
+                    print(f"Không thể gửi lệnh tải {app_key} tới aria2: {e}")
+                    with self._lock:
+                        self._dispatching.discard(app_key)
+                        self._cancelled.discard(app_key)
+                    self.scheduler.release(app_key)
+                    self.finished.emit(app_key, False)
+                    continue
+                with self._lock:
+                    self._gids[gid] = app_key
+                    self._dispatching.discard(app_key)
+                    cancelled = app_key in self._cancelled
+                    self._cancelled.discard(app_key)
+                    if self._poll_thread is None or not self._poll_thread.is_alive():
+                        self._stop_event.clear()
+                        self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+                        self._poll_thread.start()
+                if cancelled:
+                    # Bị huỷ trong lúc gửi lệnh: gỡ ngay, luồng poll báo finished(False) như tác vụ đang chạy
+                    self.daemon.remove(gid)
+
+    def cancel(self, app_key):
+        """Huỷ các tác vụ tải của app_key; tác vụ đang chạy sẽ được luồng poll báo finished(False)."""
+        if self.scheduler.cancel(app_key):
+            with self._lock:
+                self._jobs.pop(app_key, None)
+            self.finished.emit(app_key, False)
+            return
+        with self._lock:
+            if app_key in self._dispatching or app_key in self._jobs:
+                # Đã được cấp suất nhưng _dispatch chưa có gid: để _dispatch gỡ khi gửi xong
+                self._cancelled.add(app_key)
                 return
+            gids = [gid for gid, key in self._gids.items() if key == app_key]
+        for gid in gids:
+            self.daemon.remove(gid)
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._poll_thread and self._poll_thread.is_alive():
+            self._poll_thread.join(timeout=2)
+        with self._lock:
+            pending = list(self._gids.values()) + list(self._jobs)
+            self._gids.clear()
+            self._jobs.clear()
+        for app_key in pending:
+            self.scheduler.cancel(app_key)
+            self.scheduler.release(app_key)
+            self.finished.emit(app_key, False)
+        self.daemon.shutdown()
+
+    def _poll_loop(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                if not self._gids:
+                    self._poll_thread = None
+                    return
+                tracked = dict(self._gids)
 
-            if self.process.returncode == 0:
-                self.progress_percentage.emit(self.app_key, 100.0)
-                self.finished.emit(self.app_key, True)
-            else:
-                print(f"Lỗi tải {self.app_key} (mã lỗi: {self.process.returncode}): {error_output}")
-                self.finished.emit(self.app_key, False)
+            try:
+                active, stopped = self.daemon.multicall([
+                    ('tellActive', self.STATUS_KEYS),
+                    ('tellStopped', 0, 1000, self.STATUS_KEYS),
+                ])
+            except (requests.RequestException, Aria2RpcError, ValueError) as e:
+                if not self.daemon.is_running():
+                    print(f"Daemon aria2 RPC đã dừng bất thường: {e}")
+                    self._fail_all()
+                    return
+                self._stop_event.wait(self.POLL_INTERVAL)
+                continue
 
-        except Exception as e:
-            print(f"Ngoại lệ trong AriaDownloader cho {self.app_key}: {e}")
-            self.finished.emit(self.app_key, False)
+            for status in active or []:
+                app_key = tracked.get(status.get('gid'))
+                if app_key:
+                    self._report_progress(app_key, status)
+
+            for status in stopped or []:
+                gid = status.get('gid')
+                app_key = tracked.get(gid)
+                if not app_key:
+                    continue
+                success = status.get('status') == 'complete'
+                if success:
+                    self._report_progress(app_key, status)
+                elif status.get('status') == 'error':
+                    print(f"Lỗi tải {app_key} (mã lỗi: {status.get('errorCode')}): {status.get('errorMessage', '')}")
+                with self._lock:
+                    self._gids.pop(gid, None)
+                self._last_progress.pop(gid, None)
+                try:
+                    self.daemon.call('removeDownloadResult', gid)
+                except (requests.RequestException, Aria2RpcError):
+                    pass
+                # Trả suất và kết nối cho scheduler trước khi báo kết quả
+                self.scheduler.release(app_key)
+                self.finished.emit(app_key, success)
+                self._dispatch()
+
+            self._stop_event.wait(self.POLL_INTERVAL)
+
+    def _report_progress(self, app_key, status):
+        total = int(status.get('totalLength') or 0)
+        if total <= 0:
+            return
+        percentage = float(int(int(status.get('completedLength') or 0) * 100 / total))
+        gid = status.get('gid')
+        # Chỉ gửi khi giá trị thay đổi
+        if self._last_progress.get(gid) != percentage:
+            self._last_progress[gid] = percentage
+            ProgressBus.instance().post(app_key, percentage)
+
+    def _fail_all(self):
+        with self._lock:
+            failed = list(self._gids.values()) + list(self._jobs)
+            self._gids.clear()
+            self._jobs.clear()
+            self._poll_thread = None
+        self._last_progress.clear()
+        for app_key in failed:
+            self.scheduler.cancel(app_key)
+            self.scheduler.release(app_key)
+            self.finished.emit(app_key, False)
 
 class InstallWorker(QThread):
-    def __init__(self, worker_tasks):
+    _WAKE = (None, False) # Đưa vào ready_queue để đánh thức bộ thực thi khi một tác vụ cài đặt xong
+
+    def __init__(self, worker_tasks, max_parallel_installs=DEFAULT_MAX_PARALLEL_INSTALLS):
         super().__init__()
-        self.main_win = main_win
         self.signals = WorkerSignals()
         self.worker_tasks = worker_tasks # {app_key: {'action': ..., 'info': ...}}
+        self.max_parallel_installs = max(1, int(max_parallel_installs))
         self._is_stopped = False
-        
-        self.session = requests.Session()
-        self.session.headers.update({'User-Agent': 'TekDT-AIS-App'})
+        self._suspended = False # Dừng vì đóng chương trình: giữ tác vụ trong nhật ký để lần sau tải tiếp
 
         # Các biến quản lý trạng thái
         self.downloaders = []
-        self.tasks_to_process_after_download = {}
+        self.download_manager = None
+        self.rpc_download_keys = set() # Các app đang tải qua daemon aria2 RPC
+        self.internet_fallbacks = {} # app_key -> (độ ưu tiên, mirror) của các app đang tải từ máy trong LAN
         self.active_downloads = 0
         self.lock = threading.Lock() # Để bảo vệ việc truy cập self.active_downloads
-        self.config_lock = threading.Lock()
 
-    def stop(self):
+        # Pipeline 2 giai đoạn: tác vụ tải xong được đưa vào ready_queue theo thứ tự
+        # sẵn sàng, bộ thực thi cài đặt (chạy trong luồng của worker) lấy ra và giao cho
+        # nhóm luồng cài đặt; các tác vụ cùng install_mutex chờ nhau trong waiting_installs.
+        self.ready_queue = queue.Queue() # (app_key, downloaded_ok)
+        self.pending_wakes = 0 # Số _WAKE đang nằm trong ready_queue, không tính là tác vụ sẵn sàng
+        self.install_pool = None
+        self.installing_keys = set()
+        self.held_mutexes = set()
+        self.waiting_installs = collections.defaultdict(collections.deque) # install_mutex -> app_key
+        self.extracting_keys = set() # Các app đang chạy 7za
+        self.completed_count = 0
+        self.downloaded_keys = set() # Các app được tải mới trong worker này
+
+    # Thời gian chờ các tác vụ tải báo kết quả sau khi người dùng bấm dừng
+    STOP_GRACE_PERIOD = 5
+
+    def stop(self, suspend=False):
+        """
+        Dừng các tác vụ tải/giải nén. suspend=True khi đóng chương trình: tác vụ chưa xong được giữ
+        trong nhật ký hàng đợi để lần chạy sau tải tiếp; người dùng bấm dừng thì bỏ hẳn.
+        """
+        self._suspended = suspend
         self._is_stopped = True
         for downloader in self.downloaders:
             downloader.stop()
+        if self.download_manager and not suspend:
+            # Khi đóng chương trình thì để nguyên trong daemon: aria2 ghi chúng vào session lúc tắt
+            for app_key in list(self.rpc_download_keys):
+                self.download_manager.cancel(app_key)
+        for app_key in list(self.extracting_keys):
+            ProcessOutputMux.instance().terminate(app_key)
+        self._wake_executor() # Không để bộ thực thi chờ hết lượt get() mới thấy lệnh dừng
+
+    def stage_depths(self):
+        """Số tác vụ ở mỗi giai đoạn của pipeline, để biết lô đang nghẽn ở đâu."""
+        with self.lock:
+            return {
+                'downloading': self.active_downloads,
+                'ready': max(0, self.ready_queue.qsize() - self.pending_wakes)
+                         + sum(len(keys) for keys in self.waiting_installs.values()),
+                'installing': len(self.installing_keys),
+                'done': self.completed_count,
+            }
+
+    def _emit_stage_depths(self):
+        self.signals.stage_depths.emit(self.stage_depths())
 
     def run(self):
         try:
-            # --- BƯỚC 1: LỌC VÀ KHỞI CHẠY CÁC TÁC VỤ TẢI XUỐNG ĐỒNG THỜI ---
+            # Ghi hàng đợi ra đĩa trước tiên: nếu chương trình bị tắt giữa chừng, lần sau sẽ tải tiếp
+            try:
+                CONFIG_STORE.journal_tasks(self.worker_tasks)
+            except sqlite3.Error as e:
+                print(f"Không thể ghi nhật ký hàng đợi tải: {e}")
+
+            # --- BƯỚC 1: PHÂN LOẠI TÁC VỤ: CẦN TẢI HAY ĐÃ SẴN SÀNG ---
             download_tasks = {}
             for key, task in self.worker_tasks.items():
                 app_info = task['info']
-                download_path = APPS_DIR / key / app_info.get('output_filename', Path(app_info.get('download_url', '')).name)
+                download_path = get_download_path(key, app_info)
+                sha256, size = app_info.get('sha256'), app_info.get('size')
+
+                # Nội dung cùng SHA-256 đã có trong kho (kể cả khi URL đã đổi): chỉ cần link
+                if sha256 and ARTIFACT_STORE.has(sha256, size):
+                    if not ARTIFACT_STORE.is_valid(download_path, sha256, size):
+                        ARTIFACT_STORE.link_into(sha256, download_path)
+                    self.ready_queue.put((key, True))
+                    continue
                 
-                # Chỉ tải nếu file chưa tồn tại, hoặc nếu hành động là 'update'
-                needs_download = not download_path.exists() or task['action'] == 'update'
+                # Chỉ tải nếu file chưa tồn tại/chưa tải xong/không khớp hash, hoặc nếu hành động là 'update'
+                aria2_control_file = download_path.with_name(download_path.name + '.aria2')
+                needs_download = (not download_path.exists() or aria2_control_file.exists()
+                                  or task['action'] == 'update'
+                                  or not ARTIFACT_STORE.is_valid(download_path, sha256, size))
                 
                 if needs_download:
                     download_tasks[key] = task
                 else:
-                    # Nếu không cần tải, đưa thẳng vào danh sách xử lý sau
-                    self.tasks_to_process_after_download[key] = task
+                    # Nếu không cần tải, đưa thẳng vào hàng đợi cài đặt
+                    self.ready_queue.put((key, True))
 
-            if not download_tasks and not self.tasks_to_process_after_download:
-                pass
-
-            elif download_tasks:
+            # --- BƯỚC 2: KHỞI CHẠY CÁC TÁC VỤ TẢI XUỐNG ĐỒNG THỜI ---
+            with self.lock:
                 self.active_downloads = len(download_tasks)
-                for app_key, task_def in download_tasks.items():
-                    if self._is_stopped: break
-                    
-                    self.signals.progress.emit(app_key, "processing", f"Chuẩn bị tải...")
-                    app_info = task_def['info']
-                    app_dir = APPS_DIR / app_key
-                    app_dir.mkdir(exist_ok=True)
-                    
-                    if task_def['action'] == 'update':
-                        # Xóa file cũ trước khi tạo lệnh tải mới
-                        file_name = app_info.get('output_filename', Path(app_info['download_url']).name)
-                        if (app_dir / file_name).exists():
-                            (app_dir / file_name).unlink()
-                    
-                    command = self._build_aria_command(app_info, app_dir)
-                    downloader = AriaDownloader(app_key, command, app_dir)
-                    
-                    # Kết nối tín hiệu từ downloader con đến tín hiệu của worker chính
-                    downloader.progress_percentage.connect(self.signals.progress_percentage)
-                    downloader.finished.connect(self._on_download_finished)
-                    
-                    self.downloaders.append(downloader)
-                    downloader.start()
-            else:
-                # Nếu không có gì để tải, chuyển ngay đến bước xử lý sau
-                self._process_remaining_tasks()
+            self._emit_stage_depths()
+            # Đo mọi mirror của cả lô cùng lúc, mỗi tác vụ chỉ nhận các mirror còn tốt (nhanh nhất trước)
+            mirrors = MirrorProber.instance().rank({key: task['info'] for key, task in download_tasks.items()})
+            # Bộ đệm LAN: file mà máy khác trong mạng đã có thì lấy từ máy đó, lỗi mới tải từ internet
+            peer_cache = LanPeerCache.running_instance()
+            peer_sources = peer_cache.locate({key: task['info'] for key, task in download_tasks.items()}) if peer_cache else {}
+            # Thứ tự trong danh sách chọn là độ ưu tiên tải
+            for priority, (app_key, task_def) in enumerate(download_tasks.items()):
+                if self._is_stopped:
+                    self._on_download_finished(app_key, False)
+                    continue
+                
+                self.signals.progress.emit(app_key, "processing", f"Chuẩn bị tải...")
+                app_info = task_def['info']
+                app_dir = APPS_DIR / app_key
+                app_dir.mkdir(exist_ok=True)
+                
+                download_path = get_download_path(app_key, app_info)
+                aria2_control_file = download_path.with_name(download_path.name + '.aria2')
+                if download_path.exists() and not aria2_control_file.exists():
+                    # Xóa file cũ (bản cần cập nhật hoặc bị hỏng) trước khi tạo lệnh tải mới.
+                    # Nếu còn file .aria2 thì giữ lại để aria2 tải tiếp.
+                    download_path.unlink()
+                self.downloaded_keys.add(app_key)
+
+                uris = mirrors[app_key]
+                if app_key in peer_sources:
+                    with self.lock:
+                        self.internet_fallbacks[app_key] = (priority, uris)
+                    uris = peer_sources[app_key]
+                    print(f"Tải {app_key} từ {len(uris)} máy trong LAN")
+                self._start_download(app_key, app_info, app_dir, priority, uris)
+
+            # --- BƯỚC 3: BỘ THỰC THI CÀI ĐẶT, CHẠY SONG SONG VỚI CÁC TÁC VỤ TẢI ---
+            self._run_install_executor(len(self.worker_tasks))
 
         except Exception as e:
             self.signals.error.emit(f"Lỗi nghiêm trọng khi khởi tạo Worker: {e}")
         finally:
-            # Chỉ phát tín hiệu finished nếu không có tác vụ tải nào đang hoạt động.
-            # Nếu có, hàm _on_download_finished sẽ tự xử lý việc này sau.
-            with self.lock:
-                if self.active_downloads == 0:
-                    self.signals.finished.emit()
+            self._disconnect_download_manager()
+            if self._is_stopped and not self._suspended:
+                # Người dùng đã dừng cả lô: không tải tiếp ở lần chạy sau
+                self._dequeue(self.worker_tasks)
+            self.signals.finished.emit()
 
-    def _build_aria_command(self, app_info, app_dir):
+    @staticmethod
+    def install_mutex(task_def):
+        """
+        Nhóm loại trừ của một tác vụ khi cài đặt: cùng nhóm thì chạy lần lượt, khác nhóm thì song song.
+        Danh sách phần mềm khai báo bằng "install_mutex" (null nếu installer cài song song được với mọi thứ);
+        installer không khai báo thuộc DEFAULT_INSTALL_MUTEX vì Windows Installer chỉ cho một phiên cùng lúc.
+        Tải về và bản portable không chạy gì nên không cần nhóm.
+        """
+        app_info = task_def['info']
+        if task_def['action'] == 'download' or app_info.get('type') != 'installer':
+            return None
+        return app_info.get('install_mutex', DEFAULT_INSTALL_MUTEX) or None
+
+    def _run_install_executor(self, total_tasks):
+        """Lấy các tác vụ đã sẵn sàng theo thứ tự tải xong và giao cho nhóm luồng cài đặt."""
+        stop_deadline = None
+        with ThreadPoolExecutor(max_workers=self.max_parallel_installs, thread_name_prefix="installer") as pool:
+            self.install_pool = pool
+            while True:
+                with self.lock:
+                    if self.completed_count >= total_tasks:
+                        break
+                    # Đóng chương trình: tác vụ tải để lại trong daemon aria2 sẽ không báo về nữa,
+                    # không còn gì đang cài/giải nén thì thoát ngay, phần còn lại vẫn nằm trong nhật ký
+                    suspended_idle = self._suspended and not self.installing_keys and not self.extracting_keys
+                if suspended_idle:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    break
+                try:
+                    app_key, downloaded = self.ready_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if self._is_stopped:
+                        # Không đợi mãi các tác vụ tải không còn báo kết quả
+                        stop_deadline = stop_deadline or time.monotonic() + self.STOP_GRACE_PERIOD
+                        if time.monotonic() > stop_deadline:
+                            break
+                    continue
+
+                if app_key is None:
+                    with self.lock:
+                        self.pending_wakes -= 1
+                    continue # _WAKE: một tác vụ cài đặt vừa xong, kiểm tra lại điều kiện dừng
+                if not downloaded:
+                    status = "stopped" if self._is_stopped else "failed"
+                    self.signals.update_widget_status.emit(app_key, "failed")
+                    self.signals.progress.emit(app_key, status, f"Tải thất bại.")
+                elif self._store_artifact(app_key, self.worker_tasks[app_key]['info']):
+                    self._schedule_install(app_key)
+                    continue
+                self._mark_completed([app_key])
+        self.install_pool = None
+
+    def _schedule_install(self, app_key, extracted=False):
+        """Chạy ngay nếu nhóm install_mutex đang rảnh, nếu không thì xếp hàng sau tác vụ đang giữ nhóm."""
+        task_def = self.worker_tasks[app_key]
+        if not extracted and task_def['action'] != 'download' and is_archive_package(task_def['info']):
+            # Giải nén không cần giữ install_mutex: bắt đầu ngay khi tải xong, song song với các tác vụ khác
+            if not self._submit_stage(app_key, self._run_extract_stage):
+                self._mark_completed([app_key])
+            return
+        mutex = self.install_mutex(task_def)
+        with self.lock:
+            if mutex is not None:
+                if mutex in self.held_mutexes:
+                    self.waiting_installs[mutex].append(app_key)
+                    return
+                self.held_mutexes.add(mutex)
+            self.installing_keys.add(app_key)
+        self._emit_stage_depths()
+        if not self._submit_stage(app_key, self._run_install, mutex):
+            self._release_install(app_key, mutex)
+
+    def _submit_stage(self, app_key, stage, *args):
+        """
+        Giao một giai đoạn của app_key cho nhóm luồng cài đặt. Bộ thực thi thoát khi dừng quá
+        STOP_GRACE_PERIOD và đóng nhóm luồng, lúc đó báo tác vụ đã dừng và trả về False.
+        """
+        pool = self.install_pool
+        if pool is not None:
+            try:
+                pool.submit(stage, app_key, *args)
+                return True
+            except RuntimeError: # cannot schedule new futures after shutdown
+                pass
+        self.signals.update_widget_status.emit(app_key, "failed")
+        self.signals.progress.emit(app_key, "stopped", "Đã dừng trước khi cài đặt.")
+        return False
+
+    def _run_install(self, app_key, mutex):
+        """Chạy trong nhóm luồng cài đặt; xong thì nhường install_mutex cho tác vụ chờ kế tiếp."""
+        try:
+            self._process_single_task(app_key, self.worker_tasks[app_key])
+        except Exception as e:
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"Lỗi khi xử lý: {e}")
+        finally:
+            self._release_install(app_key, mutex)
+
+    def _release_install(self, app_key, mutex):
+        """Đánh dấu app_key đã xong và nhường install_mutex cho tác vụ chờ kế tiếp."""
+        next_key = None
+        skipped = []
+        with self.lock:
+            self.installing_keys.discard(app_key)
+            waiting = self.waiting_installs.get(mutex)
+            if waiting and self._is_stopped:
+                # Đã dừng: các tác vụ còn chờ không chạy nữa
+                skipped = list(waiting)
+                waiting.clear()
+            elif waiting:
+                next_key = waiting.popleft()
+                self.installing_keys.add(next_key)
+            if next_key is None:
+                self.held_mutexes.discard(mutex)
+        if next_key is not None and not self._submit_stage(next_key, self._run_install, mutex):
+            self._release_install(next_key, mutex)
+        self._mark_completed([app_key, *skipped])
+        self._wake_executor()
+
+    def _run_extract_stage(self, app_key):
+        """Chạy trong nhóm luồng cài đặt; giải nén xong thì xếp tác vụ vào hàng cài đặt theo install_mutex."""
+        try:
+            extracted = self._extract_package(app_key, self.worker_tasks[app_key]['info']) is not None
+        except Exception as e:
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"Lỗi khi giải nén: {e}")
+            extracted = False
+        if extracted and not self._is_stopped:
+            self._schedule_install(app_key, extracted=True)
+            return
+        self._mark_completed([app_key])
+        self._wake_executor()
+
+    def _wake_executor(self):
+        with self.lock:
+            self.pending_wakes += 1
+        self.ready_queue.put(self._WAKE)
+
+    def _mark_completed(self, app_keys):
+        with self.lock:
+            self.completed_count += len(app_keys)
+        self._emit_stage_depths()
+        if not self._suspended:
+            # Tác vụ đã xong (kể cả thất bại) thì bỏ khỏi nhật ký; tác vụ thành công đã được bỏ cùng lúc ghi cấu hình
+            self._dequeue(app_keys)
+
+    def _dequeue(self, app_keys):
+        try:
+            CONFIG_STORE.dequeue_tasks(app_keys)
+        except sqlite3.Error as e:
+            print(f"Không thể cập nhật nhật ký hàng đợi tải: {e}")
+
+    def _store_artifact(self, app_key, app_info):
+        """
+        Kiểm tra size/SHA-256 của file rồi đưa vào kho nội dung.
+        Chỉ băm lại khi file vừa được tải hoặc danh sách phần mềm có khai báo sha256.
+        """
+        sha256, size = app_info.get('sha256'), app_info.get('size')
+        download_path = get_download_path(app_key, app_info)
+        if not download_path.exists() or not (sha256 or size or app_key in self.downloaded_keys):
+            return True # Việc báo thiếu file do _process_single_task đảm nhận
+        try:
+            # aria2 đã kiểm tra checksum khi tải nếu có sha256
+            ARTIFACT_STORE.ingest(download_path, sha256, size, trusted=app_key in self.downloaded_keys)
+            return True
+        except ArtifactVerificationError as e:
+            download_path.unlink(missing_ok=True)
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"File tải về bị hỏng: {e}")
+        except OSError as e:
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"Lỗi khi lưu file vào kho: {e}")
+        return False
+
+    def _build_aria_command(self, app_info, app_dir, uris=None):
         download_url = app_info['download_url']
         file_name = app_info.get('output_filename', Path(download_url).name)
         command = [
             str(ARIA2_EXEC), "--dir", str(app_dir), "--out", file_name,
-            "--max-connection-per-server=16", "--split=16", "--min-split-size=1M",
-            "--show-console-readout=false", "--summary-interval=1",
-            download_url
+            f"--max-connection-per-server={DEFAULT_CONNECTIONS_PER_DOWNLOAD}",
+            f"--split={DEFAULT_CONNECTIONS_PER_DOWNLOAD}", "--min-split-size=1M",
+            "--show-console-readout=false", "--summary-interval=1", "--continue=true",
+            # Nhiều URL cho cùng một file: aria2 tải các đoạn từ nhiều mirror cùng lúc
+            *(uris or download_mirrors(app_info))
         ]
         if 'referer' in app_info:
             command.extend(["--header", f"Referer: {app_info['referer']}"])
+        if app_info.get('sha256'):
+            command.append(f"--checksum=sha-256={app_info['sha256']}")
         return command
 
+    def _build_aria_options(self, app_info, app_dir):
+        """Tùy chọn tương đương _build_aria_command cho lệnh aria2.addUri."""
+        download_url = app_info['download_url']
+        options = {
+            "dir": str(app_dir),
+            "out": app_info.get('output_filename', Path(download_url).name),
+            # Số kết nối (split, max-connection-per-server) do DownloadScheduler quyết định
+            "min-split-size": "1M",
+            "continue": "true", # Tải tiếp file dở dang (file .aria2) thay vì tải lại từ đầu
+        }
+        if 'referer' in app_info:
+            options["header"] = [f"Referer: {app_info['referer']}"]
+        if app_info.get('sha256'):
+            # aria2 kiểm tra SHA-256 ngay khi tải xong
+            options["checksum"] = f"sha-256={app_info['sha256']}"
+        return options
+
+    def _start_download(self, app_key, app_info, app_dir, priority, uris):
+        # Ưu tiên daemon aria2 RPC dùng chung; nếu không khởi động được
+        # thì quay về cách cũ: một tiến trình aria2c cho mỗi phần mềm.
+        if self._start_rpc_download(app_key, app_info, app_dir, priority, uris):
+            return
+
+        command = self._build_aria_command(app_info, app_dir, uris)
+        downloader = AriaDownloader(app_key, command, app_dir)
+
+        # Tiến độ của downloader con đi thẳng vào ProgressBus, chỉ cần nhận kết quả
+        downloader.finished.connect(self._on_download_finished)
+
+        self.downloaders.append(downloader)
+        downloader.start()
+
+    def _retry_from_internet(self, app_key, priority, uris):
+        """
+        Tải từ máy trong LAN thất bại (máy đó đã tắt hoặc gửi nội dung sai checksum): xóa file dở
+        rồi tải lại từ các mirror trong danh sách phần mềm. Trả về False nếu không xóa được file dở.
+        """
+        app_info = self.worker_tasks[app_key]['info']
+        download_path = get_download_path(app_key, app_info)
+        try:
+            for path in (download_path, download_path.with_name(download_path.name + '.aria2')):
+                path.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Không thể xóa file tải dở của {app_key}: {e}")
+            return False
+        print(f"Không tải được {app_key} từ máy trong LAN, chuyển sang tải từ internet")
+        self.signals.progress.emit(app_key, "processing", "Chuyển sang tải từ internet...")
+        self._start_download(app_key, app_info, APPS_DIR / app_key, priority, uris)
+        return True
+
+    def _start_rpc_download(self, app_key, app_info, app_dir, priority=0, uris=None):
+        """Gửi tác vụ tải tới daemon aria2 RPC. Trả về False nếu daemon không dùng được."""
+        manager = AriaDownloadManager.instance()
+        if self.download_manager is None:
+            manager.finished.connect(self._on_rpc_download_finished)
+            self.download_manager = manager
+        try:
+            self.rpc_download_keys.add(app_key)
+            manager.add_download(app_key, uris or download_mirrors(app_info), self._build_aria_options(app_info, app_dir), priority)
+            return True
+        except Aria2RpcError as e:
+            print(f"Không dùng được aria2 RPC cho {app_key}, chuyển sang aria2c riêng: {e}")
+            self.rpc_download_keys.discard(app_key)
+            return False
+
+    def _on_rpc_download_finished(self, app_key, success):
+        if app_key not in self.rpc_download_keys:
+            return
+        self.rpc_download_keys.discard(app_key)
+        if not self.rpc_download_keys:
+            self._disconnect_download_manager()
+        self._on_download_finished(app_key, success)
+
+    def _disconnect_download_manager(self):
+        if self.download_manager is None:
+            return
+        try:
+            self.download_manager.finished.disconnect(self._on_rpc_download_finished)
+        except TypeError:
+            pass
+        self.download_manager = None
+
     def _on_download_finished(self, app_key, success):
-        """Slot được gọi khi một AriaDownloader hoàn thành."""
+        """
+        Slot được gọi khi một tác vụ tải (RPC hoặc AriaDownloader) hoàn thành.
+        Chỉ chuyển tác vụ sang hàng đợi cài đặt, không giữ khóa trong lúc cài đặt.
+        """
+        with self.lock:
+            fallback = self.internet_fallbacks.pop(app_key, None)
+        if fallback and not success and not self._is_stopped and self._retry_from_internet(app_key, *fallback):
+            return
         with self.lock:
-            if success:
-                # Process ngay per task thay vì đợi all
-                self._process_single_task(app_key, self.worker_tasks[app_key])
-            else:
-                status = "stopped" if self._is_stopped else "failed"
-                self.signals.update_widget_status.emit(app_key, "failed")
-                self.signals.progress.emit(app_key, status, f"Tải thất bại.")
-
             self.active_downloads -= 1
-            if self.active_downloads == 0:
-                self.signals.finished.emit()  # Chỉ finished khi all done, nhưng process per task
+        self.ready_queue.put((app_key, success))
+        self._emit_stage_depths()
 
     def _process_single_task(self, app_key, task_def):
         if self._is_stopped: return
@@ -477,7 +2585,9 @@ class InstallWorker(QThread):
 
         # --- Xử lý Cài đặt/Tải về ---
         if action == "download" or app_info.get('type') == 'portable':
-            # Với 'download' hoặc portable, chỉ cần tải xong là thành công
+            # Với 'download' hoặc portable, chỉ cần tải xong (và giải nén nếu là file nén) là thành công
+            if action != "download" and is_archive_package(app_info) and self._extract_package(app_key, app_info) is None:
+                return
             self.signals.update_widget_status.emit(app_key, "success")
             self.signals.progress.emit(app_key, "success", f"Đã xử lý {display_name} thành công!")
             task_successful = True
@@ -489,346 +2599,891 @@ class InstallWorker(QThread):
                 self.signals.progress.emit(app_key, "failed", f"Lỗi: Không tìm thấy file đã tải của {display_name}.")
                 return
 
+            if is_archive_package(app_info):
+                # Installer nằm trong file nén: chạy file "executable" bên trong thư mục giải nén
+                extract_dir = self._extract_package(app_key, app_info)
+                if extract_dir is None:
+                    return
+                download_path = extract_dir / app_info.get('executable', '')
+                if not app_info.get('executable') or not download_path.is_file():
+                    self.signals.update_widget_status.emit(app_key, "failed")
+                    self.signals.progress.emit(app_key, "failed", f"Lỗi: Không tìm thấy file cài đặt trong gói của {display_name}.")
+                    return
+
             self.signals.update_widget_status.emit(app_key, "installing")
             self.signals.progress.emit(app_key, "installing", f"Đang cài đặt {display_name}...")
 
             install_params = app_info.get('install_params', '')
             install_command = [str(download_path)] + shlex.split(install_params)
             try:
-                install_process = subprocess.Popen(install_command, creationflags=subprocess.CREATE_NO_WINDOW)
+                install_process = subprocess.Popen(install_command, creationflags=CREATE_NO_WINDOW)
                 install_process.wait(timeout=600)
 
                 if install_process.returncode == 0:
                     self.signals.update_widget_status.emit(app_key, "success")
-                    self.signals.progress.emit(app_key, "success", f"Đã xử lý {display_name} thành công!")
-                    task_successful = True
-                else:
-                    self.signals.update_widget_status.emit(app_key, "failed")
-                    self.signals.progress.emit(app_key, "failed", f"Cài đặt thất bại (mã lỗi: {install_process.returncode}).")
-            except subprocess.TimeoutExpired:
-                self.signals.update_widget_status.emit(app_key, "failed")
-                self.signals.progress.emit(app_key, "failed", f"Cài đặt quá thời gian cho phép.")
-            except Exception as e:
-                self.signals.update_widget_status.emit(app_key, "failed")
-                self.signals.progress.emit(app_key, "failed", f"Lỗi khi chạy cài đặt: {e}")
-
-        # Nếu thành công, ghi config ngay per task
-        if task_successful:
-            self._commit_config_changes({app_key: task_def})  # Gọi với dict chỉ 1 task
-    
-    def _process_remaining_tasks(self):
-        """Xử lý các tác vụ còn lại như cài đặt, cập nhật icon..."""
-        if self._is_stopped:
-            self.signals.finished.emit()
-            return
-
-        successful_tasks = {} #CHANGED: Lưu các tác vụ thành công để xử lý config một lần
-
-        for app_key, task_def in self.tasks_to_process_after_download.items():
-            if self._is_stopped: break
-
-            app_info = task_def['info']
-            action = task_def['action']
-            display_name = app_info.get('display_name', app_key)
-            task_successful = False
-
-            # --- Tải Icon (luôn thực hiện) ---
-            self._download_icon_if_needed(app_key, app_info)
-
-            # --- Xử lý Cài đặt/Tải về ---
-            if action == "download" or app_info.get('type') == 'portable':
-                # Với 'download' hoặc portable, chỉ cần tải xong là thành công
-                self.signals.update_widget_status.emit(app_key, "success")
-                self.signals.progress.emit(app_key, "success", f"Đã xử lý {display_name} thành công!")
-                task_successful = True
-
-            elif (action == "install" or action == "update") and app_info.get('type') == 'installer':
-                download_path = APPS_DIR / app_key / app_info.get('output_filename', Path(app_info['download_url']).name)
-                if not download_path.exists():
-                    self.signals.update_widget_status.emit(app_key, "failed")
-                    self.signals.progress.emit(app_key, "failed", f"Lỗi: Không tìm thấy file đã tải của {display_name}.")
-                    continue # Bỏ qua tác vụ này
-
-                self.signals.update_widget_status.emit(app_key, "installing")
-                self.signals.progress.emit(app_key, "installing", f"Đang cài đặt {display_name}...")
-
-                install_params = app_info.get('install_params', '')
-                install_command = [str(download_path)] + shlex.split(install_params)
-                try:
-                    # Sử dụng Popen.wait() với timeout để tránh bị treo vô hạn
-                    install_process = subprocess.Popen(install_command, creationflags=subprocess.CREATE_NO_WINDOW)
-                    install_process.wait(timeout=600) # Timeout 10 phút
-
-                    if install_process.returncode == 0:
-                        self.signals.update_widget_status.emit(app_key, "success")
-                        self.signals.progress.emit(app_key, "success", f"Đã xử lý {display_name} thành công!")
-                        task_successful = True
-                    else:
-                        self.signals.update_widget_status.emit(app_key, "failed")
-                        self.signals.progress.emit(app_key, "failed", f"Cài đặt thất bại (mã lỗi: {install_process.returncode}).")
-                except subprocess.TimeoutExpired:
-                    self.signals.update_widget_status.emit(app_key, "failed")
-                    self.signals.progress.emit(app_key, "failed", f"Cài đặt quá thời gian cho phép.")
-                except Exception as e:
+                    self.signals.progress.emit(app_key, "success", f"Đã xử lý {display_name} thành công!")
+                    task_successful = True
+                else:
                     self.signals.update_widget_status.emit(app_key, "failed")
-                    self.signals.progress.emit(app_key, "failed", f"Lỗi khi chạy cài đặt: {e}")
-
-            # CHANGED: Nếu tác vụ thành công, thêm vào danh sách để cập nhật config
-            if task_successful:
-                successful_tasks[app_key] = task_def
+                    self.signals.progress.emit(app_key, "failed", f"Cài đặt thất bại (mã lỗi: {install_process.returncode}).")
+            except subprocess.TimeoutExpired:
+                self.signals.update_widget_status.emit(app_key, "failed")
+                self.signals.progress.emit(app_key, "failed", f"Cài đặt quá thời gian cho phép.")
+            except Exception as e:
+                self.signals.update_widget_status.emit(app_key, "failed")
+                self.signals.progress.emit(app_key, "failed", f"Lỗi khi chạy cài đặt: {e}")
 
-        # Sau khi vòng lặp kết thúc, ghi tất cả thay đổi vào config MỘT LẦN
-        if successful_tasks:
-            self._commit_config_changes(successful_tasks)
+        # Nếu thành công, ghi config ngay per task
+        if task_successful:
+            self._commit_config_changes({app_key: task_def})  # Gọi với dict chỉ 1 task
+    
+    def _extract_package(self, app_key, app_info):
+        """
+        Giải nén gói của app_key bằng 7za (đa luồng) và trả về thư mục đích, None nếu lỗi hoặc bị dừng.
+        Nội dung được giải nén vào thư mục tạm rồi mới đổi tên, nên thư mục đích không bao giờ dở dang;
+        nếu file nén không đổi so với lần trước (SHA-256 ghi trong EXTRACT_MARKER_FILE) thì dùng lại luôn.
+        """
+        display_name = app_info.get('display_name', app_key)
+        archive = get_download_path(app_key, app_info)
+        dest = get_extract_path(app_key, app_info)
+        marker = dest / EXTRACT_MARKER_FILE
+        try:
+            digest = (app_info.get('sha256') or ARTIFACT_STORE.file_digest(archive)).lower()
+            if marker.is_file() and marker.read_text(encoding='utf-8').strip() == digest:
+                return dest
+        except OSError as e:
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"Lỗi khi đọc file nén: {e}")
+            return None
+
+        self.signals.update_widget_status.emit(app_key, "extracting")
+        self.signals.progress.emit(app_key, "extracting", f"Đang giải nén {display_name}...")
+        staging_dir = dest.with_name(dest.name + '.staging')
+        old_dir = dest.with_name(dest.name + '.old')
+        for leftover in (staging_dir, old_dir):
+            if leftover.exists():
+                shutil.rmtree(leftover)
+        command = [str(SEVENZ_EXEC), 'x', str(archive), f'-o{staging_dir}', '-y',
+                   '-mmt=on', # Giải nén đa luồng với các định dạng hỗ trợ (LZMA2, xz, zstd...)
+                   '-bsp1', '-bso0'] # Tiến độ ra stdout, bỏ danh sách file
+
+        self.extracting_keys.add(app_key)
+        try:
+            if self._is_stopped:
+                return None
+            returncode, stderr_tail = ProcessOutputMux.instance().run(
+                app_key, command, archive.parent, ProcessOutputMux.SEVENZIP_PROGRESS)
+            if self._is_stopped:
+                return None
+            if returncode != 0:
+                print(f"Lỗi giải nén {app_key} (mã lỗi: {returncode}): {''.join(stderr_tail)}")
+                self.signals.update_widget_status.emit(app_key, "failed")
+                self.signals.progress.emit(app_key, "failed", f"Giải nén thất bại (mã lỗi: {returncode}).")
+                return None
+
+            (staging_dir / EXTRACT_MARKER_FILE).write_text(digest, encoding='utf-8')
+            # Hoán đổi thư mục: bản cũ chỉ bị xóa sau khi bản mới đã vào đúng chỗ
+            if dest.exists():
+                dest.rename(old_dir)
+            staging_dir.rename(dest)
+            return dest
+        except OSError as e:
+            self.signals.update_widget_status.emit(app_key, "failed")
+            self.signals.progress.emit(app_key, "failed", f"Lỗi khi giải nén: {e}")
+            return None
+        finally:
+            self.extracting_keys.discard(app_key)
+            for leftover in (staging_dir, old_dir):
+                if leftover.exists():
+                    shutil.rmtree(leftover, ignore_errors=True)
 
     def _download_icon_if_needed(self, app_key, app_info):
-        """Hàm helper chỉ để tải icon."""
+        """Đưa icon vào hàng đợi tải nền của IconService, không chặn việc cài đặt."""
         icon_url = app_info.get('icon_url')
-        if not icon_url: return
-        
-        icon_filename = Path(icon_url).name
-        icon_path = APPS_DIR / app_key / icon_filename
-        if not icon_path.exists():
-            try:
-                icon_response = self.session.get(icon_url, timeout=10)
-                icon_response.raise_for_status()
-                with open(icon_path, 'wb') as f: f.write(icon_response.content)
-            except requests.RequestException:
-                pass # Bỏ qua nếu tải icon lỗi
+        if icon_url:
+            IconService.instance().request(icon_url)
     
     def _commit_config_changes(self, completed_tasks):
         """
         Tổng hợp tất cả thay đổi từ các tác vụ đã hoàn thành,
-        ghi vào file config và gửi một tín hiệu duy nhất chứa tất cả dữ liệu.
+        ghi vào kho cấu hình trong một giao dịch và gửi một tín hiệu duy nhất chứa tất cả dữ liệu.
         """
-        with self.config_lock:
-            try:
-                config = {}
-                if CONFIG_FILE.exists():
-                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content: config = json.loads(content)
-
-                config.setdefault('app_items', {})
-
-                updated_items_for_signal = {} # Chuẩn bị dữ liệu để gửi đi
-
-                # Duyệt qua các tác vụ đã hoàn thành thành công
-                for app_key, task_def in completed_tasks.items():
-                    app_info = task_def['info']
-                    icon_filename = Path(app_info.get('icon_url', '')).name or 'default_icon.png'
-
-                    # Cập nhật thông tin mới (quan trọng nhất là version) vào config
-                    existing_item_info = config['app_items'].setdefault(app_key, {})
-                    existing_item_info.update(app_info) 
-                    existing_item_info['icon_file'] = icon_filename
-
-                    # Thêm: Nếu action là 'download' (tải mới), force update version từ remote để tránh '0'
-                    if task_def['action'] == 'download':
-                        remote_version = app_info.get('version', '0')
-                        existing_item_info['version'] = remote_version
-
-                    # Thêm: Cập nhật ngay local_apps để đồng bộ bộ nhớ (tránh đè khi populate)
-                    self.main_win.local_apps.setdefault(app_key, {}).update(existing_item_info)  # Giả sử self.parent là main_win, điều chỉnh nếu khác
+        changes = {}
+        for app_key, task_def in completed_tasks.items():
+            app_info = task_def['info']
+            # Cập nhật thông tin mới (quan trọng nhất là version) vào cấu hình
+            fields = dict(app_info)
+            fields['icon_file'] = Path(app_info.get('icon_url', '')).name or 'default_icon.png'
+            # Nếu action là 'download' (tải mới), force update version từ remote để tránh '0'
+            if task_def['action'] == 'download':
+                fields['version'] = app_info.get('version', '0')
+            changes[app_key] = fields
 
-                    # Thêm vào dictionary để gửi đi qua tín hiệu
-                    updated_items_for_signal[app_key] = existing_item_info
+        try:
+            updated_items_for_signal = CONFIG_STORE.update_app_items(changes, dequeue=changes.keys())
+        except sqlite3.Error as e:
+            self.signals.error.emit(f"Lỗi nghiêm trọng khi ghi cấu hình: {e}")
+            return
 
-                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=2, ensure_ascii=False)
+        # Phát tín hiệu MỘT LẦN với TẤT CẢ các mục đã cập nhật; AppState trên luồng giao diện tự cập nhật
+        if updated_items_for_signal:
+            self.signals.tasks_batch_completed.emit(updated_items_for_signal)
+
+class IconService(QObject):
+    """
+    Tải icon song song bằng một thread pool giới hạn và lưu vào bộ nhớ đệm trên đĩa
+    theo URL (Apps/.icons), nên các app dùng chung một icon (ví dụ Chrome 32/64-bit)
+    chỉ tải một lần. Icon tải xong được báo qua icon_ready để cập nhật từng hàng,
+    tải lỗi thì báo qua icon_failed để bên gọi thôi chờ.
+    """
+    icon_ready = pyqtSignal(str, str) # icon_url, đường dẫn file
+    icon_failed = pyqtSignal(str) # icon_url
+
+    MAX_WORKERS = 8
+    RETRY_AFTER = 300 # Giây chờ trước khi thử tải lại icon bị lỗi
+    ICON_SUFFIXES = ('.png', '.ico', '.svg', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
 
-                # Phát tín hiệu MỘT LẦN với TẤT CẢ các mục đã cập nhật
-                if updated_items_for_signal:
-                    self.signals.tasks_batch_completed.emit(updated_items_for_signal)
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='icon')
+        self.session = get_http_session()
+        self._in_flight = set()
+        self._failed = {} # icon_url -> thời điểm lỗi
+        self._lock = threading.Lock()
+
+    @classmethod
+    def cache_path(cls, icon_url):
+        suffix = Path(urlparse(icon_url).path).suffix.lower()
+        if suffix not in cls.ICON_SUFFIXES:
+            suffix = '.png'
+        return ICON_CACHE_DIR / (hashlib.sha1(icon_url.encode('utf-8')).hexdigest() + suffix)
+
+    def request(self, icon_url):
+        """Trả về đường dẫn nếu icon đã có; nếu chưa thì tải ở nền, trả về None và báo qua icon_ready."""
+        path = self.cache_path(icon_url)
+        if path.exists():
+            return str(path)
+        if CONNECTIVITY.known_state() is False and not _is_local_host(urlparse(icon_url).hostname):
+            return None # Đang offline, không gửi request vô ích
+        with self._lock:
+            if icon_url in self._in_flight:
+                return None
+            failed_at = self._failed.get(icon_url)
+            if failed_at and time.monotonic() - failed_at < self.RETRY_AFTER:
+                return None
+            self._in_flight.add(icon_url)
+        self.executor.submit(self._fetch, icon_url, path)
+        return None
 
-            except (IOError, json.JSONDecodeError) as e:
-                self.signals.error.emit(f"Lỗi nghiêm trọng khi ghi file config: {e}")
+    def _fetch(self, icon_url, path):
+        try:
+            response = self.session.get(icon_url, timeout=10)
+            response.raise_for_status()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + '.tmp')
+            tmp_path.write_bytes(response.content)
+            os.replace(tmp_path, path)
+        except (requests.RequestException, OSError):
+            with self._lock:
+                self._failed[icon_url] = time.monotonic()
+                self._in_flight.discard(icon_url)
+            self.icon_failed.emit(icon_url)
+            return
+        with self._lock:
+            self._failed.pop(icon_url, None)
+            self._in_flight.discard(icon_url)
+        self.icon_ready.emit(icon_url, str(path))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def resolve_icon_path(app_key, app_info):
+    """Icon để hiển thị: bộ nhớ đệm theo URL, icon cũ trong Apps/<key>/, hoặc icon mặc định."""
+    icon_url = app_info.get('icon_url')
+    if icon_url:
+        cached_path = IconService.cache_path(icon_url)
+        if cached_path.exists():
+            return str(cached_path)
+    for icon_file in (app_info.get('icon_file'), Path(icon_url).name if icon_url else None):
+        if icon_file and (APPS_DIR / app_key / icon_file).exists():
+            return str(APPS_DIR / app_key / icon_file)
+    return resource_path('Images/default_icon.png')
+
+class CatalogRefreshWorker(QThread):
+    """Làm mới danh sách phần mềm từ máy chủ trong nền, không chặn luồng giao diện."""
+    refreshed = pyqtSignal(object, bool) # catalog, changed
+    failed = pyqtSignal(str)
+
+    def __init__(self, catalog_cache, session):
+        super().__init__()
+        self.catalog_cache = catalog_cache
+        self.session = session
 
-# --- WIDGET TÙY CHỈNH CHO MỖI PHẦN MỀM ---
-class AppItemWidget(QWidget):
-    add_requested = pyqtSignal(str, dict)
-    remove_requested = pyqtSignal(str, dict)
-    auto_install_toggled = pyqtSignal(str, bool)
-    def __init__(self, app_key, app_info, embed_mode=False, parent=None):
+    def run(self):
+        try:
+            catalog, changed = self.catalog_cache.fetch(self.session, timeout=10)
+        except requests.RequestException as e:
+            self.failed.emit(str(e))
+            return
+        self.refreshed.emit(catalog, changed)
+
+# --- TRẠNG THÁI PHẦN MỀM ---
+class AppRecord:
+    """
+    Dữ liệu của một phần mềm: phần từ danh sách máy chủ (remote) và phần cục bộ từ kho cấu hình
+    (local) được giữ riêng. info là bản gộp (local ghi đè remote), chỉ tạo lại khi một trong hai đổi.
+    """
+    __slots__ = ('key', 'remote', 'local', '_info')
+
+    def __init__(self, key):
+        self.key = key
+        self.remote = None # None là không có trong danh sách máy chủ
+        self.local = {}
+        self._info = None
+
+    @property
+    def info(self):
+        if self._info is None:
+            self._info = {**(self.remote or {}), **self.local}
+        return self._info
+
+    def set_remote(self, remote):
+        self.remote = remote
+        self._info = None
+
+    def set_local(self, local):
+        self.local = local
+        self._info = None
+
+class AppState(QObject):
+    """
+    Nguồn dữ liệu duy nhất về phần mềm trong bộ nhớ (danh sách máy chủ, cấu hình cục bộ, thiết lập).
+    Mọi thay đổi đi qua các hàm set_catalog/load_local/update_local, và changed báo tập app key
+    có dữ liệu thay đổi để giao diện chỉ cập nhật các hàng đó. Chỉ dùng trên luồng giao diện.
+    """
+    changed = pyqtSignal(object) # set các app key
+
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.app_key = app_key
-        self.app_info = app_info
-        self.embed_mode = embed_mode
-        self._current_progress = 0.0
-        self.setMouseTracking(True)
-        self.setMinimumHeight(60)
-        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        
-        # Layout chính
-        self.layout = QHBoxLayout(self)
-        self.layout.setContentsMargins(0, 0, 0, 0)
-        self.layout.setSpacing(8)
-        self.layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
+        self._records = {}
+        self.settings = {}
+        self.index = CatalogIndex() # Bản biên dịch của danh sách máy chủ hiện tại
+
+    def _record(self, key):
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = AppRecord(key)
+        return record
+
+    def _drop_empty(self, keys):
+        for key in keys:
+            record = self._records.get(key)
+            if record is not None and record.remote is None and not record.local:
+                del self._records[key]
+
+    def _notify(self, keys):
+        if keys:
+            self.changed.emit(keys)
+        return keys
+
+    def set_catalog(self, app_items, index=None):
+        """
+        Thay danh sách máy chủ; trả về (và báo) các app được thêm, bị xóa hoặc thay đổi.
+        index là CatalogIndex đã biên dịch sẵn của app_items (từ CatalogCache); None thì biên dịch tại chỗ.
+        """
+        self.index = index if index is not None else CatalogIndex.compile(app_items)
+        changed = set()
+        for key, remote in app_items.items():
+            record = self._record(key)
+            if record.remote is not remote and record.remote != remote:
+                record.set_remote(remote)
+                changed.add(key)
+        for key, record in self._records.items():
+            if record.remote is not None and key not in app_items:
+                record.set_remote(None)
+                changed.add(key)
+        self._drop_empty(changed)
+        return self._notify(changed)
+
+    def load_local(self, config):
+        """Nạp cấu hình từ kho ({'settings': ..., 'app_items': ...}); trả về (và báo) các app đổi dữ liệu cục bộ."""
+        self.settings = config.get('settings', {})
+        app_items = config.get('app_items', {})
+        changed = set()
+        for key in set(app_items) | {key for key, record in self._records.items() if record.local}:
+            local = app_items.get(key, {})
+            record = self._record(key)
+            if record.local != local:
+                record.set_local(local)
+                changed.add(key)
+        self._drop_empty(changed)
+        return self._notify(changed)
+
+    def update_local(self, changes):
+        """Trộn {app_key: {trường: giá trị}} vào dữ liệu cục bộ; trả về (và báo) các app thực sự đổi."""
+        changed = set()
+        for key, fields in changes.items():
+            record = self._record(key)
+            local = {**record.local, **fields}
+            if local != record.local:
+                record.set_local(local)
+                changed.add(key)
+        return self._notify(changed)
+
+    def has_catalog(self):
+        return any(record.remote is not None for record in self._records.values())
+
+    def remote_info(self, key):
+        record = self._records.get(key)
+        return record.remote if record is not None else None
+
+    def local_info(self, key):
+        record = self._records.get(key)
+        return record.local if record is not None else {}
+
+    def local_items(self):
+        """{app_key: dữ liệu cục bộ} của các app có dữ liệu cục bộ."""
+        return {key: record.local for key, record in self._records.items() if record.local}
+
+    def info(self, key):
+        """Thông tin đã gộp của một app có trong danh sách máy chủ, None nếu không có."""
+        record = self._records.get(key)
+        if record is None or record.remote is None:
+            return None
+        return record.info
+
+# --- DANH SÁCH PHẦN MỀM (MODEL/VIEW) ---
+class AppRow:
+    """Một hàng của danh sách: tiêu đề danh mục (key là None) hoặc một phần mềm."""
+    __slots__ = ('key', 'info', 'category', 'icon_path', 'button', 'button_enabled',
+                 'version_text', 'update_available', 'status', 'progress')
+
+    def __init__(self, key=None, info=None, category=''):
+        self.key = key
+        self.info = info if info is not None else {}
+        self.category = category
+        self.icon_path = None
+        self.button = None # Loại nút trong AppItemDelegate.BUTTONS, None là ẩn nút
+        self.button_enabled = True
+        self.version_text = ''
+        self.update_available = False
+        self.status = ''
+        self.progress = 0.0
+
+    @property
+    def is_header(self):
+        return self.key is None
+
+class AppListModel(QAbstractListModel):
+    """
+    Model cho danh sách phần mềm. Mỗi hàng chỉ là một AppRow, việc vẽ do AppItemDelegate đảm nhận,
+    nên bộ nhớ và thời gian dựng lại không phụ thuộc vào số QWidget như trước.
+    Bộ lọc tìm kiếm được áp dụng ngay trong model: view chỉ thấy các hàng đang hiện.
+    """
+    KeyRole = Qt.ItemDataRole.UserRole
+    RowRole = Qt.ItemDataRole.UserRole + 1
+    BUSY_STATUSES = ('processing', 'extracting', 'installing')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._all_rows = [] # Mọi hàng theo thứ tự hiển thị, kể cả hàng bị bộ lọc ẩn
+        self._rows = [] # Các hàng đang hiện, chính là các hàng view nhìn thấy
+        self._rows_by_key = {} # app_key -> AppRow (kể cả hàng đang ẩn)
+        self._positions = {} # app_key -> vị trí hàng đang hiện, để mỗi sự kiện tiến độ/trạng thái chỉ tốn O(1)
+        self._visible_ids = None # None là hiện tất cả; nếu không là tập app key và ('header', danh mục) được hiện
+        self._busy_keys = set() # Các app đang tải/cài, delegate dùng để chạy ảnh động
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == self.RowRole:
+            return row
+        if role == self.KeyRole:
+            return row.key
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row.category.upper() if row.is_header else row.info.get('display_name', 'N/A')
+        if role == Qt.ItemDataRole.ToolTipRole and not row.is_header:
+            return row.info.get('description', 'Không có mô tả.')
+        return None
 
-        # Icon
-        self.icon_label = QLabel()
-        self.icon_label.setFixedSize(48, 48)
-        self.icon_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        icon_file = app_info.get('icon_file', '')
-        icon_path = APPS_DIR / app_key / icon_file if icon_file else ''
-        default_icon_path = resource_path('Images/default_icon.png')
-        
-        pixmap_path = str(icon_path) if icon_path and Path(icon_path).exists() else str(default_icon_path)
-        icon = QIcon(pixmap_path)
-        if not icon.isNull():
-            self.icon_label.setPixmap(icon.pixmap(48, 48))
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if self._rows[index.row()].is_header:
+            return Qt.ItemFlag.ItemIsEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    def rows(self):
+        """Mọi hàng, kể cả hàng đang bị bộ lọc ẩn."""
+        return self._all_rows
+
+    @staticmethod
+    def _row_id(row):
+        return ('header', row.category) if row.is_header else row.key
+
+    def _visible_rows(self, rows):
+        if self._visible_ids is None:
+            return list(rows)
+        return [row for row in rows if self._row_id(row) in self._visible_ids]
+
+    def _reindex(self, start=0):
+        """Cập nhật chỉ mục app_key -> vị trí cho các hàng đang hiện từ start trở đi."""
+        for position in range(start, len(self._rows)):
+            row = self._rows[position]
+            if not row.is_header:
+                self._positions[row.key] = position
+
+    def _set_all_rows(self, rows):
+        self._all_rows = list(rows)
+        self._rows_by_key = {row.key: row for row in self._all_rows if not row.is_header}
+        self._busy_keys = {row.key for row in self._all_rows if row.status in self.BUSY_STATUSES}
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._set_all_rows(rows)
+        self._rows = self._visible_rows(self._all_rows)
+        self._positions = {}
+        self._reindex()
+        self.endResetModel()
+
+    def set_filter(self, visible_ids):
+        """
+        Chỉ hiện các hàng có id trong visible_ids (None là hiện tất cả). Danh sách hàng hiện được
+        tính lại trong một lượt rồi reset model một lần, thay vì gọi setRowHidden cho từng hàng.
+        Không làm gì nếu kết quả không đổi, nên gõ thêm ký tự mà kết quả như cũ thì giữ được vị trí cuộn.
+        """
+        self._visible_ids = visible_ids
+        new_rows = self._visible_rows(self._all_rows)
+        if len(new_rows) == len(self._rows) and all(new is old for new, old in zip(new_rows, self._rows)):
+            return
+        self.beginResetModel()
+        self._rows = new_rows
+        self._positions = {}
+        self._reindex()
+        self.endResetModel()
+
+    def append_row(self, row):
+        self._all_rows.append(row)
+        if not row.is_header:
+            self._rows_by_key[row.key] = row
+        if row.status in self.BUSY_STATUSES:
+            self._busy_keys.add(row.key)
+        if self._visible_ids is not None and self._row_id(row) not in self._visible_ids:
+            return
+        position = len(self._rows)
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.append(row)
+        if not row.is_header:
+            self._positions[row.key] = position
+        self.endInsertRows()
+
+    def remove_key(self, app_key):
+        row = self._rows_by_key.pop(app_key, None)
+        if row is None:
+            return False
+        self._all_rows.remove(row)
+        self._busy_keys.discard(app_key)
+        position = self._positions.pop(app_key, -1)
+        if position >= 0:
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self._rows[position]
+            # Chỉ các hàng phía sau bị dịch lên một vị trí
+            self._reindex(position)
+            self.endRemoveRows()
+        return True
+
+    def reconcile(self, new_rows, updated_keys=None):
+        """
+        Đưa model về new_rows bằng các lệnh chèn/xóa tối thiểu thay vì reset, nên view giữ được
+        vị trí cuộn. Hàng giữ nguyên được vẽ lại nếu thuộc updated_keys (None là tất cả).
+        Trả về True nếu có hàng được chèn hoặc xóa.
+        """
+        self._set_all_rows(new_rows)
+        visible_rows = self._visible_rows(self._all_rows)
+        old_ids = [self._row_id(row) for row in self._rows]
+        new_ids = [self._row_id(row) for row in visible_rows]
+        structure_changed = old_ids != new_ids
+        if structure_changed:
+            matcher = difflib.SequenceMatcher(None, old_ids, new_ids, autojunk=False)
+            # Áp dụng từ cuối lên để vị trí của các đoạn phía trước không bị dịch
+            for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if tag == 'equal':
+                    continue
+                if i2 > i1:
+                    self.beginRemoveRows(QModelIndex(), i1, i2 - 1)
+                    del self._rows[i1:i2]
+                    self.endRemoveRows()
+                if j2 > j1:
+                    self.beginInsertRows(QModelIndex(), i1, i1 + (j2 - j1) - 1)
+                    self._rows[i1:i1] = visible_rows[j1:j2]
+                    self.endInsertRows()
+            self._positions = {}
+            self._reindex()
+
+        if updated_keys is None:
+            if self._rows:
+                self.dataChanged.emit(self.index(0), self.index(len(self._rows) - 1))
         else:
-            self.icon_label.setText("?")
-            self.icon_label.setStyleSheet("color: #ecf0f1; background-color: #34495e; border: 1px solid #3498db;")
-        self.layout.addWidget(self.icon_label)
-        
-        # Thông tin
-        self.info_widget = QWidget()
-        self.info_layout = QVBoxLayout(self.info_widget)
-        self.info_layout.setContentsMargins(8, 0, 0, 0)
-        self.info_layout.setSpacing(2)
-        self.info_layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
-        
-        self.name_label = QLabel(f"{app_info.get('display_name', 'N/A')}")
-        self.name_label.setStyleSheet("font-weight: bold; font-size: 12pt;")
-        self.version_label = QLabel(f"Phiên bản: {app_info.get('version', 'N/A')}")
-        self.version_label.setStyleSheet("color: #bdc3c7; font-size: 10pt;")
-        
-        self.info_layout.addWidget(self.name_label)
-        self.info_layout.addWidget(self.version_label)
-        self.layout.addWidget(self.info_widget, 1)
-        
-        # Nút hành động
-        self.action_button = QPushButton()
-        self.action_button.setFixedSize(100, 36)
-        self.action_button.clicked.connect(self._on_action_button_clicked)
-        self.layout.addWidget(self.action_button)
-        
-        # Dấu tick/X
-        self.status_label = QLabel()
-        self.status_label.setFixedSize(24, 24)
-        self.layout.addWidget(self.status_label)
-        self.status_label.hide()
-        
-        # Lớp phủ tiến độ
-        self.progress_overlay = QWidget(self)
-        self.progress_overlay.setStyleSheet("background-color: rgba(76, 175, 80, 100);")
-        self.progress_overlay.setGeometry(0, 0, 0, self.height())
-        self.progress_overlay.hide()
-        self._progress_animation = QPropertyAnimation(self.progress_overlay, b"geometry", self)
-        self._progress_animation.setDuration(500) # Thời gian chuyển động ngắn để tạo cảm giác real-time
-        self._progress_animation.setEasingCurve(QEasingCurve.Type.Linear)
-        
-        self.setToolTip(app_info.get('description', 'Không có mô tả.'))
+            for key in updated_keys:
+                position = self.find_row(key)
+                if position >= 0:
+                    model_index = self.index(position)
+                    self.dataChanged.emit(model_index, model_index)
+        return structure_changed
+
+    def find_row(self, app_key):
+        """Vị trí hàng đang hiện của app_key, -1 nếu không có hoặc đang bị lọc ẩn."""
+        return self._positions.get(app_key, -1)
+
+    def row_for_key(self, app_key):
+        """AppRow của app_key (kể cả khi đang bị lọc ẩn), None nếu không có."""
+        return self._rows_by_key.get(app_key)
+
+    def app_count(self):
+        return len(self._rows_by_key)
+
+    def has_busy_rows(self):
+        return bool(self._busy_keys)
+
+    def _apply_changes(self, row, changes):
+        if 'status' in changes:
+            # Giữ nguyên quy tắc của set_status cũ: đang tải/cài thì khóa nút, xong thì mở nút và xóa tiến độ
+            status = changes['status']
+            if status in self.BUSY_STATUSES:
+                changes = {'button_enabled': False, **changes}
+                self._busy_keys.add(row.key)
+            else:
+                changes = {'button_enabled': True, 'progress': 0.0, **changes}
+                self._busy_keys.discard(row.key)
+        for name, value in changes.items():
+            setattr(row, name, value)
 
-    def _on_action_button_clicked(self):
-        if self.embed_mode:
-            is_currently_set_for_auto_install = self.action_button.text() == "Xoá"
-            new_state = not is_currently_set_for_auto_install
-            self.auto_install_toggled.emit(self.app_key, new_state)
-            self.set_auto_install_button_state(new_state)
-        else:
-            if self.action_button.text() == "Thêm":
-                self.add_requested.emit(self.app_key, self.app_info)
-
-    def set_auto_install_button_state(self, is_auto_install):
-        if is_auto_install:
-            self.action_button.setText("Xoá")
-            self.action_button.setToolTip(f"Huỷ tự động cài đặt {self.app_info['display_name']}")
-            self.action_button.setStyleSheet(
-                "background-color: #e74c3c; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold;"
-            ) # Màu đỏ
-        else:
-            self.action_button.setText("Thêm")
-            self.action_button.setToolTip(f"Bật tự động cài đặt {self.app_info['display_name']}")
-            self.action_button.setStyleSheet(
-                "background-color: #4CAF50; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold;"
-            ) # Màu xanh
-        self.action_button.setEnabled(True)
-    
-    def resizeEvent(self, event):
-        if self._current_progress > 0:
-            overlay_width = int(self.width() * (self._current_progress / 100.0))
-            self.progress_overlay.setGeometry(0, 0, overlay_width, self.height())
-        super().resizeEvent(event)
-        
-    def set_status(self, status):
-        self.status_label.setMovie(None)
-        self.status_label.setPixmap(QPixmap())
-
-        if status == "success":
-            self._progress_animation.stop()
-            self.status_label.setPixmap(QPixmap(resource_path('Images/success.png')).scaled(24, 24, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
-            self.name_label.setStyleSheet("color: #4CAF50; font-weight: bold; font-size: 12pt;")
-            self.action_button.setEnabled(True) # Re-enable after process
-            self._current_progress = 0
-            self.progress_overlay.hide()
-            self.progress_overlay.setGeometry(0, 0, 0, self.height())
-            self.status_label.show()
-        elif status == "failed":
-            self._progress_animation.stop()
-            self.status_label.setPixmap(QPixmap(resource_path('Images/failed.png')).scaled(24, 24, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
-            self.name_label.setStyleSheet("color: #F44336; font-weight: bold; font-size: 12pt;")
-            self.action_button.setEnabled(True) # Re-enable after process
-            self._current_progress = 0
-            self.progress_overlay.hide()
-            self.status_label.show()
-        elif status == "processing": # Downloading
-            movie = QMovie(resource_path('Images/loading.gif'))
-            self.status_label.setMovie(movie)
-            movie.start()
-            self.action_button.setEnabled(False)
-            self.status_label.show()
-        elif status == "installing": # Installing (new status)
-            movie = QMovie(resource_path('Images/loading.gif'))
-            self.status_label.setMovie(movie)
-            movie.start()
-            self.action_button.setEnabled(False)
-            self.status_label.show()
-        else: # Idle
-            self.status_label.hide()
-            self.name_label.setStyleSheet("font-weight: bold; font-size: 12pt;")
-            self.action_button.setEnabled(True)
-            self._current_progress = 0
-            self.progress_overlay.hide()
-
-    def update_download_progress(self, app_key, percentage):
-        if app_key != self.app_key:
+    def update_row(self, app_key, **changes):
+        """
+        Cập nhật các trường của hàng app_key và chỉ vẽ lại hàng đó (hàng đang bị lọc ẩn vẫn được cập nhật).
+        Trả về False nếu không có hàng.
+        """
+        row = self._rows_by_key.get(app_key)
+        if row is None:
+            return False
+        self._apply_changes(row, changes)
+        position = self.find_row(app_key)
+        if position >= 0:
+            model_index = self.index(position)
+            self.dataChanged.emit(model_index, model_index)
+        return True
+
+    def update_all(self, **changes):
+        """Cập nhật cùng các trường cho mọi hàng phần mềm."""
+        for row in self._all_rows:
+            if not row.is_header:
+                self._apply_changes(row, changes)
+        if self._rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self._rows) - 1))
+
+def fold_text(text):
+    """Chữ thường và bỏ dấu tiếng Việt (NFD, bỏ dấu kết hợp, đ -> d) để gõ không dấu vẫn tìm được."""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+class SearchIndex:
+    """
+    Chỉ mục tìm kiếm dựng một lần cho mỗi lần nạp danh sách: token đã bỏ dấu của tên, danh mục
+    và mô tả. Mỗi từ gõ vào khớp theo tiền tố (tìm nhị phân trên danh sách token đã sắp xếp),
+    các từ kết hợp theo kiểu AND.
+    """
+    TOKEN_PATTERN = re.compile(r'\w+')
+    FIELDS = ('display_name', 'category', 'description')
+
+    def __init__(self):
+        self._tokens_by_key = {}
+        self._keys_by_token = {}
+        self._keys_by_category = {}
+        self._category_by_key = {}
+        self._sorted_tokens = []
+        self._dirty = False
+
+    def build(self, items):
+        self._tokens_by_key = {}
+        self._keys_by_token = {}
+        self._keys_by_category = {}
+        self._category_by_key = {}
+        for key, info in items.items():
+            self._add(key, info)
+        self._dirty = True
+
+    def set_entry(self, key, info):
+        """Cập nhật một app (info là None để xóa) mà không dựng lại toàn bộ chỉ mục."""
+        self._remove(key)
+        if info is not None:
+            self._add(key, info)
+        self._dirty = True
+
+    def _add(self, key, info):
+        folded_name = fold_text(info.get('display_name', ''))
+        tokens = set(self.TOKEN_PATTERN.findall(
+            ' '.join(fold_text(info.get(field, '') or '') for field in self.FIELDS)))
+        # Tên viết liền ("7zip", "googlechrome") cũng tìm được
+        tokens.add(re.sub(r'\W+', '', folded_name))
+        tokens.discard('')
+        self._tokens_by_key[key] = tokens
+        for token in tokens:
+            self._keys_by_token.setdefault(token, set()).add(key)
+        category = info.get('category', 'Chưa phân loại')
+        self._category_by_key[key] = category
+        self._keys_by_category.setdefault(category, set()).add(key)
+
+    def _remove(self, key):
+        for token in self._tokens_by_key.pop(key, ()):
+            keys = self._keys_by_token.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_token[token]
+        category = self._category_by_key.pop(key, None)
+        if category is not None:
+            self._keys_by_category[category].discard(key)
+            if not self._keys_by_category[category]:
+                del self._keys_by_category[category]
+
+    def keys(self):
+        return self._tokens_by_key.keys()
+
+    def _prefix_keys(self, term):
+        if self._dirty:
+            self._sorted_tokens = sorted(self._keys_by_token)
+            self._dirty = False
+        keys = set()
+        position = bisect.bisect_left(self._sorted_tokens, term)
+        while position < len(self._sorted_tokens) and self._sorted_tokens[position].startswith(term):
+            keys |= self._keys_by_token[self._sorted_tokens[position]]
+            position += 1
+        return keys
+
+    def search(self, query):
+        """Tập app key khớp mọi từ trong query; None nếu query không có từ nào (hiện tất cả)."""
+        terms = self.TOKEN_PATTERN.findall(fold_text(query))
+        if not terms:
+            return None
+        matches = None
+        for term in sorted(set(terms), key=len, reverse=True): # Từ dài thường hẹp hơn, giao trước
+            term_keys = self._prefix_keys(term)
+            matches = term_keys if matches is None else matches & term_keys
+            if not matches:
+                break
+        return matches
+
+    def categories_with(self, keys):
+        """Các danh mục còn ít nhất một app trong keys (dùng để ẩn/hiện tiêu đề)."""
+        return {category for category, category_keys in self._keys_by_category.items()
+                if not category_keys.isdisjoint(keys)}
+
+class AppListFilter:
+    """Lọc một danh sách theo SearchIndex: tính tập hàng được hiện (kể cả tiêu đề danh mục) rồi giao cho model."""
+    def __init__(self, model):
+        self.model = model
+        self.index = SearchIndex()
+
+    def apply(self, query, min_chars=1):
+        matches = self.index.search(query) if len(query.strip()) >= min_chars else None
+        if matches is None:
+            self.model.set_filter(None)
+            return
+        visible_ids = set(matches)
+        visible_ids.update(('header', category) for category in self.index.categories_with(matches))
+        self.model.set_filter(visible_ids)
+
+class AppItemDelegate(QStyledItemDelegate):
+    """Vẽ icon, tên, phiên bản, nút hành động, trạng thái và tiến độ của từng hàng phần mềm."""
+    button_clicked = pyqtSignal(str, str) # app_key, loại nút
+
+    ROW_HEIGHT = 70
+    HEADER_HEIGHT = 32
+    ICON_SIZE = 48
+    STATUS_SIZE = 24
+    BUTTON_WIDTH = 100
+    BUTTON_HEIGHT = 36
+    PADDING = 5
+    SPACING = 8
+    # Loại nút -> (chữ, màu nền, tooltip)
+    BUTTONS = {
+        'download': ("Tải", "#f39c12", "Tải về {name}"),
+        'add': ("Thêm", "#4CAF50", "Thêm {name} vào danh sách"),
+        'selected': ("Đã chọn", "#95a5a6", ""),
+        'remove': ("Bỏ", "#e74c3c", "Bỏ {name} khỏi danh sách"),
+        'auto_off': ("Thêm", "#4CAF50", "Bật tự động cài đặt {name}"),
+        'auto_on': ("Xoá", "#e74c3c", "Huỷ tự động cài đặt {name}"),
+    }
+    DISABLED_BUTTON_COLOR = "#95a5a6"
+    NAME_COLORS = {'success': "#4CAF50", 'failed': "#F44336"}
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.name_font = QFont(view.font())
+        self.name_font.setPointSize(12)
+        self.name_font.setBold(True)
+        self.version_font = QFont(view.font())
+        self.version_font.setPointSize(10)
+        self.update_font = QFont(self.version_font)
+        self.update_font.setBold(True)
+        self.header_font = QFont(view.font())
+        self.header_font.setBold(True)
+        # Một ảnh động dùng chung cho mọi hàng đang tải/cài, chỉ chạy khi có hàng cần nó
+        self.loading_movie = QMovie(resource_path('Images/loading.gif'))
+        self.loading_movie.setScaledSize(QSize(self.STATUS_SIZE, self.STATUS_SIZE))
+        self.loading_movie.frameChanged.connect(self._on_loading_frame)
+
+    def _on_loading_frame(self, _frame):
+        model = self.view.model()
+        if model is None or not model.has_busy_rows():
+            self.loading_movie.stop()
+            return
+        self.view.viewport().update()
+
+    def sizeHint(self, option, index):
+        row = index.data(AppListModel.RowRole)
+        return QSize(0, self.HEADER_HEIGHT if row is None or row.is_header else self.ROW_HEIGHT)
+
+    def _layout(self, rect):
+        """Trả về (icon, chữ, nút, trạng thái) của một hàng, dùng chung cho vẽ và bắt click."""
+        inner = rect.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING)
+        center_y = inner.center().y()
+        status_rect = QRect(inner.right() - self.STATUS_SIZE + 1, center_y - self.STATUS_SIZE // 2,
+                            self.STATUS_SIZE, self.STATUS_SIZE)
+        button_rect = QRect(status_rect.left() - self.SPACING - self.BUTTON_WIDTH, center_y - self.BUTTON_HEIGHT // 2,
+                            self.BUTTON_WIDTH, self.BUTTON_HEIGHT)
+        icon_rect = QRect(inner.left(), center_y - self.ICON_SIZE // 2, self.ICON_SIZE, self.ICON_SIZE)
+        text_left = icon_rect.right() + 1 + 2 * self.SPACING
+        text_rect = QRect(text_left, inner.top(), max(0, button_rect.left() - self.SPACING - text_left), inner.height())
+        return icon_rect, text_rect, button_rect, status_rect
+
+    def _icon_pixmap(self, icon_path):
+        # QPixmapCache giới hạn dung lượng, icon mặc định dùng chung cho mọi hàng chưa có icon riêng
+        cache_key = f"tekdt-app-icon:{icon_path}"
+        pixmap = QPixmapCache.find(cache_key)
+        if pixmap is None:
+            icon = QIcon(icon_path) if icon_path else QIcon()
+            pixmap = icon.pixmap(self.ICON_SIZE, self.ICON_SIZE) if not icon.isNull() else QPixmap()
+            QPixmapCache.insert(cache_key, pixmap)
+        return pixmap
+
+    _status_pixmaps = {} # Dùng chung cho mọi delegate, nạp khi lần đầu cần vẽ
+
+    @classmethod
+    def status_pixmap(cls, status):
+        pixmap = cls._status_pixmaps.get(status)
+        if pixmap is None:
+            pixmap = QPixmap(resource_path(f'Images/{status}.png')).scaled(
+                cls.STATUS_SIZE, cls.STATUS_SIZE, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+            cls._status_pixmaps[status] = pixmap
+        return pixmap
+
+    @classmethod
+    def is_button_enabled(cls, row):
+        return row.button is not None and row.button_enabled and row.button != 'selected'
+
+    def paint(self, painter, option, index):
+        row = index.data(AppListModel.RowRole)
+        if row is None:
+            return
+        painter.save()
+        rect = option.rect
+        if row.is_header:
+            painter.setFont(self.header_font)
+            painter.setPen(QColor("#3498db"))
+            painter.drawText(rect.adjusted(self.PADDING, 0, -self.PADDING, 0),
+                             Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, row.category.upper())
+            painter.restore()
             return
 
-        self._current_progress = float(percentage)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if option.state & QStyle.StateFlag.State_MouseOver:
+            painter.fillRect(rect, QColor("#4a627a"))
+        if row.progress > 0:
+            progress_width = int(rect.width() * min(row.progress, 100.0) / 100.0)
+            painter.fillRect(QRect(rect.left(), rect.top(), progress_width, rect.height()), QColor(76, 175, 80, 100))
+        painter.setPen(QColor("#2c3e50"))
+        painter.drawLine(rect.bottomLeft(), rect.bottomRight())
 
-        if self.width() <= 0:
-            return
+        icon_rect, text_rect, button_rect, status_rect = self._layout(rect)
 
-        if not self.progress_overlay.isVisible():
-            self.progress_overlay.show()
-            self.progress_overlay.raise_()
-
-        start_rect = self.progress_overlay.geometry()
-        target_width = int(self.width() * (self._current_progress / 100.0))
-        end_rect = QRect(0, 0, target_width, self.height())
-
-        # Dừng animation cũ nếu đang chạy
-        self._progress_animation.stop()
-        # Thiết lập giá trị bắt đầu và kết thúc cho animation
-        self._progress_animation.setStartValue(start_rect)
-        self._progress_animation.setEndValue(end_rect)
-        # Bắt đầu animation mới
-        self._progress_animation.start()
-
-        # Throttle update bằng QTimer để tránh overload khi batch (chỉ update mỗi 200ms)
-        if not hasattr(self, '_progress_timer') or not self._progress_timer.isActive():
-            self._progress_timer = QTimer(self)
-            self._progress_timer.setSingleShot(True)
-            self._progress_timer.timeout.connect(self._progress_animation.start)
-            self._progress_timer.start(200)  # Giới hạn update mỗi 200ms
+        # Icon
+        pixmap = self._icon_pixmap(row.icon_path)
+        if not pixmap.isNull():
+            painter.drawPixmap(icon_rect, pixmap)
         else:
-            self._progress_timer.start(200)  # Reset timer nếu đang chạy
+            painter.fillRect(icon_rect, QColor("#34495e"))
+            painter.setPen(QColor("#3498db"))
+            painter.drawRect(icon_rect.adjusted(0, 0, -1, -1))
+            painter.setPen(QColor("#ecf0f1"))
+            painter.drawText(icon_rect, Qt.AlignmentFlag.AlignCenter, "?")
+
+        # Tên và phiên bản
+        name_rect = QRect(text_rect.left(), text_rect.top(), text_rect.width(), text_rect.height() // 2)
+        version_rect = QRect(text_rect.left(), name_rect.bottom() + 1, text_rect.width(), text_rect.height() - name_rect.height())
+        painter.setFont(self.name_font)
+        painter.setPen(QColor(self.NAME_COLORS.get(row.status, "#ecf0f1")))
+        name = painter.fontMetrics().elidedText(row.info.get('display_name', 'N/A'), Qt.TextElideMode.ElideRight, name_rect.width())
+        painter.drawText(name_rect, Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignLeft, name)
+        painter.setFont(self.update_font if row.update_available else self.version_font)
+        painter.setPen(QColor("#2ecc71" if row.update_available else "#bdc3c7"))
+        painter.drawText(version_rect, Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft,
+                         painter.fontMetrics().elidedText(row.version_text, Qt.TextElideMode.ElideRight, version_rect.width()))
 
-        if self._current_progress >= 100:
-            # Nếu đạt 100%, đảm bảo nó lấp đầy ngay lập tức
-            QTimer.singleShot(self._progress_animation.duration(), lambda: self.progress_overlay.setGeometry(0, 0, self.width(), self.height()))
+        # Nút hành động
+        if row.button in self.BUTTONS:
+            text, color, _tooltip = self.BUTTONS[row.button]
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor(color if self.is_button_enabled(row) else self.DISABLED_BUTTON_COLOR))
+            painter.drawRoundedRect(button_rect, 4, 4)
+            painter.setFont(self.header_font)
+            painter.setPen(QColor("white"))
+            painter.drawText(button_rect, Qt.AlignmentFlag.AlignCenter, text)
+
+        # Dấu tick/X hoặc ảnh đang xử lý
+        if row.status in ('success', 'failed'):
+            painter.drawPixmap(status_rect, self.status_pixmap(row.status))
+        elif row.status in AppListModel.BUSY_STATUSES:
+            if self.loading_movie.state() != QMovie.MovieState.Running:
+                self.loading_movie.start()
+            painter.drawPixmap(status_rect, self.loading_movie.currentPixmap())
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease, QEvent.Type.MouseButtonDblClick):
+            return False
+        row = index.data(AppListModel.RowRole)
+        if row is None or row.is_header or not self.is_button_enabled(row):
+            return False
+        if not self._layout(option.rect)[2].contains(event.position().toPoint()):
+            return False
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            self.button_clicked.emit(row.key, row.button)
+        return True
+
+    def helpEvent(self, event, view, option, index):
+        row = index.data(AppListModel.RowRole)
+        if row is not None and not row.is_header and row.button in self.BUTTONS and self._layout(option.rect)[2].contains(event.pos()):
+            tooltip = self.BUTTONS[row.button][2].format(name=row.info.get('display_name', row.key))
+            if tooltip:
+                QToolTip.showText(event.globalPos(), tooltip, view)
+                return True
+        return super().helpEvent(event, view, option, index)
 
 # --- CỬA SỔ CHÍNH ---
 class TekDT_AIS(QMainWindow):
@@ -838,20 +3493,37 @@ class TekDT_AIS(QMainWindow):
         if embed_mode:
             threading.Thread(target=self.check_shutdown_signal, daemon=True).start()
         self.embed_size = embed_size
-        self.config = {}
-        self.remote_apps = {}
-        self.local_apps = {}
+        # Dữ liệu phần mềm (danh sách máy chủ + cấu hình cục bộ) chỉ nằm trong AppState
+        self.app_state = AppState(self)
+        self.app_state.changed.connect(self.on_app_state_changed)
+        self._deferred_state_keys = set() # App đổi dữ liệu giữa lúc đang cài, chờ cập nhật giao diện
         self.selected_for_install = []
         self.active_workers = {}
+        self.install_worker = None
         self.startup_label = None
         self.system_arch = platform.architecture()[0]
-        self.session = requests.Session()
-        self.session.headers.update({'User-Agent': 'TekDT-AIS-App'})
+        self.session = get_http_session()
+        self.catalog_cache = CatalogCache(REMOTE_APP_LIST_URL, CATALOG_CACHE_FILE, index_file=CATALOG_INDEX_FILE)
         self.cli_task_results = {}        
-        self._scroll_positions = {}
         self.is_cli_mode = False
+        self.lan_cache_requested = False # --lan-cache trên dòng lệnh
         self.is_processing = False
         self.central_widget_ref = None
+        # Khởi động nhanh: hiển thị danh sách từ bộ nhớ đệm, kiểm tra công cụ ở nền
+        self.instant_startup = False
+        self.tools_ready = False
+        self._pending_tool_actions = [] # Các hành động cần aria2, chờ kiểm tra công cụ xong
+        self.catalog_refresh_worker = None
+        self._icon_waiters = {} # icon_url -> các app key đang chờ icon
+        self._pipeline_depths = {} # WorkerSignals của worker đang chạy -> số tác vụ ở từng giai đoạn
+        IconService.instance().icon_ready.connect(self.on_icon_ready)
+        IconService.instance().icon_failed.connect(self.on_icon_failed)
+        # Tiến độ tải được gom theo lô ở tần số khung hình cố định (tạo bus trên luồng giao diện)
+        ProgressBus.instance().progress_batch.connect(self.on_progress_batch)
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._filter_timer.timeout.connect(lambda: self.filter_apps(self.search_box.text()))
 
         if self.embed_mode:
             self.setup_embed_ui()
@@ -979,22 +3651,24 @@ class TekDT_AIS(QMainWindow):
             self.startup_overlay.setGeometry(self.rect())
         super().resizeEvent(event)
     
-    def save_scroll_positions(self):
-        """Lưu vị trí hiện tại của các thanh cuộn."""
-        self._scroll_positions['available'] = self.available_list_widget.verticalScrollBar().value()
-        if not self.embed_mode:
-            self._scroll_positions['selected'] = self.selected_list_widget.verticalScrollBar().value()
-
-    def restore_scroll_positions(self):
-        """Phục hồi vị trí của các thanh cuộn."""
-        if 'available' in self._scroll_positions:
-            QTimer.singleShot(0, lambda: self.available_list_widget.verticalScrollBar().setValue(self._scroll_positions['available']))
-        if not self.embed_mode and 'selected' in self._scroll_positions:
-            QTimer.singleShot(0, lambda: self.selected_list_widget.verticalScrollBar().setValue(self._scroll_positions['selected']))
-    
     def on_tool_check_finished(self, success, message):
         self.tool_manager_thread.quit()
         self.tool_manager_thread.wait()
+        self.tools_ready = ARIA2_EXEC.exists()
+
+        if self.instant_startup:
+            # Danh sách đã được hiển thị từ bộ nhớ đệm, chỉ cần mở khóa các hành động cần aria2
+            pending_actions, self._pending_tool_actions = self._pending_tool_actions, []
+            if not self.tools_ready:
+                self.show_styled_message_box(QMessageBox.Icon.Warning, "Cảnh báo",
+                                             f"{message}\nChỉ có thể cài đặt các phần mềm đã được tải về.")
+                if not self.embed_mode and not (self.install_worker and self.install_worker.isRunning()):
+                    self.start_button.setEnabled(True)
+                return
+            for action in pending_actions:
+                action()
+            return
+
         # Ẩn overlay và kích hoạt lại UI
         if hasattr(self, 'startup_overlay'):
             self.startup_overlay.hide()
@@ -1010,6 +3684,8 @@ class TekDT_AIS(QMainWindow):
         
         # Tiếp tục tải cấu hình và ứng dụng
         self.load_config_and_apps()
+        if self.tools_ready and not self.is_cli_mode:
+            self.resume_journaled_downloads()
 
     def setup_embed_ui(self):
         self.setWindowTitle(f"{APP_NAME}")
@@ -1021,8 +3697,7 @@ class TekDT_AIS(QMainWindow):
         self.setStyleSheet("""
             QWidget { background-color: #2c3e50; }
             QLabel { color: #ecf0f1; font-size: 10pt; }
-            QListWidget { background-color: #34495e; border: 1px solid #2c3e50; color: #ecf0f1; font-size: 11pt; }
-            QListWidget::item { padding: 5px; border-bottom: 1px solid #2c3e50; }
+            QListView { background-color: #34495e; border: 1px solid #2c3e50; color: #ecf0f1; font-size: 11pt; }
             QPushButton { background-color: #3498db; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold; }
             QPushButton:hover { background-color: #2980b9; }
             QPushButton:disabled { background-color: #95a5a6; }
@@ -1037,57 +3712,72 @@ class TekDT_AIS(QMainWindow):
         # Chỉ giữ lại khung tìm kiếm và danh sách phần mềm
         self.search_box = QLineEdit()
         self.search_box.setPlaceholderText("Gõ để tìm kiếm...")
-        self.search_box.textChanged.connect(self.filter_apps)
+        self.search_box.textChanged.connect(self.schedule_filter)
         
-        self.available_list_widget = QListWidget()
+        self.available_list_view = self.create_app_list_view(self.on_available_button_clicked)
+        self.available_model = self.available_list_view.model()
+        self.available_filter = AppListFilter(self.available_model)
         
         main_layout.addWidget(self.search_box)
-        main_layout.addWidget(self.available_list_widget)
+        main_layout.addWidget(self.available_list_view)
+
+    @staticmethod
+    def create_app_list_view(on_button_clicked=None):
+        """Tạo QListView cho danh sách phần mềm, các hàng được AppItemDelegate vẽ thay vì mỗi hàng một widget."""
+        view = QListView()
+        view.setModel(AppListModel(view))
+        delegate = AppItemDelegate(view)
+        if on_button_clicked is not None:
+            delegate.button_clicked.connect(on_button_clicked)
+        view.setItemDelegate(delegate)
+        view.setMouseTracking(True)
+        view.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        # Dựng layout theo lô để danh sách lớn không chặn giao diện
+        view.setLayoutMode(QListView.LayoutMode.Batched)
+        view.setBatchSize(200)
+        return view
+
+    def app_models(self):
+        """Các model danh sách đang hiển thị (bên trái, và bên phải nếu không ở chế độ embed)."""
+        return [self.available_model] if self.embed_mode else [self.available_model, self.selected_model]
+
+    def on_progress_batch(self, batch):
+        for app_key, percentage in batch.items():
+            self.update_download_progress_anywhere(app_key, percentage)
 
     def update_download_progress_anywhere(self, app_key, percentage):
-        # Tìm widget ở available_list_widget
-        for i in range(self.available_list_widget.count()):
-            item = self.available_list_widget.item(i)
-            widget = self.available_list_widget.itemWidget(item)
-            if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                widget.update_download_progress(app_key, percentage)
+        # Ưu tiên hàng ở danh sách bên trái, nếu không có thì tìm ở danh sách đã chọn.
+        # Chỉ vẽ lại hàng khi giá trị thực sự thay đổi.
+        for model in self.app_models():
+            row = model.row_for_key(app_key)
+            if row is not None:
+                if row.progress != float(percentage):
+                    model.update_row(app_key, progress=float(percentage))
                 return
-        # Nếu không tìm thấy, tìm ở selected_list_widget (nếu không embed)
-        if not self.embed_mode:
-            for i in range(self.selected_list_widget.count()):
-                item = self.selected_list_widget.item(i)
-                widget = self.selected_list_widget.itemWidget(item)
-                if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                    widget.update_download_progress(app_key, percentage)
-                    return
     
     def on_tasks_batch_completed(self, completed_items):
-        """Cập nhật hàng loạt thông tin phần mềm vào bộ nhớ đệm."""
-        self.local_apps.update(completed_items)
-        # Cập nhật cả trong config đang chạy để đồng bộ
-        self.config['app_items'].update(completed_items)
+        """Cập nhật hàng loạt thông tin phần mềm (đã ghi vào kho cấu hình) vào AppState."""
+        self.app_state.update_local(completed_items)
+
+    def on_app_state_changed(self, keys):
+        # Không dựng lại danh sách giữa lúc đang cài đặt; reset_ui_after_completion sẽ làm việc này
+        if self.install_worker and self.install_worker.isRunning():
+            self._deferred_state_keys.update(keys)
+            return
+        self.reconcile_lists(keys)
     
     def is_app_downloaded(self, app_key, app_info):
         """
         Kiểm tra xem tệp cài đặt của ứng dụng đã được tải về hoàn chỉnh hay chưa.
+        Chạy trên luồng giao diện nên không băm file; InstallWorker kiểm tra SHA-256 trước khi cài.
         """
-        download_url = app_info.get('download_url', '')
-        if not download_url:
-            return False
-
-        file_name = app_info.get('output_filename', Path(download_url).name)
-        download_path = APPS_DIR / app_key / file_name
-        
-        # Tạo đường dẫn tới file control của aria2
-        aria2_control_file = download_path.with_suffix(download_path.suffix + '.aria2')
-
-        # Điều kiện mới: File cài đặt phải tồn tại VÀ file .aria2 không được tồn tại.
-        return download_path.exists() and not aria2_control_file.exists()
+        return is_download_complete(app_key, app_info, verify=False)
 
     def handle_cli_args(self, args):
         """Xử lý các tham số dòng lệnh cho /install và /update."""
-        self.load_config_and_apps(populate=False)
-        if not self.remote_apps.get('app_items'):
+        self.load_config_and_apps()
+        if not self.app_state.has_catalog():
             self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi", "Không thể tải danh sách phần mềm. Không thể tiếp tục.")
             QApplication.quit()
             return
@@ -1109,12 +3799,12 @@ class TekDT_AIS(QMainWindow):
             target_keys = set(app_names_str.split('|'))
         elif is_update_action and not is_install_action: # Chỉ /update
             # Lấy tất cả các app đã được tải về
-            for key, info in self.local_apps.items():
+            for key, info in self.app_state.local_items().items():
                 if self.is_app_downloaded(key, info): # Chỉ cập nhật app đã có file
                     target_keys.add(key)
         elif is_install_action: # /install hoặc /install /update không có tên app
             # Lấy các app có auto_install=true và đã được tải về
-            for key, info in self.local_apps.items():
+            for key, info in self.app_state.local_items().items():
                 if info.get('auto_install', False) and self.is_app_downloaded(key, info):
                      target_keys.add(key)
         
@@ -1126,18 +3816,18 @@ class TekDT_AIS(QMainWindow):
         }
         
         for key in target_keys:
-            remote_info = self.remote_apps.get('app_items', {}).get(key)
+            remote_info = self.app_state.remote_info(key)
             if not remote_info:
                 if is_update_action: report['update']['skipped_not_found'].append(key)
                 if is_install_action: report['install']['skipped_not_found'].append(key)
                 continue
-            local_info = self.local_apps.get(key, {})
+            local_info = self.app_state.local_info(key)
             if not self.is_app_downloaded(key, remote_info):
                 if is_update_action: report['update']['skipped_online'].append(key)
                 if is_install_action: report['install']['skipped_online'].append(key)
                 continue
             
-            needs_update = is_update_action and parse_version(remote_info.get('version', '0')) > parse_version(local_info.get('version', '0'))
+            needs_update = is_update_action and self.app_state.index.version(key) > cached_version(local_info.get('version', '0'))
             needs_install = is_install_action
 
             if needs_update:
@@ -1162,13 +3852,13 @@ class TekDT_AIS(QMainWindow):
 
         # --- Hiển thị giao diện và bắt đầu Worker ---
         self.show()
-        self.populate_lists()
+        self.reconcile_lists()
         for key, task_def in worker_tasks.items():
             self.move_app_to_selection(key, task_def['info'])
         
         self.set_ui_interactive(False)
         
-        self.install_worker = InstallWorker(worker_tasks)
+        self.install_worker = InstallWorker(worker_tasks, self.app_state.settings.get('max_parallel_installs', DEFAULT_MAX_PARALLEL_INSTALLS))
 
         def on_cli_finished():
             for key, result in self.cli_task_results.items():
@@ -1200,15 +3890,15 @@ class TekDT_AIS(QMainWindow):
 
             final_message = "\n\n".join(summary_lines)
             self.show_styled_message_box(QMessageBox.Icon.Information, "Hoàn tất tác vụ dòng lệnh", final_message)
-            self.load_config_and_apps(populate=False)
             QApplication.quit()
 
         self.install_worker.signals.progress.connect(self.update_and_record_progress)
-        self.install_worker.signals.progress_percentage.connect(self.update_download_progress_anywhere)
         self.install_worker.signals.finished.connect(on_cli_finished)
         self.install_worker.signals.error.connect(lambda e: self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi Worker", str(e)))
         self.install_worker.signals.update_widget_status.connect(self.update_widget_status)
         self.install_worker.signals.tasks_batch_completed.connect(self.on_tasks_batch_completed)
+        self.install_worker.signals.stage_depths.connect(self.update_pipeline_status)
+        self.install_worker.signals.finished.connect(self.clear_pipeline_status)
         self.install_worker.start()
 
     def update_and_record_progress(self, app_key, status, message):
@@ -1228,9 +3918,7 @@ class TekDT_AIS(QMainWindow):
         self.setStyleSheet("""
             QMainWindow { background-color: #2c3e50; }
             QLabel { color: #ecf0f1; font-size: 10pt; }
-            QListWidget { background-color: #34495e; border: 1px solid #2c3e50; color: #ecf0f1; font-size: 11pt; }
-            QListWidget::item { padding: 5px; border-bottom: 1px solid #2c3e50; }
-            QListWidget::item:hover { background-color: #4a627a; }
+            QListView { background-color: #34495e; border: 1px solid #2c3e50; color: #ecf0f1; font-size: 11pt; }
             QPushButton { background-color: #3498db; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold; }
             QPushButton:hover { background-color: #2980b9; }
             QPushButton:disabled { background-color: #95a5a6; }
@@ -1250,20 +3938,23 @@ class TekDT_AIS(QMainWindow):
         left_layout = QVBoxLayout(left_panel)
         self.search_box = QLineEdit()
         self.search_box.setPlaceholderText("Gõ để tìm kiếm (tối thiểu 2 ký tự)...")
-        self.search_box.textChanged.connect(self.filter_apps)
+        self.search_box.textChanged.connect(self.schedule_filter)
         self.available_count_label = QLabel("Tổng số phần mềm: 0")
-        self.available_list_widget = QListWidget()
+        self.available_list_view = self.create_app_list_view(self.on_available_button_clicked)
+        self.available_model = self.available_list_view.model()
+        self.available_filter = AppListFilter(self.available_model)
         left_layout.addWidget(self.search_box)
         left_layout.addWidget(self.available_count_label)
-        left_layout.addWidget(self.available_list_widget)
+        left_layout.addWidget(self.available_list_view)
         
         # --- Right Panel (Selected Apps) ---
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
         self.selected_count_label = QLabel("Đã chọn: 0")
-        self.selected_list_widget = QListWidget()
+        self.selected_list_view = self.create_app_list_view(self.on_selected_button_clicked)
+        self.selected_model = self.selected_list_view.model()
         right_layout.addWidget(self.selected_count_label)
-        right_layout.addWidget(self.selected_list_widget)
+        right_layout.addWidget(self.selected_list_view)
         
         panels_layout.addWidget(left_panel)
         panels_layout.addWidget(right_panel)
@@ -1278,8 +3969,12 @@ class TekDT_AIS(QMainWindow):
         self.start_button.setMinimumHeight(40)
 
         self.status_label = QLabel("Trạng thái: Sẵn sàng.")
+        # Số tác vụ ở từng giai đoạn của pipeline, chỉ hiện khi có worker đang chạy
+        self.pipeline_label = QLabel()
+        self.pipeline_label.hide()
         
         bottom_layout.addWidget(self.status_label, 1)
+        bottom_layout.addWidget(self.pipeline_label)
         bottom_layout.addWidget(self.start_button)
         
         main_layout.addLayout(panels_layout)
@@ -1288,267 +3983,355 @@ class TekDT_AIS(QMainWindow):
     def set_ui_interactive(self, enabled):
         """Enable or disable all interactive UI elements except the stop button when disabled."""
         self.search_box.setEnabled(enabled)
-        self.available_list_widget.setEnabled(enabled)
+        self.available_list_view.setEnabled(enabled)
         
         # Cập nhật các mục trong danh sách đã chọn
-        for i in range(self.selected_list_widget.count()):
-            item = self.selected_list_widget.item(i)
-            widget = self.selected_list_widget.itemWidget(item)
-            if hasattr(widget, 'action_button'):
-                if not enabled:
-                    # Ẩn nút "Bỏ" và hiển thị trạng thái "processing" khi bắt đầu cài đặt
-                    widget.action_button.hide()
-                    widget.set_status("processing")
-                else:
-                    # Hiển thị lại nút "Bỏ" và ẩn trạng thái khi kết thúc
-                    widget.action_button.show()
-                    widget.set_status("")
-                widget.action_button.setEnabled(enabled)
-    
-    def load_config_and_apps(self, populate=True):
-        # Load local config
-        if CONFIG_FILE.exists():
-            try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    self.config = json.loads(content) if content else {}
-            except json.JSONDecodeError:
-                self.config = {}
+        if not enabled:
+            # Ẩn nút "Bỏ" và hiển thị trạng thái "processing" khi bắt đầu cài đặt
+            self.selected_model.update_all(button=None, status="processing")
         else:
-            self.config = {"settings": {}, "app_items": {}}
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-
-        # Luôn đảm bảo các khóa chính tồn tại
-        self.config.setdefault('settings', {})
-        self.config.setdefault('app_items', {})
+            # Hiển thị lại nút "Bỏ" và ẩn trạng thái khi kết thúc
+            self.selected_model.update_all(button='remove', status="")
+    
+    def load_local_config(self):
+        """Nạp kho cấu hình vào AppState và self.selected_for_install."""
+        try:
+            config = CONFIG_STORE.load()
+        except sqlite3.Error as e:
+            print(f"Không thể đọc cấu hình: {e}")
+            config = {"settings": {}, "app_items": {}}
 
-        self.local_apps = self.config.get("app_items", {})
-        
         if not self.embed_mode:
-            self.selected_for_install = self.config.get("settings", {}).get("selected_for_install", [])
+            # Đặt trước khi AppState báo thay đổi để danh sách được dựng với lựa chọn đã lưu
+            self.selected_for_install = config["settings"].get("selected_for_install", [])
             if not isinstance(self.selected_for_install, list):
                 self.selected_for_install = []
+        self.app_state.load_local(config)
+        self.apply_download_limits()
+        self.apply_lan_cache()
+
+    def offline_catalog(self, app_items):
+        """Danh sách dùng khi offline: chỉ giữ lại các app đã được tải về."""
+        return {"app_items": {
+            key: info for key, info in app_items.items()
+            if self.is_app_downloaded(key, info)
+        }}
+
+    def load_config_and_apps(self):
+        """Nạp cấu hình và danh sách phần mềm; AppState báo các app thay đổi để dựng danh sách."""
+        self.load_local_config()
         
         is_online = False
         
         try:
             status_text = "Đang tải danh sách phần mềm từ máy chủ..."
             if hasattr(self, 'status_label') and self.status_label: self.status_label.setText(status_text)
-            response = self.session.get(REMOTE_APP_LIST_URL, timeout=10)
-            response.raise_for_status()
-            self.remote_apps = response.json()
+            # Dùng bộ nhớ đệm có điều kiện (ETag/Last-Modified + TTL) thay vì tải lại toàn bộ
+            catalog, changed = self.catalog_cache.fetch(self.session, timeout=10)
+            index = self.catalog_cache.index_for(catalog)
             is_online = True
-            status_text = "Tải danh sách thành công. Sẵn sàng."
+            status_text = "Tải danh sách thành công. Sẵn sàng." if changed else "Danh sách phần mềm không thay đổi. Sẵn sàng."
             if hasattr(self, 'status_label') and self.status_label: self.status_label.setText(status_text)
         except requests.RequestException as e:
             if not self.is_cli_mode:
                 self.show_styled_message_box(QMessageBox.Icon.Warning, "Lỗi mạng", f"Không thể tải danh sách phần mềm từ máy chủ: {e}\nChương trình sẽ chỉ hiển thị các phần mềm đã có thông tin cục bộ.")
             else:
                 print(f"Lưu ý: Không thể tải danh sách phần mềm từ máy chủ. Tiếp tục với dữ liệu cục bộ.")
-            self.remote_apps = {"app_items": self.local_apps.copy()}
+            catalog = {"app_items": self.app_state.local_items()}
+            index = None
             if hasattr(self, 'status_label') and self.status_label:
                 self.status_label.setText("Chế độ Offline. Hiển thị các phần mềm đã tải.")
         
         # Nếu đang ở chế độ offline, lọc danh sách để chỉ giữ lại các app đã được tải về.
         if not is_online:
-            all_local_apps = self.remote_apps.get("app_items", {})
-            downloaded_apps_only = {
-                key: info for key, info in all_local_apps.items()
-                if self.is_app_downloaded(key, info)
-            }
-            self.remote_apps["app_items"] = downloaded_apps_only
-        
-        # Chỉ populate list nếu được yêu cầu (tránh làm việc thừa khi chạy CLI)
-        if populate:
-            self.populate_lists()
-        
-    def populate_lists(self):
-        if hasattr(self, '_populate_timer'):
-            self._populate_timer.stop()
-        if self.is_processing:
+            catalog = self.offline_catalog(catalog.get("app_items", {}))
+            index = None
+        self.app_state.set_catalog(catalog.get("app_items", {}), index)
+
+    def start_from_cache(self):
+        """
+        Khởi động kiểu stale-while-revalidate: hiển thị ngay danh sách từ bộ nhớ đệm và
+        kho cấu hình, trong khi kiểm tra công cụ và làm mới danh sách chạy song song ở nền.
+        Trả về False nếu chưa có bộ nhớ đệm (lần chạy đầu), khi đó dùng luồng khởi động cũ.
+        """
+        if self.catalog_cache.catalog is None:
+            return False
+
+        self.instant_startup = True
+        if hasattr(self, 'startup_overlay'):
+            self.startup_overlay.hide()
+        if self.central_widget_ref:
+            self.central_widget_ref.setEnabled(True)
+        self.load_local_config()
+        self.app_state.set_catalog(self.catalog_cache.catalog.get('app_items', {}), self.catalog_cache.index)
+
+        if hasattr(self, 'status_label') and self.status_label:
+            self.status_label.setText("Đang làm mới danh sách phần mềm...")
+        self.refresh_catalog_async()
+        return True
+
+    def refresh_catalog_async(self):
+        if self.catalog_refresh_worker and self.catalog_refresh_worker.isRunning():
             return
-        self.save_scroll_positions()
-        self.available_list_widget.clear()
-        if not self.embed_mode:
-            self.selected_list_widget.clear()
-        
-        all_apps = self.remote_apps.get("app_items", {})
-        
-        # Lọc ứng dụng dựa trên cấu trúc hệ thống
-        compatible_apps = {}
-        for key, app_info in all_apps.items():
-            compatible_os_arch = app_info.get('compatible_os_arch', 'both')
-            if (self.system_arch == '64bit' and compatible_os_arch in ['64bit', 'both']) or \
-               (self.system_arch == '32bit' and compatible_os_arch in ['32bit', 'both']):
-                compatible_apps[key] = app_info.copy()
+        self.catalog_refresh_worker = CatalogRefreshWorker(self.catalog_cache, self.session)
+        self.catalog_refresh_worker.refreshed.connect(self.on_catalog_refreshed)
+        self.catalog_refresh_worker.failed.connect(self.on_catalog_refresh_failed)
+        self.catalog_refresh_worker.start()
+
+    def apply_catalog(self, catalog):
+        """Áp dụng danh sách mới; AppState chỉ báo các app thay đổi nên chỉ các hàng đó được cập nhật."""
+        self.app_state.set_catalog(catalog.get('app_items', {}), self.catalog_cache.index_for(catalog))
+
+    def on_catalog_refreshed(self, catalog, changed):
+        if hasattr(self, 'status_label') and self.status_label:
+            self.status_label.setText("Tải danh sách thành công. Sẵn sàng." if changed else "Danh sách phần mềm không thay đổi. Sẵn sàng.")
+        self.apply_catalog(catalog)
+
+    def on_catalog_refresh_failed(self, error):
+        print(f"Lưu ý: Không thể làm mới danh sách phần mềm từ máy chủ: {error}")
+        if hasattr(self, 'status_label') and self.status_label:
+            self.status_label.setText("Chế độ Offline. Hiển thị các phần mềm đã tải.")
+        self.apply_catalog(self.offline_catalog(self.catalog_cache.catalog.get('app_items', {})))
+
+    def run_when_tools_ready(self, action):
+        """Chạy ngay hành động cần aria2 nếu công cụ đã sẵn sàng, nếu không thì chờ kiểm tra công cụ xong."""
+        if self.tools_ready:
+            action()
+            return
+        if self.instant_startup and not self.tool_manager_thread.isRunning():
+            self.show_styled_message_box(QMessageBox.Icon.Warning, "Cảnh báo", "Thiếu công cụ aria2 nên không thể tải phần mềm.")
+            return
+        self._pending_tool_actions.append(action)
+        if hasattr(self, 'status_label') and self.status_label:
+            self.status_label.setText("Đang chờ kiểm tra công cụ hoàn tất...")
         
-        for key, local_info in self.local_apps.items():
-            if key in compatible_apps:
-                compatible_apps[key].update(local_info)
-
-        config_needs_saving = False
+    def apply_download_limits(self):
+        """Áp dụng giới hạn tải trong settings cho bộ lập lịch tải dùng chung."""
+        settings = self.app_state.settings
         try:
-            self.session.get("https://www.google.com", timeout=3)
-            for key, app_info in compatible_apps.items():
-                icon_file = app_info.get('icon_file')
-                icon_url = app_info.get('icon_url')
-                if not icon_url: continue
+            AriaDownloadManager.instance().configure(
+                settings.get('max_concurrent_downloads', DEFAULT_MAX_CONCURRENT_DOWNLOADS),
+                settings.get('max_connections_per_host', DEFAULT_MAX_CONNECTIONS_PER_HOST),
+                settings.get('connections_per_download', DEFAULT_CONNECTIONS_PER_DOWNLOAD)
+            )
+        except (TypeError, ValueError) as e:
+            print(f"Giới hạn tải trong cấu hình không hợp lệ, dùng giá trị mặc định: {e}")
 
-                icon_filename = Path(icon_url).name
-                app_dir = APPS_DIR / key
-                icon_path = app_dir / icon_filename
+    def apply_lan_cache(self):
+        """Bật bộ đệm LAN nếu chạy với --lan-cache hoặc settings có "lan_cache": true."""
+        if not (self.lan_cache_requested or self.app_state.settings.get('lan_cache')):
+            return
+        try:
+            LanPeerCache.instance().start()
+        except OSError as e:
+            print(f"Không thể bật bộ đệm LAN: {e}")
 
-                if not icon_file or not icon_path.exists():
-                    try:
-                        app_dir.mkdir(exist_ok=True)
-                        icon_response = self.session.get(icon_url, timeout=5)
-                        icon_response.raise_for_status()
-                        with open(icon_path, 'wb') as f:
-                            f.write(icon_response.content)
-                        compatible_apps[key]['icon_file'] = icon_filename
-                        self.config['app_items'].setdefault(key, {})
-                        self.config['app_items'][key]['icon_file'] = icon_filename
-                        config_needs_saving = True
-                    except requests.RequestException:
-                        compatible_apps[key]['icon_file'] = 'default_icon.png'
-        except requests.ConnectionError:
-            pass
+    def compatible_app_info(self, key):
+        """
+        Thông tin đã gộp (danh sách máy chủ + cấu hình cục bộ) của một app, None nếu không có hoặc không hợp kiến trúc máy.
+        Đây là bản dùng chung của AppState, chỉ được đọc.
+        """
+        if not self.app_state.index.is_compatible(key, self.system_arch):
+            return None
+        return self.app_state.info(key)
 
-        if config_needs_saving:
-            self.save_config()
+    def compatible_app_items(self):
+        """{app_key: thông tin đã gộp} của các app hợp kiến trúc máy, theo thứ tự danh mục rồi tên."""
+        return {key: self.app_state.info(key)
+                for _, keys in self.app_state.index.grouped(self.system_arch) for key in keys}
 
-        categories = sorted(list(set(app.get('category', 'Chưa phân loại') for app in compatible_apps.values())))
-        
-        for category in categories:
-            cat_item = QListWidgetItem(category.upper())
-            cat_item.setFlags(cat_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
-            font = QFont()
-            font.setBold(True)
-            cat_item.setFont(font)
-            cat_item.setForeground(QColor("#3498db"))
-            self.available_list_widget.addItem(cat_item)
-
-            for key, info in sorted(compatible_apps.items(), key=lambda item: item[1].get('display_name', '')):
-                if info.get('category', 'Chưa phân loại') == category:
-                    self.add_app_to_list(self.available_list_widget, key, info)
+    def reconcile_lists(self, changed_keys=None):
+        """
+        Đồng bộ hai danh sách với trạng thái hiện tại thay vì xóa và dựng lại.
+        changed_keys là các app có thể đã đổi (phiên bản, đã tải, lựa chọn, auto_install), None là kiểm tra tất cả.
+        Hàng chỉ đổi nội dung được cập nhật tại chỗ; chỉ khi app được thêm/bớt hoặc đổi tên/danh mục
+        mới chèn/xóa hàng, nên vị trí cuộn và bộ lọc tìm kiếm được giữ nguyên.
+        """
+        if self.is_processing:
+            return
+        compatible_apps = None
+        if changed_keys is None or self.list_structure_changed(changed_keys):
+            compatible_apps = self.compatible_app_items()
+            self.reconcile_available_list(compatible_apps, changed_keys)
+        else:
+            for key in changed_keys:
+                row = self.available_model.row_for_key(key)
+                if row is not None:
+                    self.refresh_available_row(row, self.compatible_app_info(key))
+                    self.available_model.update_row(key)
+                    self.available_filter.index.set_entry(key, row.info)
+            if self.search_box.text().strip():
+                self.filter_apps(self.search_box.text()) # Mô tả có thể đã đổi
 
         if not self.embed_mode:
-            # Xóa các mục đã chọn không còn tương thích
-            valid_selected = [key for key in self.selected_for_install if key in compatible_apps]
-            self.selected_for_install = valid_selected
-            
-            for key in self.selected_for_install:
-                self.move_app_to_selection(key, compatible_apps[key])
+            self.reconcile_selected_list(compatible_apps, changed_keys)
 
         self.update_counts()
-        self.restore_scroll_positions()
 
-    def add_app_to_list(self, list_widget, key, info):
-        item_widget = AppItemWidget(key, info, embed_mode=self.embed_mode)
+    def list_structure_changed(self, changed_keys):
+        """True nếu một app trong changed_keys xuất hiện, biến mất, đổi tên hoặc đổi danh mục."""
+        for key in changed_keys:
+            app_info = self.compatible_app_info(key)
+            row = self.available_model.row_for_key(key)
+            if (app_info is None) != (row is None):
+                return True
+            if row is not None and (app_info.get('category', 'Chưa phân loại') != row.category or
+                                    app_info.get('display_name', '') != row.info.get('display_name', '')):
+                return True
+        return False
+
+    def reconcile_available_list(self, compatible_apps, changed_keys):
+        headers = {row.category: row for row in self.available_model.rows() if row.is_header}
+        rows = []
+        # Nhóm danh mục và thứ tự theo tên đã được tính sẵn trong CatalogIndex
+        for category, keys in self.app_state.index.grouped(self.system_arch):
+            rows.append(headers.get(category) or AppRow(category=category))
+            for key in keys:
+                info = compatible_apps[key]
+                row = self.available_model.row_for_key(key)
+                if row is None:
+                    row = AppRow(key)
+                    self.refresh_available_row(row, info)
+                elif changed_keys is None or key in changed_keys:
+                    self.refresh_available_row(row, info)
+                rows.append(row)
+
+        self.available_model.reconcile(rows, changed_keys)
+        # Chỉ mục tìm kiếm dựng lại một lần cho mỗi lần nạp danh sách; lọc lại để hàng mới chèn theo đúng từ khóa đang gõ
+        self.available_filter.index.build(compatible_apps)
+        self.filter_apps(self.search_box.text())
+
+    def reconcile_selected_list(self, compatible_apps, changed_keys):
+        rows = []
+        valid_selected = []
+        for key in self.selected_for_install:
+            info = compatible_apps.get(key) if compatible_apps is not None else self.compatible_app_info(key)
+            if info is None:
+                continue # Xóa các mục đã chọn không còn tương thích
+            valid_selected.append(key)
+            row = self.selected_model.row_for_key(key)
+            if row is None:
+                row = self.build_selected_row(key, info)
+            elif changed_keys is None or key in changed_keys:
+                self.refresh_selected_row(row, info)
+            rows.append(row)
+
+        if valid_selected != self.selected_for_install:
+            self.selected_for_install = valid_selected
+            self.save_config()
+        self.selected_model.reconcile(rows, changed_keys)
+
+    def request_row_icon(self, key, info):
+        # Icon được tải song song ở nền; các hàng dùng icon mặc định cho đến khi icon về
+        icon_url = info.get('icon_url')
+        if icon_url and IconService.instance().request(icon_url) is None:
+            self._icon_waiters.setdefault(icon_url, set()).add(key)
+        return resolve_icon_path(key, info)
+
+    def refresh_available_row(self, row, info):
+        row.info = info
+        row.category = info.get('category', 'Chưa phân loại')
+        row.icon_path = self.request_row_icon(row.key, info)
+        if row.status not in AppListModel.BUSY_STATUSES:
+            # Dấu ✓/✗ của lần chạy trước không còn đúng khi hàng được tính lại, như lúc dựng lại cả danh sách
+            row.status = ''
+            row.progress = 0.0
+        self.apply_available_state(row)
+
+    def build_selected_row(self, key, info):
+        row = AppRow(key)
+        row.button = 'remove'
+        self.refresh_selected_row(row, info)
+        return row
+
+    def refresh_selected_row(self, row, info):
+        row.info = info
+        row.category = info.get('category', 'Chưa phân loại')
+        row.icon_path = self.request_row_icon(row.key, info)
+        row.version_text = f"Phiên bản: {info.get('version', 'N/A')}"
+
+    def apply_available_state(self, row):
+        """Tính nút và dòng phiên bản của một hàng ở danh sách bên trái theo trạng thái tải/cập nhật/chọn."""
+        key, info = row.key, row.info
         is_downloaded = self.is_app_downloaded(key, info)
-        local_ver_str = self.local_apps.get(key, {}).get('version', '0')
-        remote_ver_str = self.remote_apps.get('app_items', {}).get(key, {}).get('version', '0')
-        is_update_available = is_downloaded and parse_version(remote_ver_str) > parse_version(local_ver_str)
+        local_ver_str = self.app_state.local_info(key).get('version', '0')
+        remote_ver_str = (self.app_state.remote_info(key) or {}).get('version', '0')
+        row.update_available = is_downloaded and self.app_state.index.version(key) > cached_version(local_ver_str)
 
         # Luôn hiển thị thông báo nếu có cập nhật
-        if is_update_available:
-            item_widget.version_label.setText(f"Cập nhật: {local_ver_str} -> {remote_ver_str}")
-            item_widget.version_label.setStyleSheet("color: #2ecc71; font-weight: bold;") # Màu xanh lá
-
-        # Ngắt kết nối mặc định để thiết lập lại cho từng trường hợp
-        item_widget.action_button.clicked.disconnect()
+        if row.update_available:
+            row.version_text = f"Cập nhật: {local_ver_str} -> {remote_ver_str}"
+        else:
+            row.version_text = f"Phiên bản: {info.get('version', 'N/A')}"
 
         if not is_downloaded:
-            # --- TRƯỜNG HỢP 1: CHƯA TẢI VỀ ---
-            item_widget.action_button.setText("Tải")
-            item_widget.action_button.setToolTip(f"Tải về {info['display_name']}")
-            item_widget.action_button.setStyleSheet("background-color: #f39c12; color: white;") # Màu cam
-            # Hành động tải không thay đổi giữa các chế độ
-            item_widget.action_button.clicked.connect(lambda _, k=key, i=info, w=item_widget: self.confirm_download(k, i, w))
-
+            row.button = 'download' # Chưa tải về: hành động tải không thay đổi giữa các chế độ
         elif self.embed_mode:
-            # --- TRƯỜNG HỢP 2: ĐÃ TẢI VỀ (CHẾ ĐỘ EMBED) ---
-            is_auto = self.local_apps.get(key, {}).get('auto_install', False)
-            if is_auto:
-                item_widget.set_auto_install_button_state(True) # Nút "Xoá"
-                # Hành động Xoá: chỉ cần bật/tắt auto_install
-                item_widget.action_button.clicked.connect(
-                    lambda _, w=item_widget, k=key: (w.auto_install_toggled.emit(k, False), w.set_auto_install_button_state(False))
-                )
-            else:
-                item_widget.set_auto_install_button_state(False) # Nút "Thêm"
-                # Hành động Thêm:
-                # 1. Kiểm tra cập nhật (nếu có)
-                # 2. Sau đó bật auto_install = true
-                on_complete_action = lambda: item_widget.auto_install_toggled.emit(key, True)
-                if is_update_available:
-                    # Nếu có cập nhật -> gọi confirm_update với hành động sau cùng là bật auto_install
-                    item_widget.action_button.clicked.connect(lambda _, k=key, i=info, w=item_widget, lv=local_ver_str, rv=remote_ver_str, cb=on_complete_action: self.confirm_update(k, i, w, lv, rv, on_complete=cb))
-                else:
-                    # Nếu không có cập nhật -> thực hiện hành động sau cùng ngay lập tức
-                    item_widget.action_button.clicked.connect(
-                        lambda _, w=item_widget, k=key: (w.auto_install_toggled.emit(k, True), w.set_auto_install_button_state(True))
-                    )
-            
-            item_widget.auto_install_toggled.connect(self.on_auto_install_toggled)
+            row.button = 'auto_on' if self.app_state.local_info(key).get('auto_install', False) else 'auto_off'
+        elif key in self.selected_for_install:
+            row.button = 'selected' # Đã có trong danh sách chọn
+        else:
+            row.button = 'add'
+        row.button_enabled = True
 
-        else: # Chế độ thông thường
-            # --- TRƯỜNG HỢP 3: ĐÃ TẢI VỀ (CHẾ ĐỘ THƯỜNG) ---
-            item_widget.action_button.setText("Thêm")
-            item_widget.action_button.setToolTip(f"Thêm {info['display_name']} vào danh sách")
-            item_widget.action_button.setStyleSheet("background-color: #4CAF50; color: white;")
-            
+    def on_available_button_clicked(self, key, button):
+        row = self.available_model.row_for_key(key)
+        if row is None:
+            return
+        info = row.info
+        if button == 'download':
+            self.confirm_download(key, info)
+        elif button == 'auto_on':
+            # Hành động Xoá: chỉ cần tắt auto_install
+            self.on_auto_install_toggled(key, False)
+        elif button in ('add', 'auto_off'):
             # Hành động Thêm:
             # 1. Kiểm tra cập nhật (nếu có)
-            # 2. Sau đó chuyển sang khung bên phải
-            on_complete_action = lambda: self.move_app_to_selection(key, info)
-            if is_update_available:
-                # Nếu có cập nhật -> gọi confirm_update với hành động sau cùng là chuyển khung
-                item_widget.action_button.clicked.connect(lambda _, k=key, i=info, w=item_widget, lv=local_ver_str, rv=remote_ver_str, cb=on_complete_action: self.confirm_update(k, i, w, lv, rv, on_complete=cb))
+            # 2. Sau đó chuyển sang khung bên phải (hoặc bật auto_install ở chế độ embed)
+            if self.embed_mode:
+                on_complete_action = lambda: self.on_auto_install_toggled(key, True)
             else:
-                item_widget.action_button.clicked.connect(on_complete_action)
+                on_complete_action = lambda: self.move_app_to_selection(key, info)
+            if row.update_available:
+                local_ver_str = self.app_state.local_info(key).get('version', '0')
+                remote_ver_str = (self.app_state.remote_info(key) or {}).get('version', '0')
+                self.confirm_update(key, info, local_ver_str, remote_ver_str, on_complete=on_complete_action)
+            else:
+                on_complete_action()
 
-        list_item = QListWidgetItem()
-        list_item.setSizeHint(QSize(0, 70))
-        list_item.setData(Qt.ItemDataRole.UserRole, key)
-        
-        list_widget.addItem(list_item)
-        list_widget.setItemWidget(list_item, item_widget)
-        
-        # Nếu đã có trong danh sách chọn, vô hiệu hóa nút
-        if not self.embed_mode and key in self.selected_for_install:
-            self.update_available_item_state(key, is_selected=True)
+    def on_selected_button_clicked(self, key, button):
+        row = self.selected_model.row_for_key(key)
+        if row is not None and button == 'remove':
+            self.remove_app_from_selection(key, row.info)
 
     def on_auto_install_toggled(self, key, state):
-        self.config['app_items'].setdefault(key, {})
-        self.config['app_items'][key]['auto_install'] = state
-        self.save_config()
-        if self.embed_mode:
-            self.populate_lists()
-
-    def find_widget_by_key(self, app_key):
-        """Tìm widget trong available_list_widget hoặc selected_list_widget theo app_key."""
-        for i in range(self.available_list_widget.count()):
-            item = self.available_list_widget.item(i)
-            widget = self.available_list_widget.itemWidget(item)
-            if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                return widget
-        if not self.embed_mode:
-            for i in range(self.selected_list_widget.count()):
-                item = self.selected_list_widget.item(i)
-                widget = self.selected_list_widget.itemWidget(item)
-                if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                    return widget
-        return None
+        try:
+            CONFIG_STORE.update_app_item(key, auto_install=state)
+        except sqlite3.Error as e:
+            print(f"Không thể lưu cấu hình: {e}")
+        if not self.app_state.update_local({key: {'auto_install': state}}) and self.embed_mode:
+            self.reconcile_lists({key}) # Trạng thái không đổi nhưng nút có thể đang hiện giá trị cũ (sau update_all)
+
+    def on_icon_ready(self, icon_url, icon_path):
+        """Đưa icon vừa tải xong vào các hàng đang chờ nó."""
+        for key in self._icon_waiters.pop(icon_url, ()):
+            for model in self.app_models():
+                model.update_row(key, icon_path=icon_path)
+
+    def on_icon_failed(self, icon_url):
+        """Tải icon lỗi: các hàng giữ icon mặc định, lần dựng hàng sau sẽ yêu cầu lại."""
+        self._icon_waiters.pop(icon_url, None)
     
     def update_widget_status(self, app_key, status):
-        """Xử lý signal cập nhật trạng thái widget."""
-        widget = self.find_widget_by_key(app_key)
-        if widget and widget.parent():  # Kiểm tra widget còn tồn tại và có parent
-            widget.set_status(status)
+        """Xử lý signal cập nhật trạng thái hàng (tìm ở danh sách bên trái trước)."""
+        if status not in AppListModel.BUSY_STATUSES:
+            # Tiến độ còn chờ trong bus đã cũ, không để nó vẽ đè lên trạng thái xong/lỗi
+            ProgressBus.instance().discard(app_key)
+        for model in self.app_models():
+            if model.update_row(app_key, status=status):
+                return
     
-    def confirm_download(self, key, info, widget):
+    def confirm_download(self, key, info):
         reply = self.show_styled_message_box(
             QMessageBox.Icon.Question,
             "Tải phần mềm",
@@ -1556,27 +4339,69 @@ class TekDT_AIS(QMainWindow):
             buttons=QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         if reply == QMessageBox.StandardButton.Yes:
-            # Không gán cho self.install_worker nữa, mà tạo worker cục bộ
-            worker_tasks = {key: {'info': info, 'action': 'download'}}
-            worker = InstallWorker(worker_tasks)
-            
-            # Kết nối các tín hiệu như cũ
-            worker.signals.progress.connect(self.update_install_progress)
-            worker.signals.progress_percentage.connect(self.update_download_progress_anywhere)
-            worker.signals.error.connect(lambda e: self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi Worker", str(e)))
-            worker.signals.update_widget_status.connect(self.update_widget_status)
-            worker.signals.tasks_batch_completed.connect(self.on_tasks_batch_completed)
-
-            # THAY ĐỔI QUAN TRỌNG:
-            # Kết nối tín hiệu finished tới hàm xử lý mới (on_worker_finished).
-            # Dùng lambda để truyền app_key, đảm bảo hàm xử lý biết worker nào đã xong.
-            worker.signals.finished.connect(lambda app_key=key: self.on_worker_finished(app_key))
-            
-            # Lưu worker vào dictionary quản lý và bắt đầu chạy
-            self.active_workers[key] = worker
-            worker.start()
+            # Tải cần aria2: nếu công cụ còn đang được kiểm tra thì chờ xong mới chạy
+            self.run_when_tools_ready(lambda: self.start_app_worker(key, info, 'download'))
+
+    def start_app_worker(self, key, info, action, on_complete=None):
+        """Chạy một worker độc lập cho một app (tải về/cập nhật), không khóa giao diện như khi cài cả danh sách."""
+        # Không gán cho self.install_worker, mà tạo worker cục bộ
+        worker = InstallWorker({key: {'info': info, 'action': action}})
+
+        worker.signals.progress.connect(self.update_install_progress)
+        worker.signals.error.connect(lambda e: self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi Worker", str(e)))
+        worker.signals.update_widget_status.connect(self.update_widget_status)
+        worker.signals.tasks_batch_completed.connect(self.on_tasks_batch_completed)
+        worker.signals.stage_depths.connect(self.update_pipeline_status)
+        worker.signals.finished.connect(self.clear_pipeline_status)
+
+        # Khi worker xong, on_worker_finished làm mới giao diện trước, sau đó mới thực hiện
+        # on_complete (như chuyển sang khung bên phải), để giao diện được cập nhật đúng trước.
+        def on_finished():
+            self.on_worker_finished(key)
+            if on_complete:
+                on_complete()
+        worker.signals.finished.connect(on_finished)
+
+        # Lưu worker vào dictionary quản lý và bắt đầu chạy
+        self.active_workers[key] = worker
+        worker.start()
+
+    def resume_journaled_downloads(self):
+        """
+        Tải tiếp các tác vụ còn trong nhật ký hàng đợi của lần chạy trước (đóng cửa sổ giữa chừng
+        hoặc bị tắt đột ngột). aria2 tải tiếp phần còn thiếu nhờ file .aria2 và session của daemon;
+        việc cài đặt vẫn chờ người dùng bấm bắt đầu.
+        """
+        try:
+            pending = CONFIG_STORE.pending_tasks()
+        except sqlite3.Error as e:
+            print(f"Không đọc được nhật ký hàng đợi tải: {e}")
+            return
+        finished = []
+        for key, task in pending.items():
+            if key in self.active_workers:
+                continue
+            info = self.compatible_app_info(key)
+            if info is None or not info.get('download_url'):
+                finished.append(key)
+                continue
+            journaled_path = get_download_path(key, task['info'])
+            if journaled_path != get_download_path(key, info) or task['info'].get('download_url') != info['download_url']:
+                # Danh sách phần mềm đã đổi file tải về: phần đã tải dở là của bản cũ
+                for stale in (journaled_path, journaled_path.with_name(journaled_path.name + '.aria2')):
+                    stale.unlink(missing_ok=True)
+            if self.is_app_downloaded(key, info):
+                finished.append(key)
+                continue
+            print(f"Tải tiếp {key} từ lần chạy trước.")
+            self.start_app_worker(key, info, 'download')
+        if finished:
+            try:
+                CONFIG_STORE.dequeue_tasks(finished)
+            except sqlite3.Error as e:
+                print(f"Không thể cập nhật nhật ký hàng đợi tải: {e}")
 
-    def confirm_update(self, key, info, widget, local_ver, remote_ver, on_complete):
+    def confirm_update(self, key, info, local_ver, remote_ver, on_complete):
         reply = self.show_styled_message_box(
             QMessageBox.Icon.Question,
             "Cập nhật phần mềm",
@@ -1591,56 +4416,15 @@ class TekDT_AIS(QMainWindow):
             return
 
         if reply == QMessageBox.StandardButton.Yes:
-            # Tương tự confirm_download, tạo worker cục bộ
-            worker_tasks = {key: {'info': info, 'action': 'update'}}
-            worker = InstallWorker(worker_tasks)
-            
-            # Kết nối các tín hiệu
-            worker.signals.progress.connect(self.update_install_progress)
-            worker.signals.progress_percentage.connect(self.update_download_progress_anywhere)
-            worker.signals.error.connect(lambda e: self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi Worker", str(e)))
-            worker.signals.update_widget_status.connect(self.update_widget_status)
-            worker.signals.tasks_batch_completed.connect(self.on_tasks_batch_completed)
-            
-            # THAY ĐỔI QUAN TRỌNG:
-            # Khi worker xong, nó sẽ tự gọi on_worker_finished để làm mới giao diện.
-            # Sau đó, chúng ta mới thực hiện hành động 'on_complete' (như chuyển sang khung bên phải).
-            # Việc này đảm bảo giao diện được cập nhật đúng trước khi có hành động tiếp theo.
-            def on_update_and_action():
-                self.on_worker_finished(key)
-                if on_complete:
-                    on_complete()
-            
-            worker.signals.finished.connect(on_update_and_action)
-            
-            # Lưu worker và bắt đầu
-            self.active_workers[key] = worker
-            worker.start()
+            self.run_when_tools_ready(lambda: self.start_app_worker(key, info, 'update', on_complete))
 
     def move_app_to_selection(self, key, info):
         # Kiểm tra xem item đã tồn tại trong danh sách chọn chưa
-        for i in range(self.selected_list_widget.count()):
-            item = self.selected_list_widget.item(i)
-            if item and self.selected_list_widget.itemWidget(item).app_key == key:
-                return # Đã tồn tại, không thêm lại
+        if self.selected_model.find_row(key) >= 0:
+            return # Đã tồn tại, không thêm lại
 
         self.update_available_item_state(key, is_selected=True)
-
-        item_widget = AppItemWidget(key, info)
-        item_widget.action_button.setText("Bỏ")
-        item_widget.action_button.setToolTip(f"Bỏ {info['display_name']} khỏi danh sách")
-        item_widget.action_button.setStyleSheet(
-            "background-color: #e74c3c; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold;"
-        )
-        item_widget.action_button.clicked.disconnect()
-        item_widget.action_button.clicked.connect(lambda: item_widget.remove_requested.emit(key, info))
-        item_widget.remove_requested.connect(self.remove_app_from_selection)
-        
-        list_item = QListWidgetItem()
-        list_item.setSizeHint(QSize(0, 70))
-        list_item.setData(Qt.ItemDataRole.UserRole, key)
-        self.selected_list_widget.addItem(list_item)
-        self.selected_list_widget.setItemWidget(list_item, item_widget)
+        self.selected_model.append_row(self.build_selected_row(key, info))
         
         if key not in self.selected_for_install:
             self.selected_for_install.append(key)
@@ -1648,59 +4432,25 @@ class TekDT_AIS(QMainWindow):
         self.update_counts()
 
     def remove_app_from_selection(self, key, info):
-        for i in range(self.selected_list_widget.count()):
-            item = self.selected_list_widget.item(i)
-            if item and self.selected_list_widget.itemWidget(item).app_key == key:
-                self.selected_list_widget.takeItem(i)
-                break
+        self.selected_model.remove_key(key)
 
-        self.update_available_item_state(key, is_selected=False)
-        
         if key in self.selected_for_install:
             self.selected_for_install.remove(key)
+        self.update_available_item_state(key, is_selected=False)
+        
         self.save_config()
         self.update_counts()
         
     def update_available_item_state(self, key, is_selected):
-        for i in range(self.available_list_widget.count()):
-            item = self.available_list_widget.item(i)
-            widget = self.available_list_widget.itemWidget(item)
-            if hasattr(widget, 'app_key') and widget.app_key == key:
-                widget.action_button.setDisabled(is_selected)
-                if is_selected:
-                    widget.action_button.setStyleSheet(
-                        "background-color: #95a5a6; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold;"
-                    )
-                    widget.action_button.setText("Đã chọn")
-                else:
-                    # Khi một item được bỏ chọn, tái tạo lại nút của nó ở danh sách bên trái
-                    widget.action_button.setEnabled(True)
-                    
-                    is_downloaded = self.is_app_downloaded(key, widget.app_info)
-                    local_ver_str = self.local_apps.get(key, {}).get('version', '0')
-                    remote_ver_str = self.remote_apps.get('app_items', {}).get(key, {}).get('version', '0')
-                    is_update_available = is_downloaded and parse_version(remote_ver_str) > parse_version(local_ver_str)
-                    
-                    # Ngắt kết nối cũ để tránh gọi nhiều lần
-                    try: widget.action_button.clicked.disconnect()
-                    except TypeError: pass
-
-                    if not is_downloaded:
-                        widget.action_button.setText("Tải")
-                        widget.action_button.setToolTip(f"Tải về {widget.app_info['display_name']}")
-                        widget.action_button.setStyleSheet("background-color: #f39c12; color: white;")
-                        widget.action_button.clicked.connect(lambda _, k=key, i=widget.app_info, w=widget: self.confirm_download(k, i, w))
-                    else: # Đã tải về
-                        widget.action_button.setText("Thêm")
-                        widget.action_button.setToolTip(f"Thêm {widget.app_info['display_name']} vào danh sách")
-                        widget.action_button.setStyleSheet("background-color: #4CAF50; color: white;")
-                        
-                        on_complete_action = lambda: self.move_app_to_selection(key, widget.app_info)
-                        if is_update_available:
-                            widget.action_button.clicked.connect(lambda _, k=key, i=widget.app_info, w=widget, lv=local_ver_str, rv=remote_ver_str, cb=on_complete_action: self.confirm_update(k, i, w, lv, rv, on_complete=cb))
-                        else:
-                            widget.action_button.clicked.connect(on_complete_action)
-                break
+        row = self.available_model.row_for_key(key)
+        if row is None:
+            return
+        if is_selected:
+            row.button = 'selected'
+        else:
+            # Khi một item được bỏ chọn, tính lại nút của nó ở danh sách bên trái
+            self.apply_available_state(row)
+        self.available_model.update_row(key)
     
     def on_worker_finished(self, app_key):
         """
@@ -1711,41 +4461,17 @@ class TekDT_AIS(QMainWindow):
         if app_key in self.active_workers:
             del self.active_workers[app_key]
 
-        # Rất quan trọng: Tải lại config từ file vào bộ nhớ
-        # để chắc chắn rằng dữ liệu là mới nhất trước khi làm mới giao diện.
-        self.load_config_and_apps(populate=False)
-
-        # Làm mới toàn bộ danh sách để cập nhật giao diện
-        # (chuyển nút "Tải" -> "Thêm", cập nhật phiên bản, v.v.)
-        if not hasattr(self, '_populate_timer') or not self._populate_timer.isActive():
-            self._populate_timer = QTimer(self)
-            self._populate_timer.setSingleShot(True)
-            self._populate_timer.timeout.connect(self.populate_lists)
-            self._populate_timer.start(50) # Chờ 50ms để gom các lệnh gọi
+        # AppState đã được cập nhật qua tasks_batch_completed trước tín hiệu finished; vẫn cập nhật
+        # hàng của app này vì khi tải lỗi không có thay đổi nào được báo (nút "Tải" cần mở lại)
+        self.reconcile_lists({app_key})
     
+    def schedule_filter(self, _text):
+        self._filter_timer.start() # Gõ tiếp thì đặt lại hẹn giờ
+
     def filter_apps(self, text):
-        text = text.lower().strip()
+        self._filter_timer.stop()
         min_chars = 1 if self.embed_mode else 2
-        
-        visible_categories = set()
-        for i in range(self.available_list_widget.count()):
-            item = self.available_list_widget.item(i)
-            widget = self.available_list_widget.itemWidget(item)
-            if hasattr(widget, 'app_key'):
-                app_info = widget.app_info
-                display_name = app_info.get('display_name', '').lower()
-                is_match = text in display_name or len(text) < min_chars
-                item.setHidden(not is_match)
-                if is_match:
-                    visible_categories.add(app_info.get('category', 'Chưa phân loại'))
-            
-        # Ẩn/hiện category header
-        for i in range(self.available_list_widget.count()):
-            item = self.available_list_widget.item(i)
-            widget = self.available_list_widget.itemWidget(item)
-            if not hasattr(widget, 'app_key'): # Đây là category header
-                category_name = item.text().title() # Chuyển về dạng 'Chưa Phân Loại'
-                item.setHidden(category_name not in visible_categories and len(text) >= min_chars)
+        self.available_filter.apply(text, min_chars)
 
     def start_installation(self):
         if self.install_worker and self.install_worker.isRunning():
@@ -1765,9 +4491,9 @@ class TekDT_AIS(QMainWindow):
 
         apps_to_process = {}
         for key in self.selected_for_install:
-            if key in self.remote_apps.get('app_items', {}):
-                remote_info = self.remote_apps['app_items'][key]
-                # local_info = self.local_apps.get(key, {})
+            remote_info = self.app_state.remote_info(key)
+            if remote_info is not None:
+                # local_info = self.app_state.local_info(key)
                 # # Mặc định là 'install', nhưng nếu có phiên bản mới thì là 'update'
                 # action = 'install'
                 # if self.is_app_downloaded(key, remote_info) and parse_version(remote_info.get('version', '0')) > parse_version(local_info.get('version', '0')):
@@ -1779,52 +4505,71 @@ class TekDT_AIS(QMainWindow):
             self.show_styled_message_box(QMessageBox.Icon.Information, "Thông báo", "Vui lòng thêm ít nhất một phần mềm để cài đặt.")
             return
 
+        # Chỉ phải chờ kiểm tra công cụ khi có phần mềm cần tải (cần aria2)
+        needs_download = any(not self.is_app_downloaded(key, task['info']) for key, task in apps_to_process.items())
+        if needs_download and not self.tools_ready:
+            if self.tool_manager_thread.isRunning():
+                self.start_button.setDisabled(True)
+            self.run_when_tools_ready(lambda: self.launch_installation(apps_to_process))
+            return
+        self.launch_installation(apps_to_process)
+
+    def launch_installation(self, apps_to_process):
         # Vô hiệu hóa giao diện, ngoại trừ nút "Dừng"
         self.set_ui_interactive(False)
         self.start_button.setText("DỪNG")
         self.start_button.setEnabled(True)
         self.start_button.setStyleSheet("background-color: #e74c3c; color: white; border: none; padding: 8px 16px; border-radius: 4px; font-weight: bold;")
 
-        self.install_worker = InstallWorker(apps_to_process)
+        self.install_worker = InstallWorker(apps_to_process, self.app_state.settings.get('max_parallel_installs', DEFAULT_MAX_PARALLEL_INSTALLS))
         self.install_worker.signals.progress.connect(self.update_install_progress)
-        self.install_worker.signals.progress_percentage.connect(self.update_download_progress_anywhere)
         self.install_worker.signals.finished.connect(self.on_installation_finished)
         self.install_worker.signals.error.connect(lambda e: self.show_styled_message_box(QMessageBox.Icon.Critical, "Lỗi Worker", str(e)))
         self.install_worker.signals.update_widget_status.connect(self.update_widget_status)
         self.install_worker.signals.tasks_batch_completed.connect(self.on_tasks_batch_completed)
+        self.install_worker.signals.stage_depths.connect(self.update_pipeline_status)
+        self.install_worker.signals.finished.connect(self.clear_pipeline_status)
         self.install_worker.start()
         
+    def update_pipeline_status(self, depths):
+        """Hiển thị số tác vụ ở từng giai đoạn (tải/chờ cài/đang cài/xong), cộng dồn mọi worker đang chạy."""
+        self._pipeline_depths[self.sender()] = depths
+        self._show_pipeline_depths()
+
+    def clear_pipeline_status(self):
+        self._pipeline_depths.pop(self.sender(), None)
+        self._show_pipeline_depths()
+
+    def _show_pipeline_depths(self):
+        if not (hasattr(self, 'pipeline_label') and self.pipeline_label):
+            return
+        totals = {stage: sum(depths.get(stage, 0) for depths in self._pipeline_depths.values())
+                  for stage in ('downloading', 'ready', 'installing', 'done')}
+        self.pipeline_label.setText(
+            f"Đang tải: {totals['downloading']} | Chờ cài: {totals['ready']} | "
+            f"Đang cài: {totals['installing']} | Xong: {totals['done']}"
+        )
+        self.pipeline_label.setVisible(bool(self._pipeline_depths))
+
     def update_download_progress_selected(self, app_key, percentage):
-        for i in range(self.selected_list_widget.count()):
-            item = self.selected_list_widget.item(i)
-            widget = self.selected_list_widget.itemWidget(item)
-            if hasattr(widget, 'app_key') and widget.app_key == app_key and widget.parent():
-                widget.update_download_progress(app_key, percentage)
-                break
+        self.selected_model.update_row(app_key, progress=float(percentage))
 
     def update_install_progress(self, app_key, status, message):
-        target_widget = None
-        if not self.embed_mode and self.selected_list_widget.count() > 0:
-            for i in range(self.selected_list_widget.count()):
-                widget = self.selected_list_widget.itemWidget(self.selected_list_widget.item(i))
-                if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                    target_widget = widget
-                    break
-        
-        if not target_widget:
-            for i in range(self.available_list_widget.count()):
-                widget = self.available_list_widget.itemWidget(self.available_list_widget.item(i))
-                if hasattr(widget, 'app_key') and widget.app_key == app_key:
-                    target_widget = widget
-                    break
-
-        if target_widget and target_widget.parent():
-            display_name = target_widget.app_info.get('display_name', app_key)
+        # Ưu tiên hàng ở danh sách đã chọn, nếu không có thì tìm ở danh sách bên trái
+        models = self.app_models()[::-1]
+        for model in models:
+            row = model.row_for_key(app_key)
+            if row is None:
+                continue
+            display_name = row.info.get('display_name', app_key)
             status_text = f"{display_name}: {message}"
             if hasattr(self, 'status_label') and self.status_label:
                 self.status_label.setText(status_text)
             
-            target_widget.set_status(status)
+            if status not in AppListModel.BUSY_STATUSES:
+                ProgressBus.instance().discard(app_key)
+            model.update_row(app_key, status=status)
+            return
     
     def on_installation_finished(self):
         if self.install_worker and not self.install_worker._is_stopped:
@@ -1839,16 +4584,11 @@ class TekDT_AIS(QMainWindow):
 
         self.install_worker = None
 
-        # Force populate và reset trong embed_mode
+        # Đồng bộ lại danh sách và đặt trạng thái hoàn tất trong embed_mode
         if self.embed_mode:
-            self.populate_lists()
-            for i in range(self.available_list_widget.count()):
-                widget = self.available_list_widget.itemWidget(self.available_list_widget.item(i))
-                if hasattr(widget, 'set_status'):
-                    widget.set_status("success")
-                    widget.action_button.setText("Thêm")
-                    widget.action_button.setStyleSheet("background-color: #4CAF50; color: white;")
-                    # Reconnect nếu cần
+            self._deferred_state_keys.clear()
+            self.reconcile_lists()
+            self.available_model.update_all(status="success", button='auto_off')
 
     def reset_ui_after_completion(self):
         if not self.embed_mode:
@@ -1856,38 +4596,51 @@ class TekDT_AIS(QMainWindow):
             self.start_button.setText("BẮT ĐẦU CÀI ĐẶT")
             self.start_button.setStyleSheet("background-color: #3498db; color: white;") # Blue button
             self.status_label.setText("Trạng thái: Sẵn sàng.")
+        # Các app vừa xử lý có thể đã đổi phiên bản/trạng thái tải; chỉ cập nhật các hàng đó
+        processed_keys = set(self.selected_for_install) | self._deferred_state_keys
+        self._deferred_state_keys = set()
         self.selected_for_install.clear()
         self.save_config()
-        self.load_config_and_apps()
+        self.reconcile_lists(processed_keys)
 
     def update_counts(self):
         if self.embed_mode: return
-        compatible_count = sum(1 for i in range(self.available_list_widget.count()) if hasattr(self.available_list_widget.itemWidget(self.available_list_widget.item(i)), 'app_key'))
-        selected_count = self.selected_list_widget.count()
+        compatible_count = self.available_model.app_count()
+        selected_count = self.selected_model.rowCount()
         
         self.available_count_label.setText(f"Tổng số phần mềm: {compatible_count}")
         self.selected_count_label.setText(f"Đã chọn: {selected_count}")
 
     def save_config(self):
-        if not self.embed_mode:
-            self.config['settings']['selected_for_install'] = self.selected_for_install
+        """Lưu danh sách đang chọn; các thiết lập khác được ghi ngay tại chỗ thay đổi."""
+        if self.embed_mode:
+            return
+        self.app_state.settings['selected_for_install'] = self.selected_for_install
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except IOError as e:
+            CONFIG_STORE.set_setting('selected_for_install', self.selected_for_install)
+        except sqlite3.Error as e:
             print(f"Không thể lưu cấu hình: {e}")
             
     def closeEvent(self, event):
-        # Dừng các worker đang hoạt động
+        # Dừng các worker đang hoạt động; tác vụ chưa xong được giữ trong nhật ký để lần sau tải tiếp
         # Dùng list() để tạo bản sao, tránh thay đổi dict khi đang duyệt
-        for worker in list(self.active_workers.values()):
-            if worker and worker.isRunning():
-                worker.stop()
-                worker.wait(2000) # Cho worker 2 giây để dừng
+        workers = [worker for worker in list(self.active_workers.values()) + [self.install_worker]
+                   if worker and worker.isRunning()]
+        for worker in workers:
+            worker.stop(suspend=True)
+        # Báo dừng tất cả trước rồi mới chờ, chung một hạn 2 giây thay vì 2 giây cho mỗi worker
+        deadline = time.monotonic() + 2
+        for worker in workers:
+            worker.wait(max(0, int((deadline - time.monotonic()) * 1000)))
 
         if self.tool_manager_thread.isRunning():
             self.tool_manager_thread.quit()
             self.tool_manager_thread.wait(5000)
+
+        # Tắt daemon aria2 RPC dùng chung (nếu đã được khởi động)
+        AriaDownloadManager.shutdown_instance()
+        LanPeerCache.shutdown_instance()
+        IconService.instance().shutdown()
         
         self.save_config()
         super().closeEvent(event)
@@ -1899,6 +4652,195 @@ class TekDT_AIS(QMainWindow):
                 os._exit(0)
             time.sleep(1)
 
+class BundleError(Exception):
+    """Không tạo hoặc nhập được gói phần mềm (thiếu 7za, 7za báo lỗi, manifest không hợp lệ)."""
+
+def _bundle_workers():
+    return min(32, (os.cpu_count() or 1) + 4)
+
+def _bundle_staging_dir():
+    # Nằm trong Apps/ để file giải nén ra được hard link vào kho (cùng ổ đĩa) thay vì sao chép
+    return APPS_DIR / f"{BUNDLE_STAGING_PREFIX}{secrets.token_hex(4)}"
+
+def _is_inside(path, root):
+    return Path(path).resolve().is_relative_to(Path(root).resolve())
+
+def _run_7za(arguments, cwd):
+    if not SEVENZ_EXEC.exists():
+        raise BundleError(f"Không tìm thấy {SEVENZ_EXEC}.")
+    result = subprocess.run([str(SEVENZ_EXEC), *arguments, '-bso0', '-bsp0'], cwd=cwd,
+                            capture_output=True, creationflags=CREATE_NO_WINDOW)
+    if result.returncode != 0:
+        raise BundleError(f"7za lỗi (mã lỗi: {result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+
+def export_bundle(bundle_path, app_keys=None):
+    """
+    Đóng gói các phần mềm đã tải (mặc định: mọi phần mềm trong cấu hình đã tải xong) vào một file .7z
+    (bằng 7za) hoặc .zip (bằng zipfile), kèm manifest (key, phiên bản, kích thước, SHA-256, thông tin
+    trong cấu hình) và icon. File cài đặt vốn đã được nén nên chỉ được lưu nguyên (-mx=0 / ZIP_STORED),
+    đóng gói nhanh như sao chép.
+    Trả về ({app_key: mục trong manifest}, {app_key: lý do bị bỏ qua}).
+    """
+    bundle_path = Path(bundle_path).resolve()
+    app_items = CONFIG_STORE.load()['app_items']
+    selected, skipped = {}, {}
+    for key in (app_keys if app_keys is not None else app_items):
+        info = app_items.get(key)
+        if info is None:
+            skipped[key] = "không có trong cấu hình"
+        elif not is_download_complete(key, info):
+            skipped[key] = "chưa được tải về"
+        else:
+            selected[key] = info
+    if not selected:
+        raise BundleError("Không có phần mềm nào đã tải về để đóng gói.")
+
+    def describe(key):
+        # is_download_complete đã kiểm tra sha256 khai báo, chỉ băm file không có sha256
+        info = selected[key]
+        path = get_download_path(key, info)
+        entry = {'version': info.get('version', '0'), 'file': path.relative_to(APP_DATA_DIR).as_posix(),
+                 'size': path.stat().st_size, 'sha256': (info.get('sha256') or ARTIFACT_STORE.file_digest(path)).lower(),
+                 'info': info}
+        icon = IconService.cache_path(info['icon_url']) if info.get('icon_url') else None
+        if icon and icon.exists():
+            entry['icon'] = icon.relative_to(APP_DATA_DIR).as_posix()
+        return entry
+
+    with ThreadPoolExecutor(max_workers=_bundle_workers()) as executor:
+        entries = dict(zip(selected, executor.map(describe, selected)))
+    manifest = {'format': BUNDLE_FORMAT, 'created_by': f"{APP_NAME} {APP_VERSION}",
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'apps': entries}
+
+    members = sorted({entry[field] for entry in entries.values() for field in ('file', 'icon') if field in entry})
+    manifest_text = json.dumps(manifest, ensure_ascii=False, indent=2)
+    staging = _bundle_staging_dir()
+    # Ghi ra file tạm rồi mới đổi tên: không bao giờ để lại một gói dở dang dưới tên thật
+    partial = bundle_path.with_name(bundle_path.name + '.partial')
+    try:
+        bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        partial.unlink(missing_ok=True)
+        # Manifest đứng đầu gói, đường dẫn file cài đặt giữ nguyên dạng Apps/<key>/<file>
+        if bundle_path.suffix.lower() == '.zip':
+            with zipfile.ZipFile(partial, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+                zf.writestr(BUNDLE_MANIFEST_FILE, manifest_text)
+                for member in members:
+                    zf.write(APP_DATA_DIR / member, member)
+        else:
+            staging.mkdir(parents=True)
+            (staging / BUNDLE_MANIFEST_FILE).write_text(manifest_text, encoding='utf-8')
+            file_list = staging / 'files.txt'
+            file_list.write_text('\n'.join(members), encoding='utf-8')
+            _run_7za(['a', '-t7z', '-mx=0', str(partial), BUNDLE_MANIFEST_FILE], staging)
+            _run_7za(['a', '-t7z', '-mx=0', '-scsUTF-8', str(partial), f'@{file_list}'], APP_DATA_DIR)
+        os.replace(partial, bundle_path)
+    except (OSError, zipfile.BadZipFile) as e:
+        raise BundleError(f"Không thể tạo {bundle_path}: {e}") from e
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        partial.unlink(missing_ok=True)
+    return entries, skipped
+
+def import_bundle(bundle_path):
+    """
+    Nhập gói do export_bundle tạo (.zip đọc bằng zipfile, .7z bằng 7za): giải nén vào thư mục tạm
+    trong Apps/, kiểm tra kích thước/SHA-256 của các file song song, đưa file hợp lệ vào kho nội dung
+    và link vào Apps/<key>/, rồi ghi thông tin của mọi phần mềm hợp lệ vào cấu hình trong một giao dịch.
+    Trả về ({app_key: thông tin đã ghi}, {app_key: lý do bị bỏ qua}).
+    """
+    bundle_path = Path(bundle_path).resolve()
+    if not bundle_path.is_file():
+        raise BundleError(f"Không tìm thấy {bundle_path}.")
+    staging = _bundle_staging_dir()
+    try:
+        if zipfile.is_zipfile(bundle_path):
+            # zipfile.extractall bỏ các thành phần ".." và đường dẫn tuyệt đối trong tên file
+            try:
+                with zipfile.ZipFile(bundle_path) as zf:
+                    zf.extractall(staging)
+            except (OSError, zipfile.BadZipFile) as e:
+                raise BundleError(f"Không thể giải nén {bundle_path}: {e}") from e
+        else:
+            _run_7za(['x', str(bundle_path), f'-o{staging}', '-y', '-mmt=on'], APPS_DIR)
+        try:
+            manifest = json.loads((staging / BUNDLE_MANIFEST_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise BundleError(f"Gói không có manifest hợp lệ: {e}") from e
+        if not isinstance(manifest, dict) or manifest.get('format') != BUNDLE_FORMAT or not isinstance(manifest.get('apps'), dict):
+            raise BundleError("Định dạng manifest không được hỗ trợ.")
+
+        def verify(item):
+            key, entry = item
+            try:
+                info = dict(entry['info'], version=entry['version'])
+                sha256, size = entry['sha256'], int(entry['size'])
+                if not isinstance(sha256, str) or not sha256:
+                    raise ValueError("thiếu sha256")
+                staged = staging / entry['file']
+                dest = get_download_path(key, info)
+                # Manifest không được trỏ ra ngoài thư mục tạm hay Apps/<key>/ (kể cả .store, .icons)
+                if (key.startswith('.') or not _is_inside(staged, staging)
+                        or (APPS_DIR / key).resolve().parent != APPS_DIR.resolve() or not _is_inside(dest, APPS_DIR / key)):
+                    raise ValueError("đường dẫn không hợp lệ")
+                ARTIFACT_STORE.ingest(staged, sha256, size)
+                ARTIFACT_STORE.link_into(sha256, dest)
+                icon = entry.get('icon')
+                if icon and _is_inside(APP_DATA_DIR / icon, ICON_CACHE_DIR) and _is_inside(staging / icon, staging) \
+                        and (staging / icon).is_file():
+                    ICON_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    os.replace(staging / icon, APP_DATA_DIR / icon)
+                return key, info, None
+            except (KeyError, TypeError, ValueError) as e:
+                return key, None, f"manifest không hợp lệ ({e})"
+            except ArtifactVerificationError as e:
+                return key, None, f"file bị hỏng: {e}"
+            except OSError as e:
+                return key, None, f"lỗi đọc/ghi file: {e}"
+
+        with ThreadPoolExecutor(max_workers=_bundle_workers()) as executor:
+            results = list(executor.map(verify, manifest['apps'].items()))
+        imported = {key: info for key, info, error in results if error is None}
+        skipped = {key: error for key, _info, error in results if error is not None}
+        if imported:
+            try:
+                CONFIG_STORE.update_app_items(imported, dequeue=imported.keys())
+            except sqlite3.Error as e:
+                raise BundleError(f"Không thể ghi cấu hình: {e}") from e
+        return imported, skipped
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def handle_bundle_cli(args):
+    """
+    Xử lý /export_bundle "<file.7z|file.zip>" ["app1|app2"] và /import_bundle "<file>".
+    Trả về None nếu không phải lệnh đóng gói, nếu không thì trả về mã thoát của chương trình.
+    """
+    command = next((arg for arg in args if arg.lower() in ('/export_bundle', '/import_bundle')), None)
+    if command is None:
+        return None
+    operands = args[args.index(command) + 1:]
+    if not operands:
+        print(f"Lỗi: Thiếu đường dẫn file gói cho {command}.")
+        return 1
+
+    start = time.monotonic()
+    try:
+        if command.lower() == '/export_bundle':
+            app_keys = operands[1].split('|') if len(operands) > 1 and not operands[1].startswith('/') else None
+            done, skipped = export_bundle(operands[0], app_keys)
+            total_mb = sum(entry['size'] for entry in done.values()) / 1024 / 1024
+            print(f"Đã đóng gói {len(done)} phần mềm ({total_mb:.1f} MB) vào {operands[0]} "
+                  f"trong {time.monotonic() - start:.1f} giây.")
+        else:
+            done, skipped = import_bundle(operands[0])
+            print(f"Đã nhập {len(done)} phần mềm từ {operands[0]} trong {time.monotonic() - start:.1f} giây.")
+    except BundleError as e:
+        print(f"Lỗi: {e}")
+        return 1
+    for key, reason in skipped.items():
+        print(f"Bỏ qua '{key}': {reason.rstrip('.')}.")
+    return 1 if skipped else 0
+
 def handle_auto_install_cli(args):
     """Xử lý riêng cho tham số dòng lệnh /auto_install."""
     arg_string = " ".join(args)
@@ -1913,21 +4855,8 @@ def handle_auto_install_cli(args):
     new_value = value_str == 'true'
 
     try:
-        # Tải cấu hình hiện tại
-        config = {}
-        if CONFIG_FILE.exists():
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if content:
-                    config = json.loads(content)
-
-        # Cập nhật giá trị
-        config.setdefault('app_items', {}).setdefault(app_key, {})['auto_install'] = new_value
-
-        # Lưu lại cấu hình
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-
+        # Chỉ ghi đúng trường auto_install của phần mềm này, an toàn khi GUI đang chạy song song
+        CONFIG_STORE.update_app_item(app_key, auto_install=new_value)
         print(f"Thành công: Đã đặt 'auto_install' = {new_value} cho phần mềm '{app_key}'.")
 
     except Exception as e:
@@ -1945,6 +4874,11 @@ if __name__ == '__main__':
     # Xử lý lệnh /auto_install trước tiên <<
     if handle_auto_install_cli(cli_args):
         sys.exit(0)
+
+    # /export_bundle và /import_bundle không cần giao diện
+    bundle_exit_code = handle_bundle_cli(cli_args)
+    if bundle_exit_code is not None:
+        sys.exit(bundle_exit_code)
     
     # Tách flags (--embed) ra khỏi các tham số dòng lệnh (/)
     flags = [arg for arg in cli_args if arg.startswith('--')]
@@ -1969,6 +4903,7 @@ if __name__ == '__main__':
     if Path(icon_path_main).exists():
         app.setWindowIcon(QIcon(icon_path_main))
     main_win = TekDT_AIS(embed_mode=embed_mode, embed_size=embed_size)
+    main_win.lan_cache_requested = '--lan-cache' in flags
 
     # Xử lý /help riêng biệt vì nó không cần giao diện
     if '/help' in cli_command_args:
@@ -1979,11 +4914,18 @@ if __name__ == '__main__':
   /update                   Kiểm tra và cập nhật tất cả phần mềm đã được tải về.
   /update "app1|app2"       Cập nhật các phần mềm được chỉ định.
   /auto_install:true|false "app1|app2"       Cập nhật giá trị để đánh dấu phần mềm sẽ được cài đặt tự động khi dùng tham số /install. True là bật, false là tắt.
+  /export_bundle "goi.7z"   Đóng gói mọi phần mềm đã tải về (cùng cấu hình) vào một file .7z hoặc .zip.
+  /export_bundle "goi.7z" "app1|app2"   Chỉ đóng gói các phần mềm được chỉ định.
+  /import_bundle "goi.7z"   Kiểm tra và nhập các phần mềm trong gói, dùng ngay được khi không có mạng.
   
 Kết hợp tham số:
   /install /update          Cập nhật và cài đặt các phần mềm auto_install=true.
   /install /update "app1"   Cập nhật (nếu có) và cài đặt các phần mềm chỉ định.
 
+Tùy chọn:
+  --lan-cache               Chia sẻ file đã tải cho các máy TekDT AIS khác trong mạng LAN và lấy file từ
+                            các máy đó trước khi tải từ internet (hoặc đặt "lan_cache": true trong settings).
+
 Lưu ý:
 - Tên phần mềm (app key) là định danh duy nhất, không phải tên hiển thị.
 - Sử dụng "|" để ngăn cách nhiều tên ứng dụng trong dấu ngoặc kép.
@@ -2014,6 +4956,10 @@ Lưu ý:
         # Chế độ GUI bình thường
         pass
     if not is_cli_command:
+        # Hiển thị ngay danh sách đã lưu, kiểm tra công cụ và làm mới danh sách ở nền
+        if main_win.start_from_cache():
+            # Tác vụ tải dở của lần chạy trước cần aria2: chờ kiểm tra công cụ xong rồi tải tiếp
+            main_win.run_when_tools_ready(main_win.resume_journaled_downloads)
         main_win.show()
     
     sys.exit(app.exec())
\ No newline at end of file